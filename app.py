@@ -2,16 +2,30 @@ import os
 import sys
 import json
 import io
+import shutil
+import tempfile
+import time
 from datetime import datetime
 from typing import final
-from flask import Flask, render_template, request, jsonify, send_file, send_from_directory
-from flask_socketio import SocketIO, emit
+from flask import Flask, Response, abort, render_template, request, jsonify, send_file, send_from_directory
+from werkzeug.security import safe_join
+from flask_socketio import SocketIO, emit, join_room, leave_room
 sys.path.append(os.getenv('MVCAM_COMMON_RUNENV') + "/Samples/python/MvImport")
 from MvCameraControl_class import MvCamera  # type: ignore
 from core.cameraService import CameraService, VirtualCameraService
 from core.sdiService import SDICameraService, SDI_AVAILABLE
+from core.replayService import ReplayCameraService
 from core.commandService import command_service
 from core.databaseService import db_service
+from core.frameRecorder import FrameReader
+from core.imagePipeline import encode_png
+from core.thumbnailService import thumbnail_service, is_source_image, THUMB_SIZES
+from core.recordExport import write_excel, iter_csv, export_filename
+from core.reportPdf import build_optical_test_report
+from core.exportJobs import export_jobs, prepare_optical_test_report
+from core.serialCapture import SerialCaptureReader
+from core.batchAnalysis import batch_analyzer, list_images
+from core.serialMetrics import serial_metrics
 serial_service = command_service._serial
 app = Flask(
     __name__,
@@ -42,6 +56,9 @@ SERVER_HOST = _app_config.get('server', {}).get('host', '127.0.0.1')
 SERVER_PORT = _app_config.get('server', {}).get('port', 8090)
 SERVER_DEBUG = _app_config.get('server', {}).get('debug', True)
 
+# 测试图片PNG压缩级别 (0-9)
+IMAGE_PNG_COMPRESSION = _app_config.get('database', {}).get('images', {}).get('png_compression', 3)
+
 # ========================加载相机配置===============================
 def _load_camera_config():
     """加载相机配置文件"""
@@ -54,6 +71,14 @@ def _load_camera_config():
         print(f"Warning: Failed to load cameraConfig.json: {e}")
     return {"cameras": []}
 
+def _get_camera_entry(camera_id: int) -> dict:
+    """从配置文件获取指定相机的配置项"""
+    config = _load_camera_config()
+    for cam in config.get('cameras', []):
+        if cam.get('id') == camera_id:
+            return cam
+    return {}
+
 def _get_camera_ip(camera_id: int) -> str:
     """从配置文件获取相机IP地址"""
     config = _load_camera_config()
@@ -69,23 +94,64 @@ socketio = SocketIO(app, cors_allowed_origins='*')
 _client_stream_threads = {}
 _client_camera_ids = {}
 
-# 初始化测试箱内相机SDK
-try:
-    ret = MvCamera.MV_CC_Initialize()
-    if ret != 0:
-        print(f"SDK Init failed! ret[0x{ret:x}]")
-    else:
-        print("Camera SDK init success")
-except Exception as e:
-    print(f"SDK init Error: {e}")
+# 订阅串口收发统计的客户端，及推送线程
+SERIAL_METRICS_ROOM = 'serial_metrics'
+_serial_metrics_clients = set()
+_serial_metrics_task = None
+
+# 相机服务实例，由 _init_services() 创建
+camSer1 = camSer2 = sdiCam = virtualCam = replayCam = None
+
 
-# 测试箱内相机实例 (相机1和2为MvCamera硬件)
-camSer1 = CameraService(0)
-camSer2 = CameraService(1)
-# SDI采集相机实例 (相机3为SDI输入)
-sdiCam = SDICameraService(camera_id=3)
-# 虚拟相机实例 (相机4为静态图像上传模式)
-virtualCam = VirtualCameraService(camera_id=4)
+def _init_services():
+    """
+    初始化相机SDK、相机服务和串口日志保留策略
+
+    只在 __main__ 中调用。进程池以 spawn 方式启动的工作进程会以 __mp_main__ 重新执行本模块顶层，
+    顶层因此只加载配置、注册路由，不初始化相机SDK、不创建服务、不启动后台线程；
+    数据库在首次访问时才建表（见 DatabaseService._ensure_database），工作进程不使用 db_service
+    （导出任务的工作进程通过 ReadOnlyRecords 以只读连接读取）。
+    """
+    global camSer1, camSer2, sdiCam, virtualCam, replayCam
+
+    # 串口日志保留策略 (条数、天数上限，后台定期清理)
+    serial_log_cfg = _app_config.get('database', {}).get('serial_logs', {})
+    db_service.set_serial_log_retention(
+        max_rows=serial_log_cfg.get('max_rows'),
+        max_days=serial_log_cfg.get('max_days'),
+        interval=serial_log_cfg.get('retention_interval_s')
+    )
+
+    # 初始化测试箱内相机SDK
+    try:
+        ret = MvCamera.MV_CC_Initialize()
+        if ret != 0:
+            print(f"SDK Init failed! ret[0x{ret:x}]")
+        else:
+            print("Camera SDK init success")
+    except Exception as e:
+        print(f"SDK init Error: {e}")
+
+    # 测试箱内相机实例 (相机1和2为MvCamera硬件)
+    camSer1 = CameraService(0)
+    camSer2 = CameraService(1)
+    # SDI采集相机实例 (相机3为SDI输入)
+    sdiCam = SDICameraService(camera_id=3)
+    # 虚拟相机实例 (相机4为静态图像上传模式)
+    virtualCam = VirtualCameraService(camera_id=4)
+    # 回放相机实例 (相机5回放录制文件或图像目录)
+    replayCam = ReplayCameraService(camera_id=5)
+
+    # 最近帧缓存至少保留 recent_frames_seconds 秒，保存测试记录时按帧号取回原始帧
+    camera_cfg = _app_config.get('camera', {})
+    for cam in (camSer1, camSer2, sdiCam, replayCam):
+        cam.recent_frames.set_retention(float(camera_cfg.get('recent_frames_seconds', 2.0)),
+                                        int(camera_cfg.get('recent_frames_max_mb', 512)) * 1024 * 1024)
+
+    if not os.path.exists(STATIC_DIR):
+        os.mkdir(STATIC_DIR)
+    if not os.path.exists(CONFIG_DIR):
+        os.mkdir(CONFIG_DIR)
 
 
 def _get_camera_by_id(camera_id):
@@ -97,9 +163,10 @@ def _get_camera_by_id(camera_id):
             - 1, 2: MvCamera真实相机
             - 3: SDI采集相机
             - 4: 虚拟相机（静态图像上传）
+            - 5: 回放相机（录制文件/图像目录）
 
     Returns:
-        CameraService, SDICameraService 或 VirtualCameraService 实例
+        CameraService, SDICameraService, VirtualCameraService 或 ReplayCameraService 实例
     """
     try:
         cam_id_int = int(camera_id)
@@ -114,9 +181,44 @@ def _get_camera_by_id(camera_id):
         return sdiCam
     elif cam_id_int == 4:
         return virtualCam
+    elif cam_id_int == 5:
+        return replayCam
     else:
         return camSer1
 
+
+def _save_frame_image(camera_id, frame_num, prefix: str, image_b64=None):
+    """
+    从相机最近帧缓存中取出原始帧，无损编码为PNG（Mono10/12/16 为16位PNG）后存入图片库
+
+    该帧已不在缓存中时改存浏览器提交的同一帧图像（有损显示图）并返回警告；
+    浏览器也未提交图像时保存失败，不用其他帧代替，保证图片与记录中的质心、帧号一致。
+
+    Args:
+        camera_id: 相机ID
+        frame_num: 帧号 (前端收到的 frameNum)
+        prefix: 图片前缀
+        image_b64: 浏览器提交的同一帧图像 (base64)，可为None
+
+    Returns:
+        (图片相对路径, 警告信息或None)
+
+    Raises:
+        ValueError: 该帧已不在缓存中且未提交图像，或编码失败
+    """
+    camera = _get_camera_by_id(camera_id)
+    frame = camera.getRawFrame(int(frame_num))
+    if frame is None:
+        if not image_b64:
+            raise ValueError(f'相机{camera_id}的第{frame_num}帧已不在缓存中，请重新采集')
+        warning = f'相机{camera_id}的第{frame_num}帧已不在缓存中，已保存浏览器提交的图像'
+        print(warning)
+        return db_service.save_image_base64(image_b64, prefix), warning
+    png = encode_png(frame, IMAGE_PNG_COMPRESSION)
+    if png is None:
+        raise ValueError('图像编码失败')
+    return db_service.save_image(png, prefix), None
+
 def _stream_frames_to_client(camera_service, sid):
     while camera_service.running:
         frame_data = camera_service.getLatestFrame()
@@ -127,11 +229,6 @@ def _stream_frames_to_client(camera_service, sid):
 # OK相机实例
 
 
-if not os.path.exists(STATIC_DIR):
-    os.mkdir(STATIC_DIR)
-if not os.path.exists(CONFIG_DIR):
-    os.mkdir(CONFIG_DIR)
-
 # ========================页面加载路由==============================================
 
 @app.route('/', methods = ["GET", "POST"])
@@ -166,12 +263,53 @@ def dynamic_target():
 def test_record():
     return render_template("testRecord.html")
 
+# 按内容哈希命名的图片一年内不会变化，浏览器可直接使用缓存
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def _send_cached_file(directory: str, filename: str, etag_suffix: str = ''):
+    """
+    发送文件并设置缓存头，支持 If-None-Match 条件请求（未变化时返回304）
+
+    文件名为内容SHA-256（图片库中的图片及其缩略图）时以哈希作为强ETag并允许长期缓存；
+    其他文件使用基于修改时间和大小的ETag，每次使用前向服务器确认。
+    """
+    stem = os.path.basename(filename).split('.', 1)[0]
+    if len(stem) == 64 and all(c in '0123456789abcdef' for c in stem):
+        response = send_from_directory(directory, filename, etag=stem + etag_suffix,
+                                       max_age=IMMUTABLE_MAX_AGE, conditional=True)
+        response.cache_control.immutable = True
+    else:
+        response = send_from_directory(directory, filename, etag=True, max_age=0, conditional=True)
+        response.cache_control.no_cache = True
+    return response
+
+
 # 静态文件路由 - 用于访问保存的测试图片
 @app.route('/data/<path:filename>')
 def serve_data_file(filename):
     """提供data目录下的文件访问"""
     data_dir = os.path.join(os.getcwd(), 'data')
-    return send_from_directory(data_dir, filename)
+    return _send_cached_file(data_dir, filename)
+
+
+@app.route('/data/thumbs/<int:size>/<path:filename>')
+def serve_thumbnail(size, filename):
+    """
+    提供测试图片缩略图，尚未生成时即时生成
+
+    URL 为 /data/thumbs/<尺寸>/<原图在data下的路径>.jpg，尺寸为 THUMB_SIZES 之一，
+    例如 /data/thumbs/128/images/ab/cd/<哈希>.png.jpg；只接受 data/images/ 下的原图
+    """
+    data_dir = os.path.join(os.getcwd(), 'data')
+    if size not in THUMB_SIZES or not filename.endswith('.jpg') \
+            or not is_source_image('data/' + filename[:-len('.jpg')]) \
+            or safe_join(data_dir, filename[:-len('.jpg')]) is None:
+        abort(404)
+    thumb_path = thumbnail_service.get('data/' + filename[:-len('.jpg')], size)
+    if thumb_path is None:
+        abort(404)
+    return _send_cached_file(data_dir, thumb_path[len('data/'):], f'-{size}')
 
 # =======================================================================
 
@@ -266,6 +404,64 @@ def connect_all_serial():
         return jsonify({'success': False, 'message': str(e)})
 
 
+@app.route('/api/serial/discover', methods=['POST'])
+def discover_serial_ports():
+    """
+    自动识别设备所在串口
+
+    请求体: {
+        ports: 可选，待探测串口，默认只探测 serialConfig.json 中已配置的串口,
+        allPorts: 是否探测系统中所有串口,
+        allowStateChange: 是否使用会改变设备状态的探测指令（app_config.json 中标记 changes_state）,
+        apply: 是否写入serialConfig.json, connect: 应用后是否连接
+    }
+    """
+    config_path = os.path.join(CONFIG_DIR, 'serialConfig.json')
+    try:
+        data = request.get_json(silent=True) or {}
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+
+        probes, skipped = command_service.build_probes(
+            config.get('configs', {}), allow_state_change=bool(data.get('allowStateChange')))
+        if not probes:
+            message = '未配置探测指令 (app_config.json serial.probe_commands)'
+            if skipped:
+                message = f"可用的探测指令均会改变设备状态 ({', '.join(skipped)})，需勾选允许后再探测"
+            return jsonify({'success': False, 'message': message})
+
+        ports = data.get('ports')
+        if not ports:
+            if data.get('allPorts'):
+                ports = serial_service.system_ports()
+            else:
+                ports = sorted({d['port'] for d in config.get('devices', []) if d.get('port')})
+        result = serial_service.discover(probes, ports=ports)
+        result['skipped'] = skipped
+
+        # 每个设备取第一个识别到的串口
+        mapping = {device: ports[0] for device, ports in result['matches'].items() if ports}
+        result['mapping'] = mapping
+
+        if data.get('apply') and mapping:
+            for device in config.get('devices', []):
+                if device.get('key') in mapping:
+                    device['port'] = mapping[device['key']]
+            with open(config_path, 'w', encoding='utf-8') as f:
+                json.dump(config, f, ensure_ascii=False, indent=2)
+
+            if data.get('connect'):
+                configs = config.get('configs', {})
+                result['connect'] = serial_service.connect_all([
+                    {'key': key, 'port': port, **configs.get(key, {})} for key, port in mapping.items()
+                ])
+
+        message = f"识别到 {len(mapping)} 台设备，耗时 {result['elapsed_ms']:.0f} ms"
+        return jsonify({'success': True, 'message': message, 'data': result})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+
 @app.route('/api/serial/disconnect-all', methods=['POST'])
 def disconnect_all_serial():
     """断开所有串口连接"""
@@ -313,9 +509,23 @@ def get_connection_status():
             return jsonify({'success': False, 'message': '请发送设备键名列表'})
         
         status = serial_service.get_all_connection_status(devices_key)
-        return jsonify({'success': True, 'status': status})
+        return jsonify({'success': True, 'status': status, 'health': serial_service.get_port_health()})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
+
+
+@app.route('/api/serial/metrics', methods=['GET'])
+def get_serial_metrics():
+    """获取串口收发统计（延迟直方图、超时/验证失败次数、收发字节数），可按 device 筛选"""
+    device = request.args.get('device')
+    return jsonify({'success': True, 'data': serial_metrics.snapshot(device)})
+
+
+@app.route('/api/serial/metrics/reset', methods=['POST'])
+def reset_serial_metrics():
+    """清空串口收发统计"""
+    serial_metrics.reset()
+    return jsonify({'success': True, 'message': '统计已清空'})
 # =========================================================================================
 
 # =========================cameraService api - camearConfig wr part========================
@@ -406,6 +616,90 @@ def reprocess_virtual_camera_image():
         return jsonify({'success': False, 'message': str(e)})
 
 
+@app.route('/api/virtual-camera/batch', methods=['POST'])
+def batch_analyze_virtual_camera_images():
+    """
+    批量分析静态图像 (进程池并行)
+
+    两种输入方式:
+    - multipart/form-data: 多个 images 文件
+    - 表单或JSON参数 directory: 服务器上的图像目录 (recursive=true 时包含子目录)
+    可选参数: threshold, medianKernelSize (默认使用虚拟相机当前参数，不改变当前显示的图像)
+
+    以 NDJSON 流返回，每行一个事件: start → result(按完成顺序) → summary
+    """
+    params = request.form.to_dict() if request.form else (request.get_json(silent=True) or {})
+    try:
+        threshold = int(params['threshold']) if 'threshold' in params else None
+        median_kernel_size = int(params['medianKernelSize']) if 'medianKernelSize' in params else None
+    except ValueError:
+        return jsonify({'success': False, 'message': '参数格式错误'})
+
+    files = [f for f in request.files.getlist('images') if f.filename]
+    directory = params.get('directory', '')
+    upload_dir = None
+    if files:
+        # 上传文件先落盘，工作进程按路径读取，避免在进程间传递大块图像数据
+        upload_dir = tempfile.mkdtemp(prefix='batch_')
+        items = []
+        for i, f in enumerate(files):
+            path = os.path.join(upload_dir, f"{i:05d}{os.path.splitext(f.filename)[1]}")
+            f.save(path)
+            items.append((f.filename, path))
+    elif directory:
+        if not os.path.isdir(directory):
+            return jsonify({'success': False, 'message': f'目录不存在: {directory}'})
+        recursive = str(params.get('recursive', '')).lower() in ('1', 'true')
+        items = [(os.path.relpath(p, directory), p) for p in list_images(directory, recursive)]
+        if not items:
+            return jsonify({'success': False, 'message': f'目录中没有图像文件: {directory}'})
+    else:
+        return jsonify({'success': False, 'message': '未找到图像文件或目录'})
+
+    def generate():
+        try:
+            for event in virtualCam.analyzeBatch(items, threshold, median_kernel_size):
+                yield json.dumps(event, ensure_ascii=False) + '\n'
+        except Exception as e:
+            yield json.dumps({'type': 'error', 'message': str(e)}, ensure_ascii=False) + '\n'
+        finally:
+            if upload_dir:
+                shutil.rmtree(upload_dir, ignore_errors=True)
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+@app.route('/api/virtual-camera/batch/<batch_id>', methods=['GET'])
+def get_virtual_camera_batch(batch_id):
+    """获取批量分析结果 (按序号排列的结果表和汇总)"""
+    batch = batch_analyzer.get_batch(batch_id)
+    if batch is None:
+        return jsonify({'success': False, 'message': '批次不存在或已过期'})
+    return jsonify({'success': True, 'data': batch})
+
+
+@app.route('/api/virtual-camera/batch/<batch_id>/export', methods=['GET'])
+def export_virtual_camera_batch(batch_id):
+    """导出批量分析结果，format=xlsx (默认) 或 csv"""
+    fmt = request.args.get('format', 'xlsx').lower()
+    try:
+        if fmt == 'csv':
+            data = batch_analyzer.export_csv(batch_id)
+            mimetype = 'text/csv'
+        else:
+            fmt = 'xlsx'
+            data = batch_analyzer.export_excel(batch_id)
+            mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        if data is None:
+            return jsonify({'success': False, 'message': '批次不存在或已过期'})
+        return send_file(io.BytesIO(data), mimetype=mimetype, as_attachment=True,
+                         download_name=f'batch_{batch_id}.{fmt}')
+    except ImportError:
+        return jsonify({'success': False, 'message': '请安装openpyxl库: pip install openpyxl'})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+
 @app.route('/api/virtual-camera/frame', methods=['GET'])
 def get_virtual_camera_frame():
     """获取虚拟相机最新帧"""
@@ -421,6 +715,17 @@ def get_virtual_camera_frame():
 
 # =========================================================================================
 
+# =========================replayCamera api (回放相机 - 相机5)================================
+@app.route('/api/replay-camera/stats', methods=['GET'])
+def get_replay_camera_stats():
+    """获取回放统计（处理帧数、实际帧率、各阶段平均耗时）"""
+    try:
+        return jsonify({'success': True, 'stats': replayCam.getStats()})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+# =========================================================================================
+
 # =========================SDI Camera api (相机3)============================================
 @app.route('/api/sdi-camera/devices', methods=['GET'])
 def get_sdi_devices():
@@ -495,6 +800,12 @@ def get_all_camera_params():
             params['cameraType'] = 'sdi'
             return jsonify({'success': True, 'params': params})
 
+        # 回放相机返回处理参数和回放设置
+        if isinstance(cam, ReplayCameraService):
+            params = cam.getAllParams()
+            params['cameraType'] = 'replay'
+            return jsonify({'success': True, 'params': params})
+
         # MvCamera真实相机需要连接后才能获取参数
         if cam.cam is None:
             return jsonify({'success': False, 'message': '相机未连接'})
@@ -506,6 +817,157 @@ def get_all_camera_params():
         return jsonify({'success': False, 'message': str(e)})
 
 
+
+# =========================原始帧录制 API================================================
+RECORDINGS_DIR = os.path.join(os.getcwd(), 'data', 'recordings')
+
+
+@app.route('/api/camera/recording/start', methods=['POST'])
+def start_camera_recording():
+    """
+    开始录制相机原始帧到内存映射文件
+
+    请求体JSON:
+        - cameraId: 相机ID
+        - maxFrames: 最大帧数 (默认300，写满后循环覆盖最早的帧)
+    """
+    try:
+        data = request.get_json()
+        camera_id = int(data.get('cameraId', 1))
+        max_frames = int(data.get('maxFrames', 300))
+        if max_frames <= 0:
+            return jsonify({'success': False, 'message': 'maxFrames必须大于0'})
+
+        cam = _get_camera_by_id(camera_id)
+        filename = f'cam{camera_id}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.rec'
+        path = os.path.join(RECORDINGS_DIR, filename)
+        cam.startRecording(path, max_frames)
+        return jsonify({'success': True, 'message': '开始录制', 'file': f'data/recordings/{filename}'})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+
+@app.route('/api/camera/recording/stop', methods=['POST'])
+def stop_camera_recording():
+    """停止录制，返回录制统计"""
+    try:
+        data = request.get_json()
+        cam = _get_camera_by_id(data.get('cameraId', 1))
+        status = cam.stopRecording()
+        if status is None:
+            return jsonify({'success': False, 'message': '当前未在录制'})
+        return jsonify({'success': True, 'message': '录制已停止', 'status': status})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+
+@app.route('/api/camera/recording/status', methods=['POST'])
+def get_camera_recording_status():
+    """获取相机录制状态"""
+    try:
+        data = request.get_json()
+        cam = _get_camera_by_id(data.get('cameraId', 1))
+        status = cam.getRecordingStatus()
+        return jsonify({'success': True, 'recording': status is not None, 'status': status})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+
+@app.route('/api/recordings', methods=['GET'])
+def list_recordings():
+    """列出已保存的录制文件"""
+    try:
+        recordings = []
+        if os.path.isdir(RECORDINGS_DIR):
+            for filename in sorted(os.listdir(RECORDINGS_DIR), reverse=True):
+                if not filename.endswith('.rec'):
+                    continue
+                path = os.path.join(RECORDINGS_DIR, filename)
+                try:
+                    with FrameReader(path) as reader:
+                        info = reader.get_info()
+                except Exception:
+                    continue  # 正在录制尚未写入首帧或文件损坏
+                info['path'] = f'data/recordings/{filename}'
+                info['size'] = os.path.getsize(path)
+                recordings.append(info)
+        return jsonify({'success': True, 'recordings': recordings})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+
+def _start_serial_capture(slots=None):
+    """开始串口抓包，文件保存在 data/recordings/serial_*.scap，只保留最新的 keep_files 个"""
+    capture_cfg = _app_config.get('serial', {}).get('capture', {})
+    filename = f"serial_{datetime.now().strftime('%Y%m%d_%H%M%S')}.scap"
+    status = serial_service.start_capture(os.path.join(RECORDINGS_DIR, filename),
+                                          int(slots or capture_cfg.get('slots', 65536)))
+    status['file'] = f'data/recordings/{filename}'
+    status['removed'] = _prune_serial_captures(int(capture_cfg.get('keep_files', 10)))
+    return status
+
+
+def _prune_serial_captures(keep_files):
+    """删除较早的串口抓包文件，只保留最新的 keep_files 个（含正在写入的文件），返回删除的文件名"""
+    captures = sorted(f for f in os.listdir(RECORDINGS_DIR) if f.startswith('serial_') and f.endswith('.scap'))
+    removed = []
+    for filename in captures[:-max(keep_files, 1)]:
+        try:
+            os.remove(os.path.join(RECORDINGS_DIR, filename))
+            removed.append(filename)
+        except OSError as e:
+            print(f"删除串口抓包文件失败 {filename}: {e}")
+    return removed
+
+
+@app.route('/api/serial/capture/start', methods=['POST'])
+def start_serial_capture():
+    """开始串口抓包（正在抓包时切换到新文件）"""
+    try:
+        data = request.get_json(silent=True) or {}
+        status = _start_serial_capture(data.get('slots'))
+        return jsonify({'success': True, 'message': '开始串口抓包', 'status': status})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+
+@app.route('/api/serial/capture/stop', methods=['POST'])
+def stop_serial_capture():
+    """停止串口抓包"""
+    status = serial_service.stop_capture()
+    if status is None:
+        return jsonify({'success': False, 'message': '未在抓包'})
+    return jsonify({'success': True, 'message': '已停止串口抓包', 'status': status})
+
+
+@app.route('/api/serial/capture/status', methods=['GET'])
+def get_serial_capture_status():
+    """获取串口抓包状态"""
+    status = serial_service.get_capture_status()
+    return jsonify({'success': True, 'capturing': status is not None, 'status': status})
+
+
+@app.route('/api/serial/captures', methods=['GET'])
+def list_serial_captures():
+    """列出串口抓包文件"""
+    try:
+        captures = []
+        if os.path.isdir(RECORDINGS_DIR):
+            for filename in sorted(os.listdir(RECORDINGS_DIR), reverse=True):
+                if not filename.endswith('.scap'):
+                    continue
+                path = os.path.join(RECORDINGS_DIR, filename)
+                try:
+                    info = SerialCaptureReader(path).get_info()
+                except Exception:
+                    continue
+                info['path'] = f'data/recordings/{filename}'
+                info['size'] = os.path.getsize(path)
+                captures.append(info)
+        return jsonify({'success': True, 'captures': captures})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
 # =========================================================================================
 
 # =========================commandService api==============================================
@@ -519,8 +981,14 @@ def send_command():
         params = data.get('params')
         wait_response = data.get('wait_response', True)
         timeout = data.get('timeout', 2.0)
+        priority = data.get('priority')  # 可选，见 commandService.PRIORITY_*
+        if priority is not None:
+            try:
+                priority = int(priority)
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'message': f'无效的优先级: {priority}'}), 400
         success, message, response_bytes, decode_result = command_service.send(
-            device, cmd, params, wait_response=wait_response, timeout=timeout
+            device, cmd, params, wait_response=wait_response, timeout=timeout, priority=priority
         )
         result = {
             'success': success,
@@ -534,11 +1002,42 @@ def send_command():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+@app.route('/api/command/batch', methods=['POST'])
+def send_command_batch():
+    """
+    批量执行指令序列（服务端依次执行，遇到第一个失败即停止）
+
+    请求体: {"steps": [{"device", "cmd", "params", "wait_response", "verify",
+                        "timeout", "repeat", "interval_ms", "delay_ms"}, ...]}
+    """
+    try:
+        data = request.get_json() or {}
+        steps = data.get('steps')
+        if not isinstance(steps, list) or not steps:
+            return jsonify({'success': False, 'message': '缺少指令步骤'})
+        start = time.perf_counter()
+        success, message, results = command_service.send_batch(steps)
+        return jsonify({
+            'success': success,
+            'message': message,
+            'steps': results,
+            'elapsed_ms': round((time.perf_counter() - start) * 1000.0, 3)
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
 @app.route('/api/command/get-all-commands', methods=['GET'])
 def get_all_commands():
     """获取所有指令"""
     commands = command_service.list_commands()  # 返回的是一个Dict
-    return jsonify({'success': True, 'commands': commands})
+    return jsonify({'success': True, 'commands': commands, 'errors': command_service.get_plan_errors()})
+
+@app.route('/api/command/reload', methods=['POST'])
+def reload_commands():
+    """立即重新加载指令配置（修改配置文件后也会在1秒内自动生效）"""
+    errors = command_service.reload()
+    message = f'指令配置已重新加载，{len(errors)} 条模板有误' if errors else '指令配置已重新加载'
+    return jsonify({'success': True, 'message': message, 'errors': errors})
 
 @app.route('/api/command/config', methods=['GET'])
 def get_command_config():
@@ -565,6 +1064,7 @@ def get_serial_logs():
         - end_time: 结束时间 (ISO格式)
         - limit: 返回数量限制 (默认100)
         - offset: 偏移量 (默认0)
+        - cursor: 上一页返回的 nextCursor (键集分页，指定后忽略 offset)
     """
     try:
         device = request.args.get('device')
@@ -573,6 +1073,7 @@ def get_serial_logs():
         end_time = request.args.get('end_time')
         limit = int(request.args.get('limit', 100))
         offset = int(request.args.get('offset', 0))
+        cursor = request.args.get('cursor')
 
         result = db_service.get_serial_logs(
             device=device,
@@ -580,7 +1081,33 @@ def get_serial_logs():
             start_time=start_time,
             end_time=end_time,
             limit=limit,
-            offset=offset
+            offset=offset,
+            cursor=cursor
+        )
+        return jsonify({'success': True, **result})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+
+@app.route('/api/logs/serial/search', methods=['GET'])
+def search_serial_logs():
+    """
+    全文搜索串口日志 (指令名、消息、参数、响应文本)，按相关度排序
+    查询参数:
+        - q: 关键词，空格分隔，需全部匹配
+        - device / port / start_time / end_time: 同 /api/logs/serial
+        - limit: 返回数量限制 (默认50)
+        - offset: 偏移量 (默认0)
+    """
+    try:
+        result = db_service.search_serial_logs(
+            request.args.get('q', ''),
+            device=request.args.get('device'),
+            port=request.args.get('port'),
+            start_time=request.args.get('start_time'),
+            end_time=request.args.get('end_time'),
+            limit=int(request.args.get('limit', 50)),
+            offset=int(request.args.get('offset', 0))
         )
         return jsonify({'success': True, **result})
     except Exception as e:
@@ -610,6 +1137,15 @@ def clear_serial_logs():
         return jsonify({'success': False, 'message': str(e)})
 
 
+@app.route('/api/logs/serial/retention', methods=['GET'])
+def get_serial_log_retention():
+    """获取串口日志保留策略及最近一次清理结果"""
+    try:
+        return jsonify({'success': True, **db_service.get_serial_log_retention()})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+
 # --------------------- 光轴测试记录 API ---------------------
 @app.route('/api/tests/optical-axis', methods=['GET'])
 def get_optical_tests():
@@ -620,18 +1156,21 @@ def get_optical_tests():
         - end_time: 结束时间 (ISO格式)
         - limit: 返回数量限制 (默认50)
         - offset: 偏移量 (默认0)
+        - cursor: 上一页返回的 nextCursor (键集分页，指定后忽略 offset)
     """
     try:
         start_time = request.args.get('start_time')
         end_time = request.args.get('end_time')
         limit = int(request.args.get('limit', 50))
         offset = int(request.args.get('offset', 0))
+        cursor = request.args.get('cursor')
 
         result = db_service.get_optical_tests(
             start_time=start_time,
             end_time=end_time,
             limit=limit,
-            offset=offset
+            offset=offset,
+            cursor=cursor
         )
         return jsonify({'success': True, **result})
     except Exception as e:
@@ -660,7 +1199,8 @@ def save_optical_test():
         - operator: 操作人员
         - base_camera_id: 基准相机ID
         - base_camera_name: 基准相机名称
-        - base_image: 基准图片base64数据
+        - base_frame_num: 基准图片帧号，服务端从 base_camera_id 相机的最近帧缓存中取原始帧保存
+        - base_image: 基准图片base64数据 (未提供 base_frame_num，或该帧已不在缓存中时使用)
         - base_width: 基准图像宽度
         - base_height: 基准图像高度
         - base_centroid_x: 基准质心X
@@ -675,7 +1215,11 @@ def save_optical_test():
 
         # 保存基准图片
         base_image_path = None
-        if data.get('base_image'):
+        warning = None
+        if data.get('base_frame_num') is not None:
+            base_image_path, warning = _save_frame_image(data.get('base_camera_id'), data['base_frame_num'],
+                                                         'base', data.get('base_image'))
+        elif data.get('base_image'):
             base_image_path = db_service.save_image_base64(data['base_image'], 'base')
 
         record_data = {
@@ -694,7 +1238,8 @@ def save_optical_test():
         }
 
         record_id = db_service.save_optical_test(record_data)
-        return jsonify({'success': True, 'id': record_id, 'message': '基准光轴记录已保存'})
+        thumbnail_service.submit(base_image_path)
+        return jsonify({'success': True, 'id': record_id, 'message': '基准光轴记录已保存', 'warning': warning})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
@@ -707,7 +1252,8 @@ def update_optical_test(test_id):
     请求体JSON:
         - test_camera_id: 测试相机ID
         - test_camera_name: 测试相机名称
-        - test_image: 测试图片base64数据
+        - test_frame_num: 测试图片帧号，服务端从 test_camera_id 相机的最近帧缓存中取原始帧保存
+        - test_image: 测试图片base64数据 (未提供 test_frame_num，或该帧已不在缓存中时使用)
         - test_width: 测试图像宽度
         - test_height: 测试图像高度
         - test_centroid_x: 测试质心X
@@ -721,9 +1267,13 @@ def update_optical_test(test_id):
     try:
         data = request.get_json()
         update_data = {}
+        warning = None
 
         # 保存测试图片
-        if data.get('test_image'):
+        if data.get('test_frame_num') is not None:
+            update_data['test_image_path'], warning = _save_frame_image(
+                data.get('test_camera_id'), data['test_frame_num'], 'test', data.get('test_image'))
+        elif data.get('test_image'):
             test_image_path = db_service.save_image_base64(data['test_image'], 'test')
             update_data['test_image_path'] = test_image_path
 
@@ -739,7 +1289,8 @@ def update_optical_test(test_id):
 
         success = db_service.update_optical_test(test_id, update_data)
         if success:
-            return jsonify({'success': True, 'message': '测试记录已更新'})
+            thumbnail_service.submit(update_data.get('test_image_path'))
+            return jsonify({'success': True, 'message': '测试记录已更新', 'warning': warning})
         else:
             return jsonify({'success': False, 'message': '记录不存在或更新失败'})
     except Exception as e:
@@ -760,430 +1311,85 @@ def delete_optical_test(test_id):
 
 
 # --------------------- 导出 API ---------------------
-def hex_to_string(hex_str):
-    """将HEX字符串转换为可读字符串"""
-    if not hex_str or hex_str == '-':
-        return ''
-    try:
-        # 移除空格，将HEX字符串按每2个字符分割
-        hex_clean = hex_str.replace(' ', '')
-        result = ''
-        for i in range(0, len(hex_clean), 2):
-            if i + 2 <= len(hex_clean):
-                hex_byte = hex_clean[i:i+2]
-                char_code = int(hex_byte, 16)
-                # 只显示可打印字符(32-126)和常见扩展ASCII(128-255)，其他用点号表示
-                if (32 <= char_code <= 126) or (128 <= char_code <= 255):
-                    result += chr(char_code)
-                else:
-                    result += '.'
-        return result
-    except Exception:
-        return hex_str  # 转换失败返回原字符串
+def _export_filters(kind: str) -> dict:
+    """导出接口的筛选参数"""
+    keys = ('device', 'port', 'start_time', 'end_time') if kind == 'serial-logs' else ('start_time', 'end_time')
+    return {key: request.args.get(key) for key in keys if request.args.get(key)}
 
 
-@app.route('/api/export/serial-logs/excel', methods=['GET'])
-def export_serial_logs_excel():
-    """导出串口日志为Excel"""
-    try:
-        import openpyxl
-        from openpyxl.styles import Font, Alignment, Border, Side
-
-        # 获取所有日志
-        result = db_service.get_serial_logs(limit=1000, offset=0)
-        logs = result['logs']
-
-        # 创建工作簿
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = '串口日志'
-
-        # 设置表头
-        headers = ['ID', '时间', '设备', '串口', '指令', '参数',
-                   '发送数据(HEX)', '发送数据(字符)', '返回数据(HEX)', '返回数据(字符)',
-                   '状态', '消息']
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = Font(bold=True)
-            cell.alignment = Alignment(horizontal='center')
-
-        # 填充数据
-        for row, log in enumerate(logs, 2):
-            ws.cell(row=row, column=1, value=log['id'])
-            # UTC时间转换为本地时间
-            timestamp = log['timestamp']
-            if timestamp:
-                try:
-                    utc_str = str(timestamp).replace(' ', 'T')
-                    if not utc_str.endswith('Z') and '+' not in utc_str:
-                        utc_str += '+00:00'
-                    utc_dt = datetime.fromisoformat(utc_str.replace('Z', '+00:00'))
-                    local_dt = utc_dt.astimezone()
-                    timestamp = local_dt.strftime('%Y-%m-%d %H:%M:%S')
-                except:
-                    pass
-            ws.cell(row=row, column=2, value=timestamp)
-            ws.cell(row=row, column=3, value=log['device'])
-            ws.cell(row=row, column=4, value=log['port'])
-            ws.cell(row=row, column=5, value=log['command'])
-            ws.cell(row=row, column=6, value=log['params'])
-            # 发送数据 HEX
-            ws.cell(row=row, column=7, value=log['cmd_bytes'])
-            # 发送数据 字符
-            ws.cell(row=row, column=8, value=hex_to_string(log['cmd_bytes']))
-            # 返回数据 HEX
-            ws.cell(row=row, column=9, value=log['response_bytes'])
-            # 返回数据 字符
-            ws.cell(row=row, column=10, value=hex_to_string(log['response_bytes']))
-            # 状态和消息
-            ws.cell(row=row, column=11, value='成功' if log['success'] else '失败')
-            ws.cell(row=row, column=12, value=log['message'])
-
-        # 调整列宽
-        column_widths = [8, 20, 15, 10, 20, 30, 30, 25, 30, 25, 8, 40]
-        for col, width in enumerate(column_widths, 1):
-            ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = width
-
-        # 保存到内存
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
+def _send_temp_file(path: str, mimetype: str, download_name: str) -> Response:
+    """分块发送临时文件，发送完成（或客户端断开）后删除"""
+    def generate():
+        try:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(256 * 1024), b''):
+                    yield chunk
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
 
-        filename = f'serial_logs_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        return send_file(output, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                        as_attachment=True, download_name=filename)
-    except ImportError:
-        return jsonify({'success': False, 'message': '请安装openpyxl库: pip install openpyxl'})
-    except Exception as e:
-        return jsonify({'success': False, 'message': str(e)})
+    return Response(generate(), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename={download_name}',
+        'Content-Length': str(os.path.getsize(path)),
+    })
 
 
-@app.route('/api/export/optical-tests/excel', methods=['GET'])
-def export_optical_tests_excel():
-    """导出光轴测试记录为Excel"""
+def _export_excel(kind: str):
+    """导出为Excel：只写模式写入临时文件后分块发送"""
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
     try:
-        import openpyxl
-        from openpyxl.styles import Font, Alignment
-
-        # 获取所有记录
-        result = db_service.get_optical_tests(limit=1000, offset=0)
-        records = result['records']
-
-        # 创建工作簿
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = '光轴测试记录'
-
-        # 设置表头
-        headers = ['ID', '测试时间',
-                  '基准相机ID', '基准相机', '基准图像路径', '基准宽度', '基准高度',
-                  '基准质心X', '基准质心Y', '基准焦距(mm)', '基准像元(μm)',
-                  '基准偏移X(°)', '基准偏移Y(°)',
-                  '测试相机ID', '测试相机', '测试图像路径', '测试宽度', '测试高度',
-                  '测试质心X', '测试质心Y', '测试焦距(mm)', '测试像元(μm)',
-                  '测试偏移X(°)', '测试偏移Y(°)', '备注']
-
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = Font(bold=True)
-            cell.alignment = Alignment(horizontal='center')
-
-        # 填充数据
-        for row, rec in enumerate(records, 2):
-            ws.cell(row=row, column=1, value=rec['id'])
-            # UTC时间转换为本地时间
-            test_time = rec['test_time']
-            if test_time:
-                try:
-                    utc_str = str(test_time).replace(' ', 'T')
-                    if not utc_str.endswith('Z') and '+' not in utc_str:
-                        utc_str += '+00:00'
-                    utc_dt = datetime.fromisoformat(utc_str.replace('Z', '+00:00'))
-                    local_dt = utc_dt.astimezone()
-                    test_time = local_dt.strftime('%Y-%m-%d %H:%M:%S')
-                except:
-                    pass
-            ws.cell(row=row, column=2, value=test_time)
-            ws.cell(row=row, column=3, value=rec['base_camera_id'])
-            ws.cell(row=row, column=4, value=rec['base_camera_name'])
-            ws.cell(row=row, column=5, value=rec['base_image_path'])
-            ws.cell(row=row, column=6, value=rec['base_width'])
-            ws.cell(row=row, column=7, value=rec['base_height'])
-            ws.cell(row=row, column=8, value=rec['base_centroid_x'])
-            ws.cell(row=row, column=9, value=rec['base_centroid_y'])
-            ws.cell(row=row, column=10, value=rec['base_focal_length'])
-            ws.cell(row=row, column=11, value=rec['base_pixel_size'])
-            ws.cell(row=row, column=12, value=rec['base_offset_x'])
-            ws.cell(row=row, column=13, value=rec['base_offset_y'])
-            ws.cell(row=row, column=14, value=rec['test_camera_id'])
-            ws.cell(row=row, column=15, value=rec['test_camera_name'])
-            ws.cell(row=row, column=16, value=rec['test_image_path'])
-            ws.cell(row=row, column=17, value=rec['test_width'])
-            ws.cell(row=row, column=18, value=rec['test_height'])
-            ws.cell(row=row, column=19, value=rec['test_centroid_x'])
-            ws.cell(row=row, column=20, value=rec['test_centroid_y'])
-            ws.cell(row=row, column=21, value=rec['test_focal_length'])
-            ws.cell(row=row, column=22, value=rec['test_pixel_size'])
-            ws.cell(row=row, column=23, value=rec['test_offset_x'])
-            ws.cell(row=row, column=24, value=rec['test_offset_y'])
-            ws.cell(row=row, column=25, value=rec['remark'])
-
-        # 保存到内存
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
-
-        filename = f'optical_tests_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        return send_file(output, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                        as_attachment=True, download_name=filename)
+        write_excel(path, kind, _export_filters(kind))
     except ImportError:
+        os.remove(path)
         return jsonify({'success': False, 'message': '请安装openpyxl库: pip install openpyxl'})
     except Exception as e:
+        os.remove(path)
         return jsonify({'success': False, 'message': str(e)})
+    return _send_temp_file(path, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                           export_filename(kind, 'xlsx'))
 
 
-@app.route('/api/export/optical-test/<int:test_id>/pdf', methods=['GET'])
-def export_optical_test_pdf(test_id):
-    """导出单条光轴测试记录为PDF报告（单页A4）"""
-    try:
-        # 解决 reportlab 与 Python/OpenSSL 兼容性问题
-        import hashlib
-        _orig_md5 = hashlib.md5
-        def _patched_md5(*args, **kwargs):
-            kwargs.pop('usedforsecurity', None)
-            return _orig_md5(*args, **kwargs)
-        hashlib.md5 = _patched_md5
-
-        from reportlab.lib import colors
-        from reportlab.lib.pagesizes import A4
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib.units import mm
-        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image as RLImage
-        from reportlab.pdfbase import pdfmetrics
-        from reportlab.pdfbase.ttfonts import TTFont
+def _export_csv(kind: str) -> Response:
+    """导出为CSV：边读边发送的分块响应"""
+    return Response(iter_csv(kind, _export_filters(kind)), mimetype='text/csv', headers={
+        'Content-Disposition': f'attachment; filename={export_filename(kind, "csv")}',
+    })
 
-        record = db_service.get_optical_test(test_id)
-        if not record:
-            return jsonify({'success': False, 'message': '记录不存在'})
 
-        # 尝试注册中文字体
-        font_name = 'Helvetica'
-        try:
-            font_paths = [
-                'C:/Windows/Fonts/simhei.ttf',
-                'C:/Windows/Fonts/msyh.ttc',
-                'simhei.ttf',
-            ]
-            for fp in font_paths:
-                try:
-                    pdfmetrics.registerFont(TTFont('SimHei', fp))
-                    font_name = 'SimHei'
-                    break
-                except:
-                    continue
-        except:
-            pass
+@app.route('/api/export/serial-logs/excel', methods=['GET'])
+def export_serial_logs_excel():
+    """导出串口日志为Excel（可按 device、port、start_time、end_time 筛选）"""
+    return _export_excel('serial-logs')
 
-        def fmt(val, decimals=2):
-            if val is None:
-                return '-'
-            return f'{val:.{decimals}f}'
 
-        # 创建PDF - 紧凑边距
-        output = io.BytesIO()
-        doc = SimpleDocTemplate(
-            output,
-            pagesize=A4,
-            topMargin=12*mm,
-            bottomMargin=10*mm,
-            leftMargin=15*mm,
-            rightMargin=15*mm
-        )
-        elements = []
+@app.route('/api/export/serial-logs/csv', methods=['GET'])
+def export_serial_logs_csv():
+    """导出串口日志为CSV（筛选参数同Excel导出）"""
+    return _export_csv('serial-logs')
 
-        # 样式定义 - 紧凑字体
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle', fontName=font_name, fontSize=18,
-            textColor=colors.HexColor('#1890ff'), spaceAfter=8, alignment=1
-        )
-        heading_style = ParagraphStyle(
-            'CustomHeading', fontName=font_name, fontSize=11,
-            textColor=colors.HexColor('#333333'), spaceBefore=6, spaceAfter=4
-        )
-        small_style = ParagraphStyle(
-            'Small', fontName=font_name, fontSize=9, textColor=colors.HexColor('#666666')
-        )
 
-        # 标题
-        elements.append(Paragraph('光轴一致性测试报告', title_style))
+@app.route('/api/export/optical-tests/excel', methods=['GET'])
+def export_optical_tests_excel():
+    """导出光轴测试记录为Excel（可按 start_time、end_time 筛选）"""
+    return _export_excel('optical-tests')
+
 
-        # 基本信息 - 单行
-        test_time = record['test_time'] or '-'
-        if test_time != '-':
-            # SQLite CURRENT_TIMESTAMP 存储的是UTC时间，转换为本地时间
-            try:
-                from datetime import timezone
-                utc_str = str(test_time).replace(' ', 'T')
-                if not utc_str.endswith('Z') and '+' not in utc_str:
-                    utc_str += '+00:00'  # 标记为UTC
-                utc_dt = datetime.fromisoformat(utc_str.replace('Z', '+00:00'))
-                local_dt = utc_dt.astimezone()  # 转换为本地时间
-                test_time = local_dt.strftime('%Y-%m-%d %H:%M:%S')
-            except:
-                # 解析失败，使用简单格式化
-                if 'T' in str(test_time):
-                    test_time = str(test_time).replace('T', ' ')[:19]
-
-        info_data = [[
-            f"编号: #{record['id']}",
-            f"测试时间: {test_time}",
-            f"操作人员: {record.get('operator') or '-'}"
-        ]]
-        info_table = Table(info_data, colWidths=[50*mm, 70*mm, 60*mm])
-        info_table.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (-1, -1), font_name),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#666666')),
-            ('ALIGN', (0, 0), (0, 0), 'LEFT'),
-            ('ALIGN', (1, 0), (1, 0), 'CENTER'),
-            ('ALIGN', (2, 0), (2, 0), 'RIGHT'),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-        ]))
-        elements.append(info_table)
-        elements.append(Spacer(1, 4*mm))
-
-        # 准备图片
-        base_img = None
-        test_img = None
-        img_width, img_height = 55*mm, 42*mm
-
-        if record.get('base_image_path'):
-            try:
-                img_path = os.path.join(os.getcwd(), record['base_image_path'])
-                if os.path.exists(img_path):
-                    base_img = RLImage(img_path, width=img_width, height=img_height)
-            except:
-                pass
+@app.route('/api/export/optical-tests/csv', methods=['GET'])
+def export_optical_tests_csv():
+    """导出光轴测试记录为CSV"""
+    return _export_csv('optical-tests')
 
-        if record.get('test_image_path'):
-            try:
-                img_path = os.path.join(os.getcwd(), record['test_image_path'])
-                if os.path.exists(img_path):
-                    test_img = RLImage(img_path, width=img_width, height=img_height)
-            except:
-                pass
 
-        # 双栏布局 - 基准光轴 | 测试光轴
-        col_width = 85*mm
-        row_height = 5.5*mm
-
-        # 表头
-        header_data = [['基准光轴', '测试光轴']]
-        header_table = Table(header_data, colWidths=[col_width, col_width])
-        header_table.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (-1, -1), font_name),
-            ('FONTSIZE', (0, 0), (-1, -1), 12),
-            ('TEXTCOLOR', (0, 0), (0, 0), colors.HexColor('#52c41a')),
-            ('TEXTCOLOR', (1, 0), (1, 0), colors.HexColor('#fa8c16')),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('BACKGROUND', (0, 0), (0, 0), colors.HexColor('#f6ffed')),
-            ('BACKGROUND', (1, 0), (1, 0), colors.HexColor('#fff7e6')),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-            ('TOPPADDING', (0, 0), (-1, -1), 6),
-            ('BOX', (0, 0), (-1, -1), 0.5, colors.HexColor('#d9d9d9')),
-        ]))
-        elements.append(header_table)
-
-        # 数据对比表格
-        data_rows = [
-            ['相机', record['base_camera_name'] or str(record['base_camera_id'] or '-'),
-             '相机', record['test_camera_name'] or str(record['test_camera_id'] or '-')],
-            ['尺寸', f"{record['base_width'] or '-'}x{record['base_height'] or '-'}",
-             '尺寸', f"{record['test_width'] or '-'}x{record['test_height'] or '-'}"],
-            ['质心', f"({fmt(record['base_centroid_x'])}, {fmt(record['base_centroid_y'])})",
-             '质心', f"({fmt(record['test_centroid_x'])}, {fmt(record['test_centroid_y'])})"],
-            ['焦距', f"{fmt(record['base_focal_length'])} mm",
-             '焦距', f"{fmt(record['test_focal_length'])} mm"],
-            ['像元', f"{fmt(record['base_pixel_size'])} um",
-             '像元', f"{fmt(record['test_pixel_size'])} um"],
-            ['偏移X', f"{fmt(record['base_offset_x'], 4)}°",
-             '偏移X', f"{fmt(record['test_offset_x'], 4)}°"],
-            ['偏移Y', f"{fmt(record['base_offset_y'], 4)}°",
-             '偏移Y', f"{fmt(record['test_offset_y'], 4)}°"],
-        ]
-
-        data_table = Table(data_rows, colWidths=[18*mm, 67*mm, 18*mm, 67*mm], rowHeights=[row_height]*7)
-        data_table.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (-1, -1), font_name),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#888888')),
-            ('TEXTCOLOR', (2, 0), (2, -1), colors.HexColor('#888888')),
-            ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor('#333333')),
-            ('TEXTCOLOR', (3, 0), (3, -1), colors.HexColor('#333333')),
-            ('BACKGROUND', (0, 0), (1, -1), colors.HexColor('#fafafa')),
-            ('BACKGROUND', (2, 0), (3, -1), colors.HexColor('#fffbf0')),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e8e8e8')),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('LEFTPADDING', (0, 0), (-1, -1), 4),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 4),
-            ('TOPPADDING', (0, 0), (-1, -1), 2),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-        ]))
-        elements.append(data_table)
-
-        # 图片行
-        if base_img or test_img:
-            elements.append(Spacer(1, 3*mm))
-            img_row = [[base_img or '', test_img or '']]
-            img_table = Table(img_row, colWidths=[col_width, col_width])
-            img_table.setStyle(TableStyle([
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('BOX', (0, 0), (0, 0), 0.5, colors.HexColor('#d9d9d9') if base_img else colors.white),
-                ('BOX', (1, 0), (1, 0), 0.5, colors.HexColor('#d9d9d9') if test_img else colors.white),
-                ('BACKGROUND', (0, 0), (0, 0), colors.HexColor('#fafafa') if base_img else colors.white),
-                ('BACKGROUND', (1, 0), (1, 0), colors.HexColor('#fafafa') if test_img else colors.white),
-            ]))
-            elements.append(img_table)
-
-        # 备注
-        if record.get('remark'):
-            elements.append(Spacer(1, 4*mm))
-            remark_data = [['备注', record['remark']]]
-            remark_table = Table(remark_data, colWidths=[18*mm, 152*mm])
-            remark_table.setStyle(TableStyle([
-                ('FONTNAME', (0, 0), (-1, -1), font_name),
-                ('FONTSIZE', (0, 0), (-1, -1), 9),
-                ('TEXTCOLOR', (0, 0), (0, 0), colors.HexColor('#d48806')),
-                ('TEXTCOLOR', (1, 0), (1, 0), colors.HexColor('#666666')),
-                ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#fffbe6')),
-                ('BOX', (0, 0), (-1, -1), 0.5, colors.HexColor('#ffe58f')),
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                ('LEFTPADDING', (0, 0), (-1, -1), 4),
-                ('TOPPADDING', (0, 0), (-1, -1), 4),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-            ]))
-            elements.append(remark_table)
-
-        # 页脚
-        elements.append(Spacer(1, 6*mm))
-        footer_data = [[
-            '光轴一致性测试系统',
-            f"报告生成: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        ]]
-        footer_table = Table(footer_data, colWidths=[90*mm, 80*mm])
-        footer_table.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (-1, -1), font_name),
-            ('FONTSIZE', (0, 0), (-1, -1), 8),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#999999')),
-            ('ALIGN', (0, 0), (0, 0), 'LEFT'),
-            ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
-        ]))
-        elements.append(footer_table)
-
-        doc.build(elements)
+@app.route('/api/export/optical-test/<int:test_id>/pdf', methods=['GET'])
+def export_optical_test_pdf(test_id):
+    """导出单条光轴测试记录为PDF报告（单页A4，在请求线程中生成；批量报告请使用导出任务）"""
+    try:
+        records, images = prepare_optical_test_report([test_id])
+        output = io.BytesIO()
+        build_optical_test_report(output, records, images)
         output.seek(0)
 
         filename = f'optical_test_report_{test_id}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
@@ -1195,6 +1401,61 @@ def export_optical_test_pdf(test_id):
         import traceback
         return jsonify({'success': False, 'message': str(e), 'trace': traceback.format_exc()})
 
+
+# --------------------- 导出任务 API ---------------------
+def _emit_export_job(job: dict):
+    """导出任务状态/进度推送给发起任务的客户端（未提供sid时广播）"""
+    if job.get('owner'):
+        socketio.emit('export_job', job, room=job['owner'])
+    else:
+        socketio.emit('export_job', job)
+
+
+export_jobs.set_listener(_emit_export_job)
+
+
+@app.route('/api/export/jobs', methods=['POST'])
+def create_export_job():
+    """
+    创建导出任务，立即返回任务ID，进度通过 Socket.IO 'export_job' 事件推送
+
+    请求体: {type: 'serial-logs'|'optical-tests'|'optical-test-pdf', format: 'xlsx'|'csv',
+            filters: {...}, ids: [测试记录ID], sid: Socket.IO会话ID}
+    """
+    try:
+        data = request.get_json() or {}
+        job = export_jobs.submit(
+            data.get('type'),
+            fmt=data.get('format'),
+            filters={key: value for key, value in (data.get('filters') or {}).items() if value},
+            ids=data.get('ids'),
+            owner=data.get('sid'),
+        )
+        return jsonify({'success': True, 'jobId': job['jobId'], 'job': job})
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'message': str(e)})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'创建导出任务失败: {str(e)}'})
+
+
+@app.route('/api/export/jobs/<job_id>', methods=['GET'])
+def get_export_job(job_id):
+    """查询导出任务状态"""
+    job = export_jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': '任务不存在或已过期'})
+    return jsonify({'success': True, 'job': job})
+
+
+@app.route('/api/export/jobs/<job_id>/download', methods=['GET'])
+def download_export_job(job_id):
+    """下载导出任务生成的文件（过期前可重复下载）"""
+    artifact = export_jobs.get_artifact(job_id)
+    if artifact is None:
+        return jsonify({'success': False, 'message': '文件未生成或已过期'}), 404
+    path, filename, mimetype = artifact
+    return send_file(path, mimetype=mimetype, as_attachment=True, download_name=filename)
+
 # ==================================================================================
 
 
@@ -1207,6 +1468,7 @@ def handle_client_disconnect():
     """
     sid = request.sid
     camera_id = _client_camera_ids.pop(sid, None)
+    _serial_metrics_clients.discard(sid)
 
     # 清理推流线程记录
     _client_stream_threads.pop(sid, None)
@@ -1219,6 +1481,9 @@ def handle_client_disconnect():
                 if isinstance(cam, VirtualCameraService):
                     # 虚拟相机无需清理
                     pass
+                elif isinstance(cam, ReplayCameraService):
+                    # 回放相机停止回放
+                    cam.stop()
                 elif isinstance(cam, SDICameraService):
                     # SDI相机断开
                     cam.disconnect()
@@ -1230,6 +1495,33 @@ def handle_client_disconnect():
             print(f"Error cleaning up camera {camera_id} for client {sid}: {e}")
 
 
+def _push_serial_metrics():
+    """每秒向订阅的客户端推送串口收发统计，无订阅者时退出"""
+    global _serial_metrics_task
+    while _serial_metrics_clients:
+        socketio.emit('serial_metrics', {'rows': serial_metrics.summary()}, room=SERIAL_METRICS_ROOM)
+        socketio.sleep(1.0)
+    _serial_metrics_task = None
+
+
+@socketio.on('serial_metrics_subscribe')
+def handle_serial_metrics_subscribe():
+    """订阅串口收发统计推送"""
+    global _serial_metrics_task
+    join_room(SERIAL_METRICS_ROOM)
+    _serial_metrics_clients.add(request.sid)
+    emit('serial_metrics', {'rows': serial_metrics.summary()}, room=request.sid)
+    if _serial_metrics_task is None:
+        _serial_metrics_task = socketio.start_background_task(_push_serial_metrics)
+
+
+@socketio.on('serial_metrics_unsubscribe')
+def handle_serial_metrics_unsubscribe():
+    """取消订阅串口收发统计推送"""
+    leave_room(SERIAL_METRICS_ROOM)
+    _serial_metrics_clients.discard(request.sid)
+
+
 @socketio.on('camera_connect')
 def handle_camera_connect(data):
     """
@@ -1238,6 +1530,7 @@ def handle_camera_connect(data):
         - 1, 2: MvCamera真实相机
         - 3: SDI采集相机
         - 4: 虚拟相机（静态图像上传）
+        - 5: 回放相机，可选 replaySource/replayMode/replayFps/replayLoop 覆盖配置文件
     """
     try:
         camera_id = data.get('cameraId', 1)
@@ -1255,6 +1548,37 @@ def handle_camera_connect(data):
             }, room=request.sid)
             return
 
+        # 回放相机（相机5）：按配置打开回放源并开始回放
+        if isinstance(cam, ReplayCameraService):
+            entry = _get_camera_entry(int(camera_id))
+            source = data.get('replaySource', entry.get('replaySource', ''))
+            if source and not os.path.isabs(source):
+                source = os.path.join(os.getcwd(), source)
+            success, msg = cam.open(
+                source,
+                mode=data.get('replayMode', entry.get('replayMode', 'realtime')),
+                fps=data.get('replayFps', entry.get('replayFps', 10)),
+                loop=data.get('replayLoop', entry.get('replayLoop', False))
+            )
+            if success:
+                cam.setThreshold(entry.get('threshold', cam.getThreshold()))
+                success, msg = cam.start()
+            if not success:
+                emit('camera_error', {'success': False, 'message': msg, 'cameraId': int(camera_id)}, room=request.sid)
+                return
+
+            _client_camera_ids[request.sid] = int(camera_id)
+            _client_stream_threads[request.sid] = socketio.start_background_task(_stream_frames_to_client, cam, request.sid)
+
+            emit('camera_connected', {
+                'success': True,
+                'cameraId': int(camera_id),
+                'cameraType': 'replay',
+                'isVirtualCamera': True,
+                'message': msg
+            }, room=request.sid)
+            return
+
         # SDI相机（相机3）初始化和连接
         if isinstance(cam, SDICameraService):
             if not SDI_AVAILABLE:
@@ -1341,6 +1665,9 @@ def handle_camera_disconnect(data):
             if isinstance(cam, VirtualCameraService):
                 # 虚拟相机不需要断开连接
                 pass
+            elif isinstance(cam, ReplayCameraService):
+                # 回放相机停止回放
+                cam.stop()
             elif isinstance(cam, SDICameraService):
                 # SDI相机断开连接
                 cam.disconnect()
@@ -1382,8 +1709,8 @@ def handle_camera_set_param(data):
 
         cam = _get_camera_by_id(camera_id)
 
-        # 虚拟相机（相机4）只支持 threshold、medianKernelSize 和 imageMode
-        if isinstance(cam, VirtualCameraService):
+        # 虚拟相机（相机4）和回放相机（相机5）只支持 threshold、medianKernelSize 和 imageMode
+        if isinstance(cam, (VirtualCameraService, ReplayCameraService)):
             success = False
             message = ""
 
@@ -1399,7 +1726,7 @@ def handle_camera_set_param(data):
                 mode_str = "二值化图" if is_binary else "原始灰度图"
                 message = f"已切换至{mode_str}" if success else "切换显示模式失败"
             else:
-                message = f"虚拟相机不支持参数: {param_type}"
+                message = f"{'回放' if isinstance(cam, ReplayCameraService) else '虚拟'}相机不支持参数: {param_type}"
                 success = False
 
             if success:
@@ -1549,9 +1876,9 @@ def handle_camera_get_param(data):
         param_type = data.get('type')
 
         cam = _get_camera_by_id(camera_id)
-        is_virtual = isinstance(cam, VirtualCameraService)
+        is_virtual = isinstance(cam, (VirtualCameraService, ReplayCameraService))
 
-        # 虚拟相机只支持 threshold
+        # 虚拟相机和回放相机只支持 threshold
         if is_virtual:
             if param_type == 'threshold':
                 value = cam.getThreshold()
@@ -1631,8 +1958,14 @@ def handle_camera_get_param(data):
 
 # ============================ main function ========================================
 if __name__ == "__main__":
+    _init_services()
     try:
         print(f"Starting server at http://{SERVER_HOST}:{SERVER_PORT}")
+        # 调试模式下重载器的监视进程不处理请求，只在实际服务进程中抓包
+        if _app_config.get('serial', {}).get('capture', {}).get('enabled') and \
+                (not SERVER_DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+            print(f"Serial capture: {_start_serial_capture()['file']}")
         socketio.run(app, host=SERVER_HOST, port=SERVER_PORT, debug=SERVER_DEBUG)
     finally:
+        export_jobs.shutdown()
         MvCamera.MV_CC_Finalize()
\ No newline at end of file
@@ -0,0 +1,305 @@
+"""
+批量图像分析 - 使用进程池对大量静态图像并行计算质心
+
+验收测试每台设备会产生数百张采集图像，逐张通过 /api/virtual-camera/upload 上传
+需要浏览器依次驱动。这里将解码和质心计算分发到 ProcessPoolExecutor，
+按完成顺序逐张返回结果，并汇总统计、导出Excel/CSV。
+
+进程池使用 spawn 方式启动（与Windows行为一致，避免在多线程的Flask进程中fork），
+首次使用时创建并常驻，后续批次不再付出启动开销。
+spawn 方式下工作进程会以 __mp_main__ 重新执行主模块 app.py 的顶层代码：模块照常导入、路由照常注册，
+但相机SDK初始化、相机服务和串口日志后台线程都在 app.py 的 __main__ 分支（_init_services）中创建，
+数据库在首次访问时才建表迁移，因此工作进程不初始化硬件、不访问数据库，只执行 analyze_image。
+"""
+import csv
+import io
+import multiprocessing
+import os
+import statistics
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from core.imagePipeline import extract_centroid
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+
+# 导出表格的列: (结果字段, 表头)
+RESULT_COLUMNS = (
+    ('index', '序号'),
+    ('name', '文件名'),
+    ('width', '宽度'),
+    ('height', '高度'),
+    ('centroidX', '质心X(px)'),
+    ('centroidY', '质心Y(px)'),
+    ('spotArea', '光斑面积(px)'),
+    ('peak', '峰值灰度'),
+    ('elapsedMs', '耗时(ms)'),
+    ('success', '状态'),
+    ('message', '消息'),
+)
+
+
+def _init_worker():
+    # 每个进程单线程运行OpenCV，避免与进程池叠加造成过度订阅
+    cv2.setNumThreads(1)
+
+
+def analyze_image(index: int, name: str, path: str, threshold: int, median_kernel_size: int) -> dict:
+    """
+    解码并计算单张图像的质心（在工作进程中执行）
+
+    Args:
+        index: 图像在批次中的序号
+        name: 显示用文件名
+        path: 图像文件路径
+        threshold: 二值化阈值
+        median_kernel_size: 中值滤波核大小，0表示不滤波
+
+    Returns:
+        dict: 单张图像的分析结果
+    """
+    start = time.perf_counter()
+    result = {'index': index, 'name': name, 'success': False, 'message': '',
+              'width': 0, 'height': 0, 'centroidX': -1.0, 'centroidY': -1.0,
+              'spotArea': 0, 'peak': 0, 'elapsedMs': 0.0}
+    try:
+        # cv2.imread 不支持Windows中文路径，先读字节再解码
+        img = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            result['message'] = '无法解析图像文件'
+        else:
+            filtered, binary, cx, cy = extract_centroid(img, threshold, median_kernel_size)
+            result.update({
+                'success': True,
+                'message': '未检测到目标' if cx < 0 else '',
+                'width': int(img.shape[1]),
+                'height': int(img.shape[0]),
+                'centroidX': round(float(cx), 3),
+                'centroidY': round(float(cy), 3),
+                'spotArea': int(cv2.countNonZero(binary)),
+                'peak': int(filtered.max()),
+            })
+    except Exception as e:
+        result['message'] = str(e)
+    result['elapsedMs'] = round((time.perf_counter() - start) * 1000.0, 2)
+    return result
+
+
+def list_images(directory: str, recursive: bool = False) -> List[str]:
+    """列出目录中的图像文件（按路径排序）"""
+    if recursive:
+        paths = [os.path.join(root, name)
+                 for root, _, names in os.walk(directory) for name in names]
+    else:
+        paths = [os.path.join(directory, name) for name in os.listdir(directory)]
+    return sorted(p for p in paths if p.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(p))
+
+
+def summarize(results: List[dict], elapsed: float = 0.0) -> dict:
+    """汇总批次结果：成功/失败数、质心统计和吞吐量"""
+    ok = [r for r in results if r['success']]
+    found = [r for r in ok if r['centroidX'] >= 0 and r['centroidY'] >= 0]
+
+    def _stats(key: str) -> dict:
+        values = [r[key] for r in found]
+        if not values:
+            return {'mean': None, 'std': None, 'min': None, 'max': None}
+        return {
+            'mean': round(statistics.fmean(values), 3),
+            'std': round(statistics.pstdev(values), 3),
+            'min': round(min(values), 3),
+            'max': round(max(values), 3),
+        }
+
+    return {
+        'total': len(results),
+        'succeeded': len(ok),
+        'failed': len(results) - len(ok),
+        'noTarget': len(ok) - len(found),
+        'centroidX': _stats('centroidX'),
+        'centroidY': _stats('centroidY'),
+        'elapsed': round(elapsed, 3),
+        'imagesPerSecond': round(len(results) / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+
+
+class BatchAnalyzer:
+    """
+    批量分析器 - 管理常驻进程池并保留最近几个批次的结果供导出
+    """
+
+    MAX_BATCHES = 10  # 内存中保留的批次数
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._batches: "OrderedDict[str, dict]" = OrderedDict()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                )
+            return self._executor
+
+    def shutdown(self):
+        """关闭进程池"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def run(self, items: Iterable[Tuple[str, str]], threshold: int,
+            median_kernel_size: int = 0) -> Iterator[dict]:
+        """
+        并行分析一批图像，按完成顺序逐张产生结果
+
+        第一个产出为 {'type': 'start', ...}，之后每张图像一个 {'type': 'result', ...}，
+        最后为 {'type': 'summary', ...}。
+
+        Args:
+            items: (显示名, 文件路径) 序列
+            threshold: 二值化阈值
+            median_kernel_size: 中值滤波核大小
+
+        Yields:
+            dict: 进度事件
+        """
+        items = list(items)
+        batch_id = datetime.now().strftime('%Y%m%d_%H%M%S_') + uuid.uuid4().hex[:6]
+        batch = {
+            'batchId': batch_id,
+            'createdAt': datetime.now().isoformat(timespec='seconds'),
+            'threshold': int(threshold),
+            'medianKernelSize': int(median_kernel_size),
+            'results': [],
+            'summary': None,
+        }
+        with self._lock:
+            self._batches[batch_id] = batch
+            while len(self._batches) > self.MAX_BATCHES:
+                self._batches.popitem(last=False)
+
+        yield {'type': 'start', 'batchId': batch_id, 'total': len(items), 'workers': self.max_workers}
+
+        start = time.perf_counter()
+        executor = self._get_executor()
+        futures = {
+            executor.submit(analyze_image, i, name, path, int(threshold), int(median_kernel_size)): i
+            for i, (name, path) in enumerate(items)
+        }
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # 工作进程异常退出等情况，进程池损坏后下个批次重新创建
+                    if isinstance(e, BrokenProcessPool):
+                        self.shutdown()
+                    i = futures[future]
+                    result = {'index': i, 'name': items[i][0], 'success': False, 'message': str(e),
+                              'width': 0, 'height': 0, 'centroidX': -1.0, 'centroidY': -1.0,
+                              'spotArea': 0, 'peak': 0, 'elapsedMs': 0.0}
+                batch['results'].append(result)
+                yield {'type': 'result', 'done': done, 'total': len(items), **result}
+        finally:
+            # 客户端中途断开时取消尚未开始的任务
+            for future in futures:
+                future.cancel()
+
+        batch['results'].sort(key=lambda r: r['index'])
+        batch['summary'] = summarize(batch['results'], time.perf_counter() - start)
+        yield {'type': 'summary', 'batchId': batch_id, **batch['summary']}
+
+    def get_batch(self, batch_id: str) -> Optional[dict]:
+        """获取已完成(或进行中)批次的结果"""
+        with self._lock:
+            return self._batches.get(batch_id)
+
+    def export_csv(self, batch_id: str) -> Optional[bytes]:
+        """导出批次结果为CSV (UTF-8 BOM，Excel可直接打开)"""
+        batch = self.get_batch(batch_id)
+        if batch is None:
+            return None
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow([header for _, header in RESULT_COLUMNS])
+        for r in batch['results']:
+            writer.writerow([self._cell(r, key) for key, _ in RESULT_COLUMNS])
+        return ('\ufeff' + output.getvalue()).encode('utf-8')
+
+    def export_excel(self, batch_id: str) -> Optional[bytes]:
+        """导出批次结果为Excel（结果表 + 汇总表），需要openpyxl"""
+        import openpyxl
+        from openpyxl.styles import Font, Alignment
+
+        batch = self.get_batch(batch_id)
+        if batch is None:
+            return None
+
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.title = '分析结果'
+        for col, (_, header) in enumerate(RESULT_COLUMNS, 1):
+            cell = ws.cell(row=1, column=col, value=header)
+            cell.font = Font(bold=True)
+            cell.alignment = Alignment(horizontal='center')
+        for row, r in enumerate(batch['results'], 2):
+            for col, (key, _) in enumerate(RESULT_COLUMNS, 1):
+                ws.cell(row=row, column=col, value=self._cell(r, key))
+        column_widths = [8, 36, 10, 10, 14, 14, 14, 10, 12, 8, 30]
+        for col, width in enumerate(column_widths, 1):
+            ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = width
+
+        summary = batch['summary'] or summarize(batch['results'])
+        ws2 = wb.create_sheet('汇总')
+        rows = [
+            ('批次', batch['batchId']),
+            ('时间', batch['createdAt']),
+            ('二值化阈值', batch['threshold']),
+            ('中值滤波核', batch['medianKernelSize']),
+            ('图像总数', summary['total']),
+            ('成功', summary['succeeded']),
+            ('失败', summary['failed']),
+            ('未检测到目标', summary['noTarget']),
+        ]
+        for axis in ('centroidX', 'centroidY'):
+            label = '质心X' if axis == 'centroidX' else '质心Y'
+            for key, name in (('mean', '均值'), ('std', '标准差'), ('min', '最小值'), ('max', '最大值')):
+                rows.append((f'{label}{name}(px)', summary[axis][key]))
+        rows.append(('总耗时(s)', summary['elapsed']))
+        for row, (label, value) in enumerate(rows, 1):
+            ws2.cell(row=row, column=1, value=label).font = Font(bold=True)
+            ws2.cell(row=row, column=2, value=value)
+        ws2.column_dimensions['A'].width = 20
+        ws2.column_dimensions['B'].width = 30
+
+        output = io.BytesIO()
+        wb.save(output)
+        return output.getvalue()
+
+    @staticmethod
+    def _cell(result: dict, key: str):
+        value = result.get(key)
+        if key == 'success':
+            return '成功' if value else '失败'
+        if key in ('centroidX', 'centroidY') and value is not None and value < 0:
+            return None  # 无目标
+        return value
+
+
+# 全局批量分析器实例
+batch_analyzer = BatchAnalyzer()
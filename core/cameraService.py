@@ -3,13 +3,23 @@ import sys
 import time
 import threading
 import cv2
-import base64
 import queue
 import numpy as np
-from collections import deque
+from collections import deque, OrderedDict
 from ctypes import *
-sys.path.append(os.getenv('MVCAM_COMMON_RUNENV') + "/Samples/python/MvImport")
-from MvCameraControl_class import *  # type: ignore
+from core.imagePipeline import extract_centroid, encode_data_url, lap_timing
+from core.frameRecorder import FrameRecorder, RecentFrames
+from core.batchAnalysis import batch_analyzer
+
+# MvCamera SDK 仅在安装了MVS的机器上可用；缺失时仍可使用虚拟相机和离线基准测试
+try:
+    sys.path.append(os.getenv('MVCAM_COMMON_RUNENV', '') + "/Samples/python/MvImport")
+    from MvCameraControl_class import *  # type: ignore
+    MVS_AVAILABLE = True
+except ImportError as e:
+    print(f"[Camera Service] Warning: Could not import MvCamera SDK: {e}")
+    MVS_AVAILABLE = False
+    MV_GIGE_DEVICE = 0x00000001
 
 
 class CameraService:
@@ -40,6 +50,8 @@ class CameraService:
         self.return_binary_image = False
         self.frame_queue = deque(maxlen=2)
         self.hThreadHandle = None
+        self.recorder = None  # 原始帧录制器，None表示未录制
+        self.recent_frames = RecentFrames()  # 最近原始帧，保存测试记录时按帧号取回
 
     def setCameraIp(self, ip: str):
         """设置相机IP地址"""
@@ -256,6 +268,7 @@ class CameraService:
         
         # MvCamera.MV_CC_Finalize()
         self.cam = None
+        self.stopRecording()
         return True
 
     def work_thread(self, pData=0, nDataSize=0):
@@ -302,6 +315,11 @@ class CameraService:
                     frame_data = self.centroidExtract(img, stOutFrame.stFrameInfo.nFrameNum)
                     if frame_data:
                         self.frame_queue.append(frame_data)
+                        raw = self._rawFrame(stOutFrame, img)
+                        self.recent_frames.put(raw, stOutFrame.stFrameInfo.nFrameNum)
+                        recorder = self.recorder
+                        if recorder is not None:
+                            self._recordFrame(recorder, stOutFrame, raw, frame_data)
                     else:
                         print("error: frame_data is None!")
 
@@ -318,6 +336,41 @@ class CameraService:
                 print (f"GetImageBuffer failed: ret[0x{ret:x}]")
                 time.sleep(0.01)
 
+    def _rawFrame(self, stOutFrame, img):
+        """原始帧：Mono10/12/16 返回相机缓冲区的16位数据视图，其余格式返回Mono8图像"""
+        stFrameInfo = stOutFrame.stFrameInfo
+        if stFrameInfo.enPixelType in (PixelType_Gvsp_Mono10, PixelType_Gvsp_Mono12, PixelType_Gvsp_Mono16):
+            pData16 = cast(stOutFrame.pBufAddr, POINTER(c_ushort))
+            return np.ctypeslib.as_array(pData16, shape=(stFrameInfo.nHeight, stFrameInfo.nWidth))
+        return img
+
+    # 16位原始帧的有效位数，写入录制文件头，回放时据此转换为Mono8
+    _PIXEL_BITS = {PixelType_Gvsp_Mono10: 10, PixelType_Gvsp_Mono12: 12, PixelType_Gvsp_Mono16: 16}
+
+    def _recordFrame(self, recorder, stOutFrame, frame, frame_data):
+        """写入录制文件：Mono10/12/16 保存原始16位数据（并记录有效位数），其余格式保存Mono8图像"""
+        stFrameInfo = stOutFrame.stFrameInfo
+        device_ts = (stFrameInfo.nDevTimeStampHigh << 32) | stFrameInfo.nDevTimeStampLow
+        recorder.write(frame, stFrameInfo.nFrameNum, device_ts,
+                       frame_data['centroidX'], frame_data['centroidY'],
+                       pixel_bits=self._PIXEL_BITS.get(stFrameInfo.enPixelType, 8))
+
+    def startRecording(self, path: str, capacity: int = 300) -> bool:
+        """开始录制原始帧到内存映射文件（已在录制则先停止）"""
+        self.stopRecording()
+        self.recorder = FrameRecorder(path, capacity)
+        return True
+
+    def stopRecording(self) -> dict:
+        """停止录制，返回录制统计（未录制返回None）"""
+        recorder, self.recorder = self.recorder, None
+        return recorder.close() if recorder is not None else None
+
+    def getRecordingStatus(self) -> dict:
+        """获取录制状态（未录制返回None）"""
+        recorder = self.recorder
+        return recorder.get_status() if recorder is not None else None
+
     def setAcquisitionFrameRate(self, rate):
         ret = self.cam.MV_CC_SetBoolValue("AcquisitionFrameRateEnable", True)
         if ret != 0:
@@ -395,7 +448,7 @@ class CameraService:
     def getMedianKernelSize(self):
         return self.median_kernel_size
 
-    def centroidExtract(self, gray_image: np.ndarray, frame_num: int) -> dict:
+    def centroidExtract(self, gray_image: np.ndarray, frame_num: int, timings: dict = None) -> dict:
         """
         提取图像质心并编码为JPEG
 
@@ -405,34 +458,17 @@ class CameraService:
         Args:
             gray_image: 灰度图像 (Mono8)
             frame_num: 帧编号
+            timings: 阶段耗时字典（可选，基准测试使用）
 
         Returns:
             dict: 包含图像base64、尺寸、质心坐标等信息，失败返回None
         """
-        # 应用中值滤波（如果设置了）
-        if self.median_kernel_size > 0:
-            gray_image = cv2.medianBlur(gray_image, self.median_kernel_size)
-
-        th = int(self.threshold)
-        _, binary = cv2.threshold(gray_image, th, 255, cv2.THRESH_BINARY)
-
-        # 创建掩码图像：阈值以下像素设为0，保留原始灰度值用于加权计算
-        # 使用cv2.moments()计算强度加权质心，C优化比numpy循环更快
-        masked = np.where(binary > 0, gray_image, 0).astype(np.float64)
-        M = cv2.moments(masked)
-
-        if M["m00"] > 0:
-            cx = M["m10"] / M["m00"]
-            cy = M["m01"] / M["m00"]
-        else:
-            cx, cy = -1.0, -1.0
+        gray_image, binary, cx, cy = extract_centroid(
+            gray_image, self.threshold, self.median_kernel_size, timings=timings)
 
         target_image = binary if self.return_binary_image else gray_image
-        ok, buf = cv2.imencode('.jpg', target_image)
-        if ok:
-            image_base64 = base64.b64encode(buf.tobytes()).decode('ascii')
-        else:
-            image_base64 = ''
+        image_url = encode_data_url(target_image, timings=timings)
+        if image_url is None:
             print("error: encode fail!")
             return None
 
@@ -440,7 +476,7 @@ class CameraService:
         cam_id = int(self.nConnectionNum) + 1
 
         frame_data = {
-            'image': f'data:image/jpeg;base64,{image_base64}',
+            'image': image_url,
             'width': int(nWidth),
             'height': int(nHeight),
             'centroidX': float(cx),
@@ -460,6 +496,10 @@ class CameraService:
     def getLatestFrame(self):
         return self.frame_queue.pop() if self.frame_queue else None
 
+    def getRawFrame(self, frame_num: int = None):
+        """按帧号取回最近的原始帧 (uint8 或 uint16)，已被覆盖时返回None"""
+        return self.recent_frames.get(frame_num)
+
     # ======================== 高级参数设置方法 ========================
 
     def getWidth(self) -> int:
@@ -722,6 +762,32 @@ class CameraService:
         return True
 
 
+class _LRUCache:
+    """按最近使用顺序淘汰的简单缓存"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def get(self, key):
+        if key not in self._data:
+            return None
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
 class VirtualCameraService:
     """
     虚拟相机服务类 - 用于静态图像上传和分析
@@ -729,6 +795,10 @@ class VirtualCameraService:
     不连接实际硬件，允许用户上传本地图像文件进行质心计算等分析。
     """
 
+    MEDIAN_CACHE_SIZE = 4       # 每项为一张完整灰度图
+    CENTROID_CACHE_SIZE = 256   # 每项只有质心坐标
+    ENCODE_CACHE_SIZE = 8       # 每项为一个JPEG data URL
+
     def __init__(self, camera_id: int = 3):
         """
         初始化虚拟相机服务
@@ -742,36 +812,57 @@ class VirtualCameraService:
         self.median_kernel_size = 0  # 中值滤波核大小，0表示不滤波
         self.return_binary_image = False
         self.current_image = None
+        self.current_image_frame_num = 0  # 当前图像上传时的帧号，之后的帧号都对应该图像
         self.frame_queue = deque(maxlen=2)
         self.frame_num = 0
         self.cam = None  # 用于兼容性检查
+        self.recorder = None  # 原始帧录制器，None表示未录制
 
-    def uploadImage(self, image_data: bytes, filename: str = "") -> dict:
+        # 分级缓存：中值滤波结果(按核大小) → 质心(按核大小+阈值) → 编码后的显示图像
+        # 拖动阈值滑块时只需重新计算矩；显示图像不变(原图模式)时不重新编码
+        self._median_cache = _LRUCache(self.MEDIAN_CACHE_SIZE)
+        self._centroid_cache = _LRUCache(self.CENTROID_CACHE_SIZE)
+        self._encode_cache = _LRUCache(self.ENCODE_CACHE_SIZE)
+        self._cache_lock = threading.Lock()
+
+    def uploadImage(self, image_data: bytes, filename: str = "", timings: dict = None) -> dict:
         """
         上传图像文件
 
         Args:
             image_data: 图像二进制数据
             filename: 文件名
+            timings: 阶段耗时字典（可选，基准测试使用）
 
         Returns:
             dict: 包含处理结果的字典
         """
         try:
             # 从字节数据解码图像
+            t = time.perf_counter() if timings is not None else 0.0
             nparr = np.frombuffer(image_data, np.uint8)
             img = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
+            if timings is not None:
+                lap_timing(timings, 'decode', t)
 
             if img is None:
                 return {'success': False, 'message': '无法解析图像文件'}
 
-            self.current_image = img
+            with self._cache_lock:
+                self.current_image = img
+                self._median_cache.clear()
+                self._centroid_cache.clear()
+                self._encode_cache.clear()
             self.frame_num += 1
+            self.current_image_frame_num = self.frame_num
 
             # 计算质心并生成帧数据
-            frame_data = self.centroidExtract(img, self.frame_num)
+            frame_data = self._processCurrentImage(self.frame_num, timings=timings)
             if frame_data:
                 self.frame_queue.append(frame_data)
+                recorder = self.recorder
+                if recorder is not None:
+                    recorder.write(img, self.frame_num, 0, frame_data['centroidX'], frame_data['centroidY'])
                 return {'success': True, 'message': '图像上传成功', 'frameData': frame_data}
             else:
                 return {'success': False, 'message': '图像处理失败'}
@@ -779,37 +870,22 @@ class VirtualCameraService:
         except Exception as e:
             return {'success': False, 'message': f'上传失败: {str(e)}'}
 
-    def centroidExtract(self, gray_image: np.ndarray, frame_num: int) -> dict:
+    def centroidExtract(self, gray_image: np.ndarray, frame_num: int, timings: dict = None) -> dict:
         """
         提取图像质心并编码为JPEG (与CameraService保持一致)
         """
-        # 应用中值滤波（如果设置了）
-        if self.median_kernel_size > 0:
-            gray_image = cv2.medianBlur(gray_image, self.median_kernel_size)
-
-        th = int(self.threshold)
-        _, binary = cv2.threshold(gray_image, th, 255, cv2.THRESH_BINARY)
-
-        masked = np.where(binary > 0, gray_image, 0).astype(np.float64)
-        M = cv2.moments(masked)
-
-        if M["m00"] > 0:
-            cx = M["m10"] / M["m00"]
-            cy = M["m01"] / M["m00"]
-        else:
-            cx, cy = -1.0, -1.0
+        gray_image, binary, cx, cy = extract_centroid(
+            gray_image, self.threshold, self.median_kernel_size, timings=timings)
 
         target_image = binary if self.return_binary_image else gray_image
-        ok, buf = cv2.imencode('.jpg', target_image)
-        if ok:
-            image_base64 = base64.b64encode(buf.tobytes()).decode('ascii')
-        else:
+        image_url = encode_data_url(target_image, timings=timings)
+        if image_url is None:
             return None
 
         nHeight, nWidth = gray_image.shape[:2]
 
         frame_data = {
-            'image': f'data:image/jpeg;base64,{image_base64}',
+            'image': image_url,
             'width': int(nWidth),
             'height': int(nHeight),
             'centroidX': float(cx),
@@ -820,6 +896,84 @@ class VirtualCameraService:
 
         return frame_data
 
+    def _processCurrentImage(self, frame_num: int, timings: dict = None) -> dict:
+        """
+        使用分级缓存处理当前图像，结果与 centroidExtract 一致
+
+        只计算缓存中缺失的阶段：核大小变化才重新滤波，阈值变化只重新二值化和计算矩，
+        显示图像（原图按核大小、二值图按核大小+阈值）未变化时复用已编码的JPEG。
+        """
+        with self._cache_lock:
+            img = self.current_image
+            if img is None:
+                return None
+            ksize, threshold = self.median_kernel_size, self.threshold
+            t = time.perf_counter() if timings is not None else 0.0
+
+            filtered = self._median_cache.get(ksize)
+            if filtered is None:
+                filtered = cv2.medianBlur(img, ksize) if ksize > 0 else img
+                self._median_cache.put(ksize, filtered)
+            if timings is not None:
+                lap_timing(timings, 'median', t)
+
+            binary = None
+            centroid = self._centroid_cache.get((ksize, threshold))
+            if centroid is None:
+                _, binary, cx, cy = extract_centroid(filtered, threshold, 0, timings=timings)
+                self._centroid_cache.put((ksize, threshold), (cx, cy))
+            else:
+                cx, cy = centroid
+
+            display_key = ('binary', ksize, threshold) if self.return_binary_image else ('gray', ksize)
+            image_url = self._encode_cache.get(display_key)
+            if image_url is None:
+                if self.return_binary_image:
+                    if binary is None:
+                        _, binary = cv2.threshold(filtered, int(threshold), 255, cv2.THRESH_BINARY)
+                    target_image = binary
+                else:
+                    target_image = filtered
+                image_url = encode_data_url(target_image, timings=timings)
+                if image_url is None:
+                    return None
+                self._encode_cache.put(display_key, image_url)
+
+        nHeight, nWidth = img.shape[:2]
+
+        return {
+            'image': image_url,
+            'width': int(nWidth),
+            'height': int(nHeight),
+            'centroidX': float(cx),
+            'centroidY': float(cy),
+            'frameNum': int(frame_num),
+            'cameraId': self.camera_id
+        }
+
+    def getRawFrame(self, frame_num: int = None):
+        """
+        按帧号取回原始帧
+
+        参数变化只会重新处理同一张图像，因此当前图像上传之后的帧号都返回该图像；
+        更早的帧号对应已被替换的图像，返回None。
+        """
+        with self._cache_lock:
+            img = self.current_image
+            if img is None:
+                return None
+            if frame_num is not None and not self.current_image_frame_num <= int(frame_num) <= self.frame_num:
+                return None
+            return img.copy()
+
+    def _refreshCurrentImage(self):
+        """参数变化后重新处理当前图像（没有图像时不处理）"""
+        if self.current_image is not None:
+            self.frame_num += 1
+            frame_data = self._processCurrentImage(self.frame_num)
+            if frame_data:
+                self.frame_queue.append(frame_data)
+
     def setThreshold(self, threshold: int) -> bool:
         """设置二值化阈值"""
         threshold = int(threshold)
@@ -829,11 +983,7 @@ class VirtualCameraService:
             threshold = 255
         self.threshold = threshold
         # 如果有当前图像，重新处理
-        if self.current_image is not None:
-            self.frame_num += 1
-            frame_data = self.centroidExtract(self.current_image, self.frame_num)
-            if frame_data:
-                self.frame_queue.append(frame_data)
+        self._refreshCurrentImage()
         return True
 
     def getThreshold(self) -> int:
@@ -851,11 +1001,7 @@ class VirtualCameraService:
             size = 31  # 限制最大值
         self.median_kernel_size = size
         # 如果有当前图像，重新处理
-        if self.current_image is not None:
-            self.frame_num += 1
-            frame_data = self.centroidExtract(self.current_image, self.frame_num)
-            if frame_data:
-                self.frame_queue.append(frame_data)
+        self._refreshCurrentImage()
         return True
 
     def getMedianKernelSize(self) -> int:
@@ -866,24 +1012,54 @@ class VirtualCameraService:
         """设置是否返回二值化图像"""
         self.return_binary_image = bool(is_binary)
         # 如果有当前图像，重新处理
-        if self.current_image is not None:
-            self.frame_num += 1
-            frame_data = self.centroidExtract(self.current_image, self.frame_num)
-            if frame_data:
-                self.frame_queue.append(frame_data)
+        self._refreshCurrentImage()
         return True
 
     def getLatestFrame(self) -> dict:
         """获取最新帧"""
         return self.frame_queue.pop() if self.frame_queue else None
 
+    def startRecording(self, path: str, capacity: int = 300) -> bool:
+        """开始录制上传的图像到内存映射文件（已在录制则先停止）"""
+        self.stopRecording()
+        self.recorder = FrameRecorder(path, capacity)
+        return True
+
+    def stopRecording(self) -> dict:
+        """停止录制，返回录制统计（未录制返回None）"""
+        recorder, self.recorder = self.recorder, None
+        return recorder.close() if recorder is not None else None
+
+    def getRecordingStatus(self) -> dict:
+        """获取录制状态（未录制返回None）"""
+        recorder = self.recorder
+        return recorder.get_status() if recorder is not None else None
+
+    def analyzeBatch(self, items, threshold: int = None, median_kernel_size: int = None):
+        """
+        使用进程池并行分析一批图像（不改变当前显示的图像）
+
+        Args:
+            items: (显示名, 文件路径) 序列
+            threshold: 二值化阈值 (None 使用当前阈值)
+            median_kernel_size: 中值滤波核大小 (None 使用当前设置)
+
+        Returns:
+            生成器，按完成顺序产生 start / result / summary 事件
+        """
+        if threshold is None:
+            threshold = self.threshold
+        if median_kernel_size is None:
+            median_kernel_size = self.median_kernel_size
+        return batch_analyzer.run(items, threshold, median_kernel_size)
+
     def reprocessImage(self) -> dict:
         """重新处理当前图像 (用于参数变更后)"""
         if self.current_image is None:
             return {'success': False, 'message': '没有已上传的图像'}
 
         self.frame_num += 1
-        frame_data = self.centroidExtract(self.current_image, self.frame_num)
+        frame_data = self._processCurrentImage(self.frame_num)
         if frame_data:
             self.frame_queue.append(frame_data)
             return {'success': True, 'frameData': frame_data}
@@ -1,15 +1,140 @@
+import asyncio
+import inspect
+import itertools
 import json
+import os
+import queue
+import string
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, TimeoutError as FutureTimeoutError
 from pathlib import Path
-from typing import Any, Dict, Optional, Tuple, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 from .serialService import serial_service
+from .serialFramer import EchoLengthFramer, FixedLengthFramer, TerminatorFramer
 from .databaseService import db_service
+from .serialMetrics import serial_metrics
+
+
+# 指令优先级（数值越小越先执行）
+PRIORITY_EMERGENCY = 0   # 急停
+PRIORITY_MOTION = 1      # 运动控制
+PRIORITY_NORMAL = 2      # 一般设置
+PRIORITY_STATUS = 3      # 状态轮询
+
+
+class _DeviceWorker:
+    """
+    单个设备的指令执行线程
+
+    指令按 (优先级, 提交顺序) 排队，同一设备的指令串行执行，不同设备的线程互不阻塞。
+    正在执行的指令不会被打断，急停指令在下一个空档优先执行。
+    """
+
+    def __init__(self, device: str):
+        self.device = device
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._thread = threading.Thread(target=self._run, name=f"command-{device}", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn: Callable, priority: int) -> Future:
+        # 入队前转换为整数：无法比较的优先级进入堆后，出队时才报错
+        priority = int(priority)
+        future: Future = Future()
+        self._queue.put((priority, next(self._seq), fn, future))
+        return future
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            try:
+                _, _, fn, future = self._queue.get()
+            except Exception as e:
+                # 队列异常不能结束线程，否则该设备之后的指令都无人执行
+                print(f"[CommandService] {self.device} 指令队列出队失败: {e}")
+                continue
+            if fn is None:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+
+    def stop(self):
+        # 排在所有指令之后
+        self._queue.put((float('inf'), next(self._seq), None, None))
+
+
+class CommandPlan:
+    """
+    单条指令的预编译执行计划
+
+    配置加载时由模板生成：参数列表、编码函数、解码函数、是否验证返回值和帧判定器，
+    发送时不再解析模板前缀或按名称查找编解码方法。模板有误时 error 记录错误信息。
+    """
+
+    __slots__ = ('device', 'cmd', 'template', 'fields', 'encoder', 'decoder', 'verify', 'framer', 'error')
+
+    def __init__(self, device: str, cmd: str, template: Any, fields: Tuple[str, ...] = (),
+                 encoder: Optional[Callable[[Dict[str, Any], str], bytes]] = None,
+                 decoder: Optional[Callable[[bytes, bytes], Dict]] = None,
+                 verify: bool = False, framer=None, error: Optional[str] = None):
+        self.device = device
+        self.cmd = cmd
+        self.template = template
+        self.fields = fields        # 必填参数名
+        self.encoder = encoder      # (params, encoding) -> bytes
+        self.decoder = decoder      # (cmd_bytes, response) -> dict
+        self.verify = verify        # 工作模式下是否验证返回值
+        self.framer = framer        # 响应帧判定器，None 按空闲超时判定
+        self.error = error
+
+    def build(self, params: Dict[str, Any], encoding: str = "utf-8") -> bytes:
+        """按参数生成指令字节"""
+        missing = [name for name in self.fields if name not in params]
+        if missing:
+            raise ValueError(f"缺少参数: {', '.join(missing)}")
+        return self.encoder(params, encoding)
 
 
 class CommandService:
     # 需要验证返回值的设备列表
     DEVICES_REQUIRE_RESPONSE_CHECK = ["light_source", "delay_module"]
 
+    # 响应帧格式，收到完整帧即返回；未列出的设备按 idle_timeout_ms 空闲超时判定
+    DEVICE_FRAMERS = {
+        "light_source": EchoLengthFramer(),          # 功率设置原样回显
+        "three_axis_motor": TerminatorFramer(b"\r"),
+        "delay_module": FixedLengthFramer(5),        # aa bb cc dd 0x
+    }
+    # 按指令覆盖设备的帧格式
+    COMMAND_FRAMERS = {
+        ("light_source", "set_blackbody_temperature"): TerminatorFramer(b"#"),  # *XXXXXXHYYYYYY#
+    }
+
+    # 运动控制设备，指令默认使用 PRIORITY_MOTION
+    MOTION_DEVICES = ["three_axis_motor", "rail_motor"]
+
+    # 配置文件修改检查间隔（秒），发送指令时最多每隔这么久检查一次文件修改时间
+    RELOAD_CHECK_INTERVAL = 1.0
+
+    # 同步发送时等待结果的余量（秒）：指令超时之外，还要等待队列中排在前面的指令和串口重连
+    RESULT_WAIT_MARGIN = 10.0
+
+    # 指令序列上限：步骤数、各步骤重复次数之和（单个请求不能长时间占用设备队列）
+    MAX_BATCH_STEPS = 200
+    MAX_BATCH_COMMANDS = 2000
+    # 单个步骤的响应超时(秒)、重复间隔和步骤后等待(毫秒)上限，整个序列的最长执行时间(秒)
+    MAX_STEP_TIMEOUT = 30.0
+    MAX_STEP_WAIT_MS = 60000.0
+    MAX_BATCH_SECONDS = 600.0
+
     def __init__(
         self,
         config_path: Optional[Path] = None,
@@ -19,6 +144,12 @@ class CommandService:
     ) -> None:
         self._config_cache: Optional[Dict[str, Dict[str, str]]] = None
         self._app_config_cache: Optional[Dict[str, Any]] = None
+        # 预编译的指令计划 {(device, cmd): CommandPlan}，配置文件变化时整体替换
+        self._plans: Optional[Dict[Tuple[str, str], CommandPlan]] = None
+        self._serial_settings: Dict[str, Any] = {}
+        self._mtimes: Optional[Tuple[float, float]] = None
+        self._last_check = 0.0
+        self._reload_lock = threading.Lock()
         self._config_path: Path = (
             config_path
             if config_path is not None
@@ -30,39 +161,141 @@ class CommandService:
             else Path(__file__).resolve().parent.parent / "config" / "app_config.json"
         )
         self._serial = serial
+        self._workers: Dict[str, _DeviceWorker] = {}
+        self._workers_lock = threading.Lock()
+        if hasattr(self._serial, 'set_heartbeat_provider'):
+            self._serial.set_heartbeat_provider(self._heartbeat)
+
+    # ===================== 配置加载与预编译 =====================
+    @staticmethod
+    def _mtime(path: Path) -> float:
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return 0.0
+
+    def _refresh(self) -> None:
+        """配置文件修改时间变化时重新加载并编译（最多每 RELOAD_CHECK_INTERVAL 秒检查一次）"""
+        now = time.monotonic()
+        if self._plans is not None and now - self._last_check < self.RELOAD_CHECK_INTERVAL:
+            return
+        with self._reload_lock:
+            self._last_check = now
+            mtimes = (self._mtime(self._config_path), self._mtime(self._app_config_path))
+            if self._plans is not None and mtimes == self._mtimes:
+                return
+            self._reload(mtimes)
+
+    def reload(self) -> Dict[str, str]:
+        """立即重新加载配置，返回模板错误 {"device.cmd": 错误信息}"""
+        with self._reload_lock:
+            self._last_check = time.monotonic()
+            self._reload((self._mtime(self._config_path), self._mtime(self._app_config_path)))
+        return self.get_plan_errors()
+
+    def _reload(self, mtimes: Tuple[float, float]) -> None:
+        try:
+            with open(self._config_path, "r", encoding="utf-8") as f:
+                config = json.load(f)
+        except Exception as e:
+            # 文件正在写入等情况，保留已有计划，下次检查时重试
+            print(f"[CommandService] Warning: 加载指令配置失败: {e}")
+            if self._plans is None:
+                self._config_cache, self._plans = {}, {}
+            self._mtimes = None
+            return
+        try:
+            with open(self._app_config_path, "r", encoding="utf-8") as f:
+                app_config = json.load(f)
+        except Exception:
+            app_config = {}
+
+        plans = {}
+        for device, commands in config.items():
+            if not isinstance(commands, dict):
+                continue
+            for cmd, template in commands.items():
+                plan = self._compile(device, cmd, template)
+                if plan.error:
+                    print(f"[CommandService] Warning: {device}.{cmd}: {plan.error}")
+                plans[(device, cmd)] = plan
+
+        self._config_cache = config
+        self._app_config_cache = app_config
+        self._serial_settings = app_config.get("serial", {})
+        self._plans = plans
+        self._mtimes = mtimes
+
+    def _compile(self, device: str, cmd: str, template: Any) -> CommandPlan:
+        """将一条指令模板编译为执行计划"""
+        decoder = getattr(self, f"_decode_{device}_{cmd}", None)
+        plan = CommandPlan(device, cmd, template, decoder=decoder,
+                           verify=decoder is not None and device in self.DEVICES_REQUIRE_RESPONSE_CHECK,
+                           framer=self.get_framer(device, cmd))
+        try:
+            if template == "dynamic":
+                encoder_name = f"_encode_{device}_{cmd}"
+                method = getattr(self, encoder_name, None)
+                if method is None:
+                    plan.error = f"动态指令编码方法未找到: {encoder_name}"
+                    return plan
+                plan.fields = tuple(
+                    name for name, p in inspect.signature(method).parameters.items()
+                    if p.default is inspect.Parameter.empty and p.kind in (p.POSITIONAL_OR_KEYWORD, p.KEYWORD_ONLY))
+                plan.encoder = lambda params, encoding, _m=method: _m(**params)
+            elif isinstance(template, str) and template[:1] in ("f", "h"):
+                body = template[1:]
+                # 解析格式字段，模板中的花括号错误在此处暴露
+                plan.fields = tuple(dict.fromkeys(
+                    name.split(".")[0].split("[")[0]
+                    for _, name, _, _ in string.Formatter().parse(body) if name))
+                is_hex = template[0] == "h"
+                if not plan.fields:
+                    # 无参数指令预先生成字节
+                    body = body.format()
+                    const = bytes.fromhex(body) if is_hex else body.encode("utf-8")
+                    plan.encoder = lambda params, encoding, _c=const, _b=body, _h=is_hex: (
+                        _c if _h or encoding == "utf-8" else _b.encode(encoding, errors="strict"))
+                elif is_hex:
+                    plan.encoder = lambda params, encoding, _b=body: bytes.fromhex(_b.format(**params))
+                else:
+                    plan.encoder = lambda params, encoding, _b=body: _b.format(**params).encode(encoding, errors="strict")
+            elif isinstance(template, str):
+                plan.encoder = lambda params, encoding, _t=template: _t.encode(encoding, errors="strict")
+            else:
+                plan.error = f"指令模板格式错误: {template!r}"
+        except Exception as e:
+            plan.error = f"指令模板错误: {e}"
+        return plan
 
-    def clear_cache(self) -> None:
-        self._config_cache = None
-        self._app_config_cache = None
+    def get_plan(self, device: str, cmd: str) -> Optional[CommandPlan]:
+        """获取指令的执行计划（配置文件已修改时先重新加载）"""
+        self._refresh()
+        return self._plans.get((device, cmd))
+
+    def get_plan_errors(self) -> Dict[str, str]:
+        """加载配置时发现的模板错误 {"device.cmd": 错误信息}"""
+        self._refresh()
+        return {f"{d}.{c}": plan.error for (d, c), plan in self._plans.items() if plan.error}
 
     def _load_config(self) -> Dict[str, Dict[str, str]]:
-        if self._config_cache is not None:
-            return self._config_cache
-        with open(self._config_path, "r", encoding="utf-8") as f:
-            self._config_cache = json.load(f)
+        self._refresh()
         return self._config_cache
 
     def _load_app_config(self) -> Dict[str, Any]:
         """加载应用配置（包含串口调试模式设置）"""
-        if self._app_config_cache is not None:
-            return self._app_config_cache
-        try:
-            with open(self._app_config_path, "r", encoding="utf-8") as f:
-                self._app_config_cache = json.load(f)
-        except Exception:
-            self._app_config_cache = {}
+        self._refresh()
         return self._app_config_cache
 
     def is_debug_mode(self) -> bool:
         """检查是否处于调试模式（调试模式下所有指令无需等待返回值）"""
-        app_cfg = self._load_app_config()
-        serial_cfg = app_cfg.get("serial", {})
-        return serial_cfg.get("debug_mode", False)
+        self._refresh()
+        return self._serial_settings.get("debug_mode", False)
 
     def get_serial_config(self) -> Dict[str, Any]:
         """获取串口配置参数"""
-        app_cfg = self._load_app_config()
-        return app_cfg.get("serial", {})
+        self._refresh()
+        return self._serial_settings
 
     def list_commands(self) -> Dict[str, list]:
         cfg = self._load_config()
@@ -72,7 +305,274 @@ class CommandService:
                 result[device] = list(commands.keys())
         return result
 
-    def send(self, device: str, cmd: str, params: Optional[Dict[str, Any]] = None, *, wait_response: bool = True, timeout: float = 2.0, encoding: str = "utf-8") -> Tuple[bool, str, bytes, Optional[Dict]]:
+    # ===================== 指令队列 =====================
+    def _get_worker(self, device: str) -> _DeviceWorker:
+        with self._workers_lock:
+            worker = self._workers.get(device)
+            if worker is None:
+                worker = self._workers[device] = _DeviceWorker(device)
+            return worker
+
+    def default_priority(self, device: str, cmd: str) -> int:
+        """按指令名和设备推断优先级：stop → 急停，运动设备 → 运动，get/query → 状态轮询"""
+        name = cmd.lower()
+        if "stop" in name:
+            return PRIORITY_EMERGENCY
+        if name.startswith(("get_", "query", "read_")):
+            return PRIORITY_STATUS
+        if device in self.MOTION_DEVICES:
+            return PRIORITY_MOTION
+        return PRIORITY_NORMAL
+
+    def submit(self, device: str, cmd: str, params: Optional[Dict[str, Any]] = None, *, priority: Optional[int] = None, wait_response: bool = True, timeout: float = 2.0, encoding: str = "utf-8") -> Future:
+        """
+        将指令提交到设备队列，立即返回 Future，结果与 send() 相同
+
+        Args:
+            priority: 优先级（PRIORITY_*），None 按 default_priority 推断
+
+        Raises:
+            ValueError: 优先级不是整数
+        """
+        priority = self._check_priority(priority) if priority is not None else self.default_priority(device, cmd)
+        return self._get_worker(device).submit(
+            lambda: self._send_now(device, cmd, params, wait_response=wait_response, timeout=timeout, encoding=encoding),
+            priority)
+
+    async def send_async(self, device: str, cmd: str, params: Optional[Dict[str, Any]] = None, **kwargs) -> Tuple[bool, str, bytes, Optional[Dict]]:
+        """asyncio 接口：await command_service.send_async(...)"""
+        return await asyncio.wrap_future(self.submit(device, cmd, params, **kwargs))
+
+    def submit_batch(self, steps: List[Dict[str, Any]], *, priority: int = PRIORITY_NORMAL, encoding: str = "utf-8") -> Future:
+        """
+        提交指令序列，立即返回 Future，结果与 send_batch() 相同
+
+        连续属于同一设备的步骤为一段，整段排入该设备的队列，执行期间该设备不插入其他指令；
+        各段按 priority 依次排入各自设备的队列，前一段全部成功后才提交下一段。
+
+        Raises:
+            ValueError: 步骤无效，或步骤数、指令总数、执行时间超过上限
+        """
+        steps = self._check_batch(steps)
+        priority = self._check_priority(priority)
+        segments = [list(group) for _, group in
+                    itertools.groupby(enumerate(steps), key=lambda item: item[1].get("device"))]
+        batch: Future = Future()
+        results: List[Dict] = []
+
+        def finish(result=None, error: BaseException = None):
+            try:
+                if error is not None:
+                    batch.set_exception(error)
+                else:
+                    batch.set_result(result)
+            except InvalidStateError:
+                pass  # 调用方已取消（等待超时）
+
+        def run_segment(i: int):
+            if batch.cancelled():
+                return
+            segment = segments[i]
+            future = self._get_worker(segment[0][1]["device"]).submit(
+                lambda: self._send_batch_now(segment, encoding=encoding), priority)
+            future.add_done_callback(lambda f: segment_done(i, f))
+
+        def segment_done(i: int, future: Future):
+            try:
+                success, message, segment_results = future.result()
+            except BaseException as e:
+                finish(error=e)
+                return
+            results.extend(segment_results)
+            if not success:
+                finish((False, message, results))
+            elif i + 1 < len(segments):
+                run_segment(i + 1)
+            else:
+                finish((True, f"{len(results)} 个步骤全部执行成功", results))
+
+        run_segment(0)
+        return batch
+
+    @staticmethod
+    def _check_priority(priority: Any) -> int:
+        """优先级转换为整数（请求中可能是字符串）"""
+        try:
+            return int(priority)
+        except (TypeError, ValueError):
+            raise ValueError(f"无效的优先级: {priority!r}")
+
+    def _command_timeout(self, timeout: float) -> float:
+        """实际使用的响应超时：默认值 2.0 表示使用配置的 default_timeout_ms"""
+        if timeout != 2.0:
+            return float(timeout)
+        return self._serial_settings.get("default_timeout_ms", 2000) / 1000.0
+
+    def _batch_timeout(self, steps: List[Dict[str, Any]]) -> float:
+        """指令序列最长执行时间：各步骤 (超时 + 重复间隔) × 重复次数 + 步骤后等待（steps 须经 _check_batch 转换）"""
+        total = 0.0
+        for step in steps:
+            per_command = self._command_timeout(step["timeout"]) + step["interval_ms"] / 1000.0
+            total += per_command * step["repeat"] + step["delay_ms"] / 1000.0
+        return total
+
+    def _check_batch(self, steps: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        检查指令序列的步骤格式和规模，在提交任何指令之前完成
+
+        Returns:
+            步骤副本，repeat / timeout / interval_ms / delay_ms 已转换为数值并补全默认值
+
+        Raises:
+            ValueError: 步骤无效或超过上限
+        """
+        if not isinstance(steps, list) or not steps:
+            raise ValueError("缺少指令步骤")
+        if len(steps) > self.MAX_BATCH_STEPS:
+            raise ValueError(f"指令步骤过多: {len(steps)} (最多 {self.MAX_BATCH_STEPS} 步)")
+        checked = []
+        total = 0
+        for index, step in enumerate(steps):
+            if not isinstance(step, dict) or not step.get("device") or not step.get("cmd"):
+                raise ValueError(f"第{index + 1}步缺少 device 或 cmd")
+            step = dict(step)
+            try:
+                step["repeat"] = max(1, int(step.get("repeat", 1)))
+            except (TypeError, ValueError):
+                raise ValueError(f"第{index + 1}步 repeat 无效: {step.get('repeat')!r}")
+            timeout = step.get("timeout")
+            step["timeout"] = self._check_number(index, "timeout", 2.0 if timeout is None else timeout,
+                                                 self.MAX_STEP_TIMEOUT, positive=True)
+            for key in ("interval_ms", "delay_ms"):
+                value = step.get(key)
+                step[key] = self._check_number(index, key, 0 if value is None else value, self.MAX_STEP_WAIT_MS)
+            total += step["repeat"]
+            checked.append(step)
+        if total > self.MAX_BATCH_COMMANDS:
+            raise ValueError(f"指令总数过多: {total} (最多 {self.MAX_BATCH_COMMANDS} 条)")
+        duration = self._batch_timeout(checked)
+        if duration > self.MAX_BATCH_SECONDS:
+            raise ValueError(f"指令序列最长执行时间过长: {duration:.0f}s (最多 {self.MAX_BATCH_SECONDS:.0f}s)")
+        return checked
+
+    @staticmethod
+    def _check_number(index: int, key: str, value: Any, maximum: float, positive: bool = False) -> float:
+        """步骤中的数值参数转换为 float 并检查范围"""
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"第{index + 1}步 {key} 无效: {value!r}")
+        if not (0 < number if positive else 0 <= number) or number > maximum:
+            limit = f"应大于0且不超过{maximum:g}" if positive else f"应在0~{maximum:g}之间"
+            raise ValueError(f"第{index + 1}步 {key} 超出范围: {value!r} ({limit})")
+        return number
+
+    def _heartbeat(self, device: str) -> Optional[Future]:
+        """
+        设备心跳（串口空闲时由 SerialService 监控线程调用）
+
+        发送 app_config.json 中 serial.heartbeat_commands 配置的状态查询指令，
+        以最低优先级排入设备队列，不记录串口日志。收到响应时 Future 结果为 True。
+        """
+        serial_cfg = self.get_serial_config()
+        cmd = serial_cfg.get("heartbeat_commands", {}).get(device)
+        if not cmd or serial_cfg.get("debug_mode", False):
+            return None
+        cmd_bytes, _ = self._build_command(device, cmd, None, "utf-8")
+        if cmd_bytes is None:
+            return None
+
+        def run() -> bool:
+            success, _, response, _ = self._transmit(device, cmd, cmd_bytes, wait_response=True, verify=False)
+            return success and bool(response)
+
+        return self._get_worker(device).submit(run, PRIORITY_STATUS)
+
+    def build_probes(self, line_configs: Dict[str, Dict],
+                     allow_state_change: bool = False) -> Tuple[List[Dict], List[str]]:
+        """
+        按 app_config.json 中 serial.probe_commands 生成串口自动识别的探测指令
+
+        标记了 "changes_state": true 的探测指令会改变设备状态（如关闭指示激光、关闭延时输出），
+        只有操作员明确允许时才使用，否则跳过该设备。
+
+        Args:
+            line_configs: serialConfig.json 中的 configs，{device: {baudrate, dataBits, stopBits, parity}}
+            allow_state_change: 是否使用会改变设备状态的探测指令
+
+        Returns:
+            (SerialService.discover 使用的探测指令列表, 因会改变设备状态而跳过的设备)
+        """
+        probes = []
+        skipped = []
+        for device, probe_cfg in self.get_serial_config().get("probe_commands", {}).items():
+            line_cfg = line_configs.get(device)
+            if line_cfg is None:
+                continue
+            if probe_cfg.get("changes_state") and not allow_state_change:
+                skipped.append(device)
+                continue
+            cmd = probe_cfg.get("cmd")
+            cmd_bytes, err = self._build_command(device, cmd, probe_cfg.get("params"), "utf-8")
+            if cmd_bytes is None:
+                print(f"[CommandService] Warning: 探测指令 {device}.{cmd} 无效: {err}")
+                continue
+            plan = self.get_plan(device, cmd)
+            expect = probe_cfg.get("expect", "").encode("utf-8")
+
+            def validate(response: bytes, complete: bool, _plan=plan, _cmd_bytes=cmd_bytes, _expect=expect) -> bool:
+                if _plan.decoder is not None:
+                    return bool((self._decode_response(_plan, _cmd_bytes, response) or {}).get("success"))
+                if _expect:
+                    return response.startswith(_expect)
+                return complete
+
+            probes.append({
+                'device': device,
+                'cmd': cmd,
+                'settings': self._serial.line_settings(
+                    line_cfg.get('baudrate', 9600), line_cfg.get('dataBits', 8),
+                    line_cfg.get('stopBits', 1), line_cfg.get('parity', 'None')),
+                'command': cmd_bytes,
+                'framer': plan.framer,
+                'validate': validate,
+            })
+        return probes, skipped
+
+    def get_queue_status(self) -> Dict[str, int]:
+        """各设备队列中等待执行的指令数"""
+        with self._workers_lock:
+            return {device: worker.pending() for device, worker in self._workers.items()}
+
+    def send(self, device: str, cmd: str, params: Optional[Dict[str, Any]] = None, *, wait_response: bool = True, timeout: float = 2.0, encoding: str = "utf-8", priority: Optional[int] = None) -> Tuple[bool, str, bytes, Optional[Dict]]:
+        """
+        同步发送指令：提交到设备队列并等待结果，参数和返回值见 _send_now
+
+        最多等待 指令超时 + RESULT_WAIT_MARGIN 秒，超时返回失败（仍在排队的指令被取消）。
+        """
+        future = self.submit(device, cmd, params, priority=priority, wait_response=wait_response,
+                             timeout=timeout, encoding=encoding)
+        wait = self._command_timeout(timeout) + self.RESULT_WAIT_MARGIN
+        try:
+            return future.result(timeout=wait)
+        except FutureTimeoutError:
+            future.cancel()
+            return False, f"等待 {device}.{cmd} 执行结果超时({wait:.1f}s)", b"", None
+
+    def send_batch(self, steps: List[Dict[str, Any]], *, encoding: str = "utf-8", priority: int = PRIORITY_NORMAL) -> Tuple[bool, str, List[Dict]]:
+        """同步执行指令序列：提交到各设备队列并等待结果，步骤格式见 _send_batch_now，返回 (全部成功, 提示消息, 各步骤结果)"""
+        # 先检查步骤并算出等待时间，参数无效时不提交任何指令
+        steps = self._check_batch(steps)
+        wait = self._batch_timeout(steps) + self.RESULT_WAIT_MARGIN
+        future = self.submit_batch(steps, priority=priority, encoding=encoding)
+        try:
+            return future.result(timeout=wait)
+        except FutureTimeoutError:
+            # 取消后不再提交后续设备的步骤
+            future.cancel()
+            return False, f"等待指令序列执行结果超时({wait:.1f}s)", []
+
+    def _send_now(self, device: str, cmd: str, params: Optional[Dict[str, Any]] = None, *, wait_response: bool = True, timeout: float = 2.0, encoding: str = "utf-8") -> Tuple[bool, str, bytes, Optional[Dict]]:
         """
         读取模板 → 渲染 → 编码 → 发送 → 返回 (success, message, response_bytes, decode_result)
 
@@ -89,45 +589,120 @@ class CommandService:
                 - response_bytes: 原始响应字节
                 - decode_result: 解码结果字典（如有），包含验证详情
         """
-        cfg = self._load_config()
-        serial_cfg = self.get_serial_config()
+        cmd_bytes, error = self._build_command(device, cmd, params, encoding)
+        if cmd_bytes is None:
+            return False, error, b"", None
 
-        # 调试模式下强制不等待响应
-        debug_mode = self.is_debug_mode()
-        actual_wait_response = False if debug_mode else wait_response
+        success, message, response_bytes, decode_result = self._transmit(
+            device, cmd, cmd_bytes, wait_response=wait_response, timeout=timeout)
 
-        # 从配置获取超时参数
-        default_timeout = serial_cfg.get("default_timeout_ms", 2000) / 1000.0
-        idle_timeout = serial_cfg.get("idle_timeout_ms", 100) / 1000.0
-        actual_timeout = timeout if timeout != 2.0 else default_timeout
+        # 记录串口日志
+        self._log(device, cmd, params, cmd_bytes, response_bytes, success, message)
 
-        try:
-            template = cfg[device][cmd]
-        except Exception as e:
-            return False, f"指令模板未发现: {e}", b"", None
+        return bool(success), str(message), response_bytes or b"", decode_result
 
-        # 根据前缀决定渲染与编码策略
-        cmd_bytes: bytes
+    def _send_batch_now(self, steps: List[Tuple[int, Dict[str, Any]]], *, encoding: str = "utf-8") -> Tuple[bool, str, List[Dict]]:
+        """
+        依次执行指令序列中属于同一设备的一段步骤，遇到第一个失败即停止
 
+        steps 为 (步骤序号, 步骤) 列表，步骤已经 _check_batch 检查和转换，每个步骤:
+            {
+                'device': str, 'cmd': str, 'params': dict,
+                'wait_response': bool,  # 默认 True
+                'verify': bool,         # 是否验证返回值，默认 True（仅对需要验证的设备生效）
+                'timeout': float,       # 秒，默认 2.0（使用配置的默认超时）
+                'repeat': int,          # 重复次数，默认 1
+                'interval_ms': float,   # 重复之间的间隔，默认 0
+                'delay_ms': float       # 步骤完成后的等待，默认 0
+            }
+
+        同一步骤的指令只编码一次；每个步骤写一条串口日志（重复执行时记录最后一次的返回值）。
+
+        Returns:
+            Tuple[bool, str, List[Dict]]: (全部成功, 失败时的提示消息, 各步骤结果)
+        """
+        results: List[Dict] = []
+        for index, step in steps:
+            device = step.get("device")
+            cmd = step.get("cmd")
+            params = step.get("params") or {}
+            repeat = step["repeat"]
+            interval = step["interval_ms"] / 1000.0
+            delay = step["delay_ms"] / 1000.0
+            start = time.perf_counter()
+
+            cmd_bytes, error = self._build_command(device, cmd, params, encoding)
+            if cmd_bytes is None:
+                results.append({"index": index, "device": device, "cmd": cmd, "repeat": repeat,
+                                "completed": 0, "success": False, "message": error,
+                                "response": "", "elapsed_ms": 0.0})
+                return False, f"第{index + 1}步 {device}.{cmd} 失败: {error}", results
+
+            completed = 0
+            success, message, response_bytes, decode_result = False, "", b"", None
+            for i in range(repeat):
+                if i and interval > 0:
+                    time.sleep(interval)
+                success, message, response_bytes, decode_result = self._transmit(
+                    device, cmd, cmd_bytes,
+                    wait_response=step.get("wait_response", True),
+                    timeout=step["timeout"],
+                    verify=step.get("verify", True),
+                )
+                if not success:
+                    break
+                completed += 1
+
+            log_params = dict(params, repeat=repeat) if repeat > 1 else params
+            self._log(device, cmd, log_params, cmd_bytes, response_bytes, success, message)
+
+            result = {
+                "index": index,
+                "device": device,
+                "cmd": cmd,
+                "repeat": repeat,
+                "completed": completed,
+                "success": bool(success),
+                "message": str(message),
+                "response": response_bytes.hex() if response_bytes else "",
+                "elapsed_ms": round((time.perf_counter() - start) * 1000.0, 3),
+            }
+            if decode_result is not None:
+                result["decode_result"] = decode_result
+            results.append(result)
+
+            if not success:
+                return False, f"第{index + 1}步 {device}.{cmd} 第{completed + 1}次执行失败: {message}", results
+            if delay > 0:
+                time.sleep(delay)
+
+        return True, "", results
+
+    def _build_command(self, device: str, cmd: str, params: Optional[Dict[str, Any]], encoding: str) -> Tuple[Optional[bytes], str]:
+        """根据预编译计划构造指令字节，失败时返回 (None, 错误消息)"""
+        plan = self.get_plan(device, cmd)
+        if plan is None:
+            return None, f"指令模板未发现: {device}.{cmd}"
+        if plan.error:
+            return None, plan.error
         try:
-            if template == "dynamic":
-                encoder_name = f"_encode_{device}_{cmd}"
-                encoder = getattr(self, encoder_name, None)
-                if encoder is None:
-                    return False, f"动态指令编码方法未找到: {encoder_name}", b"", None
-                cmd_bytes = encoder(**(params or {}))
-            elif isinstance(template, str) and template.startswith("f"):
-                body = template[1:]
-                rendered = body.format(**(params or {}))
-                cmd_bytes = rendered.encode(encoding, errors="strict")
-            elif isinstance(template, str) and template.startswith("h"):
-                body = template[1:]
-                body = body.format(**(params or {}))
-                cmd_bytes = bytes.fromhex(body)
-            else:
-                cmd_bytes = template.encode(encoding, errors="strict")
+            return plan.build(params or {}, encoding), ""
         except Exception as e:
-            return False, f"指令构造失败: {e}", b"", None
+            return None, f"指令构造失败: {e}"
+
+    def _transmit(self, device: str, cmd: str, cmd_bytes: bytes, *, wait_response: bool = True,
+                  timeout: float = 2.0, verify: bool = True) -> Tuple[bool, str, bytes, Optional[Dict]]:
+        """发送已编码的指令并按需验证返回值（不记录日志）"""
+        plan = self.get_plan(device, cmd)
+        serial_cfg = self._serial_settings
+
+        # 调试模式下强制不等待响应
+        debug_mode = serial_cfg.get("debug_mode", False)
+        actual_wait_response = False if debug_mode else wait_response
+
+        # 从配置获取超时参数
+        idle_timeout = serial_cfg.get("idle_timeout_ms", 100) / 1000.0
+        actual_timeout = self._command_timeout(timeout)
 
         # 发送指令
         success, message, response_bytes = self._serial.send_command(
@@ -136,40 +711,32 @@ class CommandService:
             wait_response=actual_wait_response,
             response_timeout=actual_timeout,
             idle_timeout=idle_timeout,
+            framer=plan.framer if plan is not None else None,
+            metric_key=cmd,
         )
 
         # 调试模式提示
         if debug_mode and wait_response:
             message = f"{message} (调试模式，未等待响应)"
-            # 记录串口日志
-            try:
-                port = self._serial.get_port(device) if hasattr(self._serial, 'get_port') else ''
-                db_service.log_serial_command(
-                    device=device,
-                    port=port,
-                    command=cmd,
-                    params=params,
-                    cmd_bytes=cmd_bytes,
-                    response_bytes=response_bytes,
-                    success=success,
-                    message=message
-                )
-            except Exception:
-                pass
-            return bool(success), str(message), response_bytes or b"", None
+            return success, message, response_bytes, None
 
         # 工作模式下，对需要验证的设备进行返回值检查
         decode_result = None
-        if success and actual_wait_response and device in self.DEVICES_REQUIRE_RESPONSE_CHECK:
-            decode_result = self._decode_response(device, cmd, cmd_bytes, response_bytes)
+        if success and actual_wait_response and verify and plan is not None and plan.verify:
+            decode_result = self._decode_response(plan, cmd_bytes, response_bytes)
             if decode_result is not None:
                 if not decode_result.get("success", False):
+                    serial_metrics.record_verify_failure(device, cmd)
                     success = False
                     message = decode_result.get("error", "返回值验证失败")
                 else:
                     message = "指令执行成功，返回值验证通过"
 
-        # 记录串口日志
+        return success, message, response_bytes, decode_result
+
+    def _log(self, device: str, cmd: str, params: Optional[Dict[str, Any]], cmd_bytes: bytes,
+             response_bytes: bytes, success: bool, message: str) -> None:
+        """记录串口日志（失败不影响主流程）"""
         try:
             port = self._serial.get_port(device) if hasattr(self._serial, 'get_port') else ''
             db_service.log_serial_command(
@@ -185,28 +752,27 @@ class CommandService:
         except Exception:
             pass  # 日志记录失败不影响主流程
 
-        return bool(success), str(message), response_bytes or b"", decode_result
+    def get_framer(self, device: str, cmd: str):
+        """获取指令的响应帧判定器，None 表示按空闲超时判定"""
+        framer = self.COMMAND_FRAMERS.get((device, cmd))
+        return framer if framer is not None else self.DEVICE_FRAMERS.get(device)
 
-    def _decode_response(self, device: str, cmd: str, cmd_bytes: bytes, response: bytes) -> Optional[Dict]:
+    def _decode_response(self, plan: CommandPlan, cmd_bytes: bytes, response: bytes) -> Optional[Dict]:
         """
         解析设备返回值
 
         Args:
-            device: 设备名
-            cmd: 指令名
+            plan: 指令执行计划
             cmd_bytes: 发送的指令字节
             response: 返回的响应字节
 
         Returns:
-            解码结果字典，包含 success 字段
+            解码结果字典，包含 success 字段；没有对应的解码方法时返回None（跳过验证）
         """
-        decoder_name = f"_decode_{device}_{cmd}"
-        decoder = getattr(self, decoder_name, None)
-        if decoder is None:
-            # 没有对应的解码方法，跳过验证
+        if plan.decoder is None:
             return None
         try:
-            return decoder(cmd_bytes, response)
+            return plan.decoder(cmd_bytes, response)
         except Exception as e:
             return {"success": False, "error": f"返回值解析异常: {e}"}
 
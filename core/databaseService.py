@@ -6,16 +6,139 @@ import sqlite3
 import os
 import json
 import base64
-from datetime import datetime
-from typing import Optional, Dict, List, Any
+import atexit
+import hashlib
+import queue
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Iterator, List, Any, Tuple
 import threading
+from pathlib import Path
+
+
+# 图片格式识别：(文件头, 格式名, 扩展名)
+_IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png', 'png'),
+    (b'\xff\xd8\xff', 'jpeg', 'jpg'),
+    (b'II*\x00', 'tiff', 'tif'),
+    (b'MM\x00*', 'tiff', 'tif'),
+    (b'BM', 'bmp', 'bmp'),
+    (b'GIF8', 'gif', 'gif'),
+)
+
+
+def detect_image_format(data: bytes) -> Tuple[str, str]:
+    """按文件头识别图片格式，返回 (格式名, 扩展名)，无法识别时为 ('bin', 'bin')"""
+    for signature, name, ext in _IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return name, ext
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp', 'webp'
+    return 'bin', 'bin'
+
+
+def response_text(data: Optional[bytes]) -> Optional[str]:
+    """响应字节中的可打印ASCII文本（其他字节视为分隔），用于全文搜索"""
+    if not data:
+        return None
+    text = ' '.join(''.join(chr(b) if 32 <= b < 127 else ' ' for b in data).split())
+    return text or None
+
+
+class _ConnectionPool:
+    """
+    SQLite连接池 - 连接在各线程间复用，不再每次调用都打开/关闭数据库
+
+    连接按后进先出借出（最近用过的连接页缓存最热），池中没有空闲连接且未达到上限时新建，
+    达到上限时等待其他线程归还。
+    """
+
+    def __init__(self, path: str, size: int, factory):
+        self.path = path
+        self.size = size
+        self._factory = factory
+        self._idle: List[sqlite3.Connection] = []
+        self._created = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout: float) -> sqlite3.Connection:
+        with self._cond:
+            deadline = time.monotonic() + timeout
+            while not self._idle and self._created >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise sqlite3.OperationalError(f"等待数据库连接超时({self.size}个连接均在使用)")
+                self._cond.wait(remaining)
+            if self._idle:
+                return self._idle.pop()
+            self._created += 1
+        try:
+            return self._factory(self.path)
+        except Exception:
+            with self._cond:
+                self._created -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn: sqlite3.Connection):
+        with self._cond:
+            if self._closed:
+                self._created -= 1
+                conn.close()
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def close(self):
+        """关闭空闲连接；正在使用的连接归还时关闭"""
+        with self._cond:
+            self._closed = True
+            for conn in self._idle:
+                conn.close()
+            self._created -= len(self._idle)
+            self._idle = []
+
 
 class DatabaseService:
     _instance = None
     _lock = threading.Lock()
 
-    # 串口日志最大保留条数
+    # 串口日志默认保留策略（可由 set_serial_log_retention 修改）：最多保留条数、最长保留天数，0 表示不限制
     MAX_SERIAL_LOGS = 1000
+    MAX_SERIAL_LOG_DAYS = 0
+    # 后台每隔 RETENTION_INTERVAL 秒清理一次过期日志，每个事务最多删除 RETENTION_BATCH_SIZE 条
+    RETENTION_INTERVAL = 60.0
+    RETENTION_BATCH_SIZE = 5000
+
+    # 没有记录引用的图片在最近一次保存 IMAGE_GRACE_SECONDS 秒后才删除，
+    # 避免删除正在保存（图片已写入、记录尚未插入）的图片
+    IMAGE_GRACE_SECONDS = 60.0
+
+    # 导出时每次从数据库读取的行数（每块单独借出连接，读取期间不长时间占用连接）
+    EXPORT_CHUNK_SIZE = 5000
+
+    # 串口日志后台批量写入：每 LOG_FLUSH_INTERVAL 秒或积累 LOG_BATCH_SIZE 条提交一次
+    LOG_FLUSH_INTERVAL = 0.2
+    LOG_BATCH_SIZE = 500
+
+    # 连接池大小，0 表示不复用连接（每次调用打开新连接，用完关闭）
+    POOL_SIZE = 8
+    # 等待空闲连接、等待写锁的超时(秒)
+    CONNECTION_TIMEOUT = 10.0
+    # 每个连接打开时执行的PRAGMA：
+    #   WAL 模式下读写互不阻塞，写入只追加WAL文件；synchronous=NORMAL 在WAL模式下提交时不再
+    #   fsync（掉电最多丢失最近的事务，数据库不会损坏）；页缓存16MB、内存映射256MB、临时表放内存
+    PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    }
+    # 每个连接缓存的预编译语句数量（sqlite3 按SQL文本复用语句）
+    STATEMENT_CACHE_SIZE = 256
 
     def __new__(cls):
         if cls._instance is None:
@@ -33,24 +156,135 @@ class DatabaseService:
         self.base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.data_dir = os.path.join(self.base_dir, 'data')
         self.images_dir = os.path.join(self.data_dir, 'images')
+        self.thumbs_dir = os.path.join(self.data_dir, 'thumbs')
         self.db_path = os.path.join(self.data_dir, 'test_records.db')
 
         # 确保目录存在
         os.makedirs(self.data_dir, exist_ok=True)
         os.makedirs(self.images_dir, exist_ok=True)
 
-        # 初始化数据库
-        self._init_database()
-
-    def _get_connection(self) -> sqlite3.Connection:
-        """获取数据库连接"""
-        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        # 串口日志写入队列，由后台线程批量写入
+        self._log_queue: "queue.Queue" = queue.Queue()
+        self._log_thread: Optional[threading.Thread] = None
+        self._log_thread_lock = threading.Lock()
+
+        # 串口日志保留策略，由后台线程定期清理
+        self._retention_max_rows = self.MAX_SERIAL_LOGS
+        self._retention_max_days = self.MAX_SERIAL_LOG_DAYS
+        self._retention_interval = self.RETENTION_INTERVAL
+        self._retention_thread: Optional[threading.Thread] = None
+        self._retention_wake = threading.Event()
+        self._retention_lock = threading.Lock()
+        self._retention_stats = {'lastRun': None, 'lastDeleted': 0, 'totalDeleted': 0, 'watermark': None}
+
+        self._pool: Optional[_ConnectionPool] = None
+        self._pool_lock = threading.Lock()
+
+        # 全文索引是否使用 trigram 分词（建表时确定）
+        self._fts_trigram = True
+
+        # 图片保存与回收互斥；持有期间借用连接不会再触发数据库初始化（见 save_image）
+        self._image_lock = threading.Lock()
+
+        # 数据库在首次借用连接时初始化（建表、迁移、回收遗留图片），导入本模块不访问数据库；
+        # _database_path 为已初始化的数据库路径，db_path 被修改后重新初始化
+        self._database_path: Optional[str] = None
+        self._database_initializing = False
+        self._database_lock = threading.RLock()
+
+        # 进程退出前写完队列中的日志，再关闭连接（atexit 按注册的相反顺序执行）
+        atexit.register(self.close)
+        atexit.register(self.flush_serial_logs)
+
+    def _get_connection(self, path: str = None) -> sqlite3.Connection:
+        """打开新的数据库连接并设置PRAGMA"""
+        conn = sqlite3.connect(path or self.db_path, timeout=self.CONNECTION_TIMEOUT,
+                               check_same_thread=False, cached_statements=self.STATEMENT_CACHE_SIZE)
         conn.row_factory = sqlite3.Row
+        for name, value in self.PRAGMAS.items():
+            conn.execute(f'PRAGMA {name} = {value}')
         return conn
 
+    def _get_pool(self) -> _ConnectionPool:
+        pool = self._pool
+        if pool is not None and pool.path == self.db_path and pool.size == self.POOL_SIZE:
+            return pool
+        with self._pool_lock:
+            pool = self._pool
+            if pool is None or pool.path != self.db_path or pool.size != self.POOL_SIZE:
+                # db_path 被修改（测试、基准使用临时数据库）时换用新的连接池
+                if pool is not None:
+                    pool.close()
+                pool = self._pool = _ConnectionPool(self.db_path, self.POOL_SIZE, self._get_connection)
+            return pool
+
+    @contextmanager
+    def _connection(self):
+        """
+        借用一个数据库连接，用完归还连接池
+
+        出错或调用方未提交时回滚事务，归还的连接不会带着未完成的事务。
+        """
+        self._ensure_database()
+        if self.POOL_SIZE <= 0:
+            conn = self._get_connection()
+            try:
+                yield conn
+            finally:
+                conn.close()
+            return
+        pool = self._get_pool()
+        conn = pool.acquire(self.CONNECTION_TIMEOUT)
+        try:
+            yield conn
+        finally:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+            finally:
+                pool.release(conn)
+
+    def close(self):
+        """关闭连接池中的连接"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool = None
+
+    def read_only(self) -> 'ReadOnlyRecords':
+        """
+        返回当前数据库的只读读取器（可传给导出任务的工作进程）
+
+        先初始化数据库并写入队列中尚未落库的串口日志，保证工作进程读到刚执行的指令。
+        """
+        self._ensure_database()
+        self.flush_serial_logs()
+        return ReadOnlyRecords(self.db_path)
+
+    def _ensure_database(self):
+        """首次使用（或 db_path 被修改后）初始化数据库"""
+        if self._database_path == self.db_path:
+            return
+        with self._database_lock:
+            # 本线程正在初始化时，建表、回收图片借用的连接直接放行
+            if self._database_path == self.db_path or self._database_initializing:
+                return
+            self._init_database()
+
     def _init_database(self):
         """初始化数据库表"""
-        conn = self._get_connection()
+        with self._database_lock:
+            self._database_initializing = True
+            try:
+                with self._connection() as conn:
+                    self._create_tables(conn)
+                # 回收上次运行遗留的未引用图片
+                self.collect_images()
+                self._database_path = self.db_path
+            finally:
+                self._database_initializing = False
+
+    def _create_tables(self, conn: sqlite3.Connection):
         cursor = conn.cursor()
 
         # 创建串口日志表
@@ -65,7 +299,8 @@ class DatabaseService:
                 cmd_bytes TEXT,
                 response_bytes TEXT,
                 success INTEGER,
-                message TEXT
+                message TEXT,
+                response_text TEXT
             )
         ''')
 
@@ -101,9 +336,11 @@ class DatabaseService:
             )
         ''')
 
-        # 创建索引
+        # 创建索引：分页按 (时间, id) 倒序，索引隐含 rowid(id)，筛选+分页只扫描一页的索引项
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_serial_logs_timestamp ON serial_logs(timestamp)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_serial_logs_device ON serial_logs(device)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_serial_logs_device_time ON serial_logs(device, timestamp)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_serial_logs_port_time ON serial_logs(port, timestamp)')
+        cursor.execute('DROP INDEX IF EXISTS idx_serial_logs_device')  # 已被 (device, timestamp) 覆盖
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_optical_tests_time ON optical_axis_tests(test_time)')
 
         # 数据库迁移：为旧表添加 operator 字段
@@ -112,17 +349,224 @@ class DatabaseService:
         except:
             pass  # 字段已存在则忽略
 
+        # 数据库迁移：为旧表添加 response_text 字段（响应的可打印文本，供全文搜索）
+        try:
+            cursor.execute('ALTER TABLE serial_logs ADD COLUMN response_text TEXT')
+        except:
+            pass  # 字段已存在则忽略
+
+        self._create_row_counts(cursor)
+        self._create_serial_logs_fts(cursor)
+        self._create_image_store(cursor)
+
         conn.commit()
-        conn.close()
+
+    def _create_row_counts(self, cursor: sqlite3.Cursor):
+        """
+        按筛选维度维护的记录条数，由触发器在插入/删除时增减，分页查询总数不再 COUNT(*)
+
+        serial_logs:        all / device / port / device_port
+        optical_axis_tests: all
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'row_counts'")
+        exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS row_counts (
+                table_name TEXT NOT NULL,
+                dimension TEXT NOT NULL,
+                value TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (table_name, dimension, value)
+            ) WITHOUT ROWID
+        ''')
+
+        serial_keys = {
+            'all': "''",
+            'device': "COALESCE({row}.device, '')",
+            'port': "COALESCE({row}.port, '')",
+            'device_port': "COALESCE({row}.device, '') || '|' || COALESCE({row}.port, '')",
+        }
+        for table, keys in (('serial_logs', serial_keys), ('optical_axis_tests', {'all': "''"})):
+            increments = ''.join(f'''
+                INSERT INTO row_counts (table_name, dimension, value, count)
+                VALUES ('{table}', '{dimension}', {key.format(row='NEW')}, 1)
+                ON CONFLICT (table_name, dimension, value) DO UPDATE SET count = count + 1;'''
+                for dimension, key in keys.items())
+            decrements = ''.join(f'''
+                UPDATE row_counts SET count = count - 1
+                WHERE table_name = '{table}' AND dimension = '{dimension}' AND value = {key.format(row='OLD')};'''
+                for dimension, key in keys.items())
+            cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {table}_count_insert AFTER INSERT ON {table} '
+                           f'BEGIN {increments} END')
+            cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {table}_count_delete AFTER DELETE ON {table} '
+                           f'BEGIN {decrements} END')
+
+            if not exists:
+                # 旧数据库首次迁移：按现有数据统计一次
+                for dimension, key in keys.items():
+                    value = key.format(row=table)
+                    cursor.execute(f'''
+                        INSERT INTO row_counts (table_name, dimension, value, count)
+                        SELECT '{table}', '{dimension}', {value}, COUNT(*) FROM {table} GROUP BY {value}
+                    ''')
+
+    def _create_image_store(self, cursor: sqlite3.Cursor):
+        """
+        图片库：按内容哈希保存，同一内容只保存一份；refcount 为引用该图片的测试记录字段数，
+        由 optical_axis_tests 上的触发器维护
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'images'")
+        exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS images (
+                path TEXT PRIMARY KEY,
+                hash TEXT NOT NULL,
+                format TEXT,
+                size INTEGER,
+                refcount INTEGER NOT NULL DEFAULT 0,
+                last_used REAL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_images_hash ON images(hash)')
+
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS optical_tests_images_insert AFTER INSERT ON optical_axis_tests BEGIN
+                UPDATE images SET refcount = refcount + 1 WHERE path = NEW.base_image_path;
+                UPDATE images SET refcount = refcount + 1 WHERE path = NEW.test_image_path;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS optical_tests_images_delete AFTER DELETE ON optical_axis_tests BEGIN
+                UPDATE images SET refcount = refcount - 1 WHERE path = OLD.base_image_path;
+                UPDATE images SET refcount = refcount - 1 WHERE path = OLD.test_image_path;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS optical_tests_images_update
+            AFTER UPDATE OF base_image_path, test_image_path ON optical_axis_tests BEGIN
+                UPDATE images SET refcount = refcount - 1 WHERE path = OLD.base_image_path;
+                UPDATE images SET refcount = refcount - 1 WHERE path = OLD.test_image_path;
+                UPDATE images SET refcount = refcount + 1 WHERE path = NEW.base_image_path;
+                UPDATE images SET refcount = refcount + 1 WHERE path = NEW.test_image_path;
+            END
+        ''')
+
+        if not exists:
+            # 旧数据库首次迁移：登记已有的图片文件（保留原路径，不移动文件）
+            cursor.execute('''
+                SELECT base_image_path AS path FROM optical_axis_tests WHERE base_image_path IS NOT NULL
+                UNION SELECT test_image_path FROM optical_axis_tests WHERE test_image_path IS NOT NULL
+            ''')
+            for (path,) in cursor.fetchall():
+                full_path = os.path.join(self.base_dir, path)
+                if not os.path.isfile(full_path):
+                    continue
+                with open(full_path, 'rb') as f:
+                    data = f.read()
+                cursor.execute('INSERT INTO images (path, hash, format, size, last_used) VALUES (?, ?, ?, ?, ?)',
+                               (path, hashlib.sha256(data).hexdigest(), detect_image_format(data)[0],
+                                len(data), os.path.getmtime(full_path)))
+            cursor.execute('''
+                UPDATE images SET refcount =
+                    (SELECT COUNT(*) FROM optical_axis_tests WHERE base_image_path = images.path) +
+                    (SELECT COUNT(*) FROM optical_axis_tests WHERE test_image_path = images.path)
+            ''')
+
+    def _create_serial_logs_fts(self, cursor: sqlite3.Cursor):
+        """
+        串口日志全文索引（FTS5，外部内容表，不重复保存日志内容），由触发器与 serial_logs 同步
+
+        使用 trigram 分词，中文消息不需要分词也能按子串搜索（至少3个字符）；
+        SQLite 版本不支持 trigram 时退回 unicode61。
+        """
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'serial_logs_fts'")
+        row = cursor.fetchone()
+        if row is None:
+            # 旧数据库首次迁移：补齐响应文本
+            conn = cursor.connection
+            conn.create_function('response_text_from_hex', 1,
+                                 lambda value: response_text(bytes.fromhex(value)) if value else None)
+            cursor.execute('''
+                UPDATE serial_logs SET response_text = response_text_from_hex(response_bytes)
+                WHERE response_text IS NULL AND response_bytes IS NOT NULL
+            ''')
+            columns = 'command, message, params, response_text, content=serial_logs, content_rowid=id'
+            try:
+                cursor.execute(f"CREATE VIRTUAL TABLE serial_logs_fts USING fts5({columns}, tokenize='trigram')")
+            except sqlite3.OperationalError:
+                cursor.execute(f"CREATE VIRTUAL TABLE serial_logs_fts USING fts5({columns})")
+            cursor.execute("INSERT INTO serial_logs_fts (serial_logs_fts) VALUES ('rebuild')")
+            cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'serial_logs_fts'")
+            row = cursor.fetchone()
+        self._fts_trigram = 'trigram' in row[0]
+
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS serial_logs_fts_insert AFTER INSERT ON serial_logs BEGIN
+                INSERT INTO serial_logs_fts (rowid, command, message, params, response_text)
+                VALUES (NEW.id, NEW.command, NEW.message, NEW.params, NEW.response_text);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS serial_logs_fts_delete AFTER DELETE ON serial_logs BEGIN
+                INSERT INTO serial_logs_fts (serial_logs_fts, rowid, command, message, params, response_text)
+                VALUES ('delete', OLD.id, OLD.command, OLD.message, OLD.params, OLD.response_text);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS serial_logs_fts_update AFTER UPDATE ON serial_logs BEGIN
+                INSERT INTO serial_logs_fts (serial_logs_fts, rowid, command, message, params, response_text)
+                VALUES ('delete', OLD.id, OLD.command, OLD.message, OLD.params, OLD.response_text);
+                INSERT INTO serial_logs_fts (rowid, command, message, params, response_text)
+                VALUES (NEW.id, NEW.command, NEW.message, NEW.params, NEW.response_text);
+            END
+        ''')
+
+    @staticmethod
+    def _row_count(conn: sqlite3.Connection, table: str, dimension: str = 'all', value: str = '') -> int:
+        row = conn.execute('SELECT count FROM row_counts WHERE table_name = ? AND dimension = ? AND value = ?',
+                           (table, dimension, value)).fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def _keyset_page(conn: sqlite3.Connection, table: str, time_column: str,
+                     conditions: List[str], params: List, limit: int, offset: int,
+                     cursor: Optional[str]) -> List[sqlite3.Row]:
+        """
+        按 (时间, id) 倒序取一页
+
+        cursor 为上一页返回的 nextCursor（"时间|id"），指定时从该行之后继续，不再使用 OFFSET，
+        翻到多深都只读取一页的索引项。
+        """
+        query = f'SELECT * FROM {table} WHERE 1=1'
+        params = list(params)
+        for condition in conditions:
+            query += f' AND {condition}'
+        if cursor:
+            cursor_time, sep, cursor_id = cursor.rpartition('|')
+            if not sep or not cursor_id.isdigit():
+                raise ValueError(f'无效的分页游标: {cursor}')
+            query += f' AND ({time_column}, id) < (?, ?)'
+            params.extend([cursor_time, int(cursor_id)])
+            offset = 0
+        query += f' ORDER BY {time_column} DESC, id DESC LIMIT ? OFFSET ?'
+        params.extend([limit, offset])
+        return conn.execute(query, params).fetchall()
+
+    @staticmethod
+    def _next_cursor(rows: List[sqlite3.Row], time_column: str, limit: int) -> Optional[str]:
+        """本页已满时返回下一页的游标，否则说明没有更多记录"""
+        if len(rows) < limit or not rows:
+            return None
+        return f'{rows[-1][time_column]}|{rows[-1]["id"]}'
 
     # ==================== 串口日志方法 ====================
 
     def log_serial_command(self, device: str, port: str, command: str,
                           params: Dict = None, cmd_bytes: bytes = None,
                           response_bytes: bytes = None, success: bool = True,
-                          message: str = None) -> int:
+                          message: str = None) -> None:
         """
-        记录串口指令
+        记录串口指令（放入写入队列后立即返回，由后台线程批量写入数据库）
 
         Args:
             device: 设备名称
@@ -133,18 +577,11 @@ class DatabaseService:
             response_bytes: 返回的字节
             success: 是否成功
             message: 结果消息
-
-        Returns:
-            插入记录的ID
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            INSERT INTO serial_logs (device, port, command, params, cmd_bytes,
-                                    response_bytes, success, message)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
+        self._ensure_log_writer()
+        self._log_queue.put((
+            # 与 CURRENT_TIMESTAMP 相同的UTC格式，记录的是指令执行时间而不是写入时间
+            datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
             device,
             port,
             command,
@@ -152,39 +589,168 @@ class DatabaseService:
             cmd_bytes.hex() if cmd_bytes else None,
             response_bytes.hex() if response_bytes else None,
             1 if success else 0,
-            message
+            message,
+            response_text(response_bytes)
         ))
 
-        log_id = cursor.lastrowid
-        conn.commit()
+    def flush_serial_logs(self, timeout: float = 5.0) -> bool:
+        """
+        等待队列中的串口日志写入数据库
+
+        Returns:
+            是否在超时前写完
+        """
+        if self._log_thread is None or not self._log_thread.is_alive():
+            return self._log_queue.empty()
+        done = threading.Event()
+        self._log_queue.put(done)
+        return done.wait(timeout)
+
+    def _ensure_log_writer(self):
+        if self._log_thread is not None and self._log_thread.is_alive():
+            return
+        with self._log_thread_lock:
+            if self._log_thread is None or not self._log_thread.is_alive():
+                self._log_thread = threading.Thread(target=self._log_writer_loop,
+                                                    name='serial-log-writer', daemon=True)
+                self._log_thread.start()
+            if self._retention_thread is None or not self._retention_thread.is_alive():
+                self._retention_thread = threading.Thread(target=self._retention_loop,
+                                                          name='serial-log-retention', daemon=True)
+                self._retention_thread.start()
+
+    def _log_writer_loop(self):
+        """后台写入线程：收集一批日志后在一个事务中 executemany 写入"""
+        while True:
+            batch, waiters = [], []
+            item = self._log_queue.get()
+            deadline = time.monotonic() + self.LOG_FLUSH_INTERVAL
+            while True:
+                if isinstance(item, threading.Event):
+                    # flush 请求：立即写入已收集的日志
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.LOG_BATCH_SIZE:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._log_queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._write_serial_logs(batch)
+            for event in waiters:
+                event.set()
+
+    def _write_serial_logs(self, batch: List[tuple]):
+        try:
+            with self._connection() as conn:
+                with conn:
+                    conn.executemany('''
+                        INSERT INTO serial_logs (timestamp, device, port, command, params, cmd_bytes,
+                                                response_bytes, success, message, response_text)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', batch)
+        except Exception as e:
+            print(f"[DatabaseService] Warning: 写入串口日志失败({len(batch)}条): {e}")
+
+    # ==================== 串口日志保留策略 ====================
+
+    def set_serial_log_retention(self, max_rows: int = None, max_days: float = None, interval: float = None):
+        """
+        设置串口日志保留策略并启动后台清理
 
-        # 自动清理旧记录
-        self._cleanup_serial_logs(conn)
+        Args:
+            max_rows: 最多保留条数，0 表示不限制，None 保持不变
+            max_days: 最长保留天数，0 表示不限制，None 保持不变
+            interval: 清理间隔(秒)，None 保持不变
+        """
+        if max_rows is not None:
+            self._retention_max_rows = max(0, int(max_rows))
+        if max_days is not None:
+            self._retention_max_days = max(0.0, float(max_days))
+        if interval is not None and interval > 0:
+            self._retention_interval = float(interval)
+        self._ensure_log_writer()
+        self._retention_wake.set()
+
+    def get_serial_log_retention(self) -> Dict:
+        """获取串口日志保留策略及最近一次清理的结果"""
+        return {
+            'maxRows': self._retention_max_rows,
+            'maxDays': self._retention_max_days,
+            'interval': self._retention_interval,
+            **self._retention_stats,
+        }
 
-        conn.close()
-        return log_id
+    def _retention_loop(self):
+        """后台清理线程：按间隔清理，修改策略时立即执行一次"""
+        while True:
+            self._retention_wake.wait(self._retention_interval)
+            self._retention_wake.clear()
+            try:
+                self.apply_serial_log_retention()
+            except Exception as e:
+                print(f"[DatabaseService] Warning: 清理串口日志失败: {e}")
+
+    def _retention_watermark(self, conn: sqlite3.Connection) -> Optional[int]:
+        """
+        计算保留的最小id（水位线），id 小于水位线的日志都应删除
 
-    def _cleanup_serial_logs(self, conn: sqlite3.Connection):
-        """清理超出限制的串口日志，保留最近的记录"""
-        cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM serial_logs')
-        count = cursor.fetchone()[0]
+        id 按写入顺序递增：条数限制的水位线是 MAX(id) - max_rows + 1（单条删除留下的空洞只会让保留的
+        条数略少于上限）；时间限制的水位线是时间不早于截止时间的第一条日志，均为索引查找。
+        """
+        max_id = conn.execute('SELECT MAX(id) FROM serial_logs').fetchone()[0]
+        if max_id is None:
+            return None
+        watermarks = []
+        if self._retention_max_rows > 0:
+            watermarks.append(max_id - self._retention_max_rows + 1)
+        if self._retention_max_days > 0:
+            cutoff = (datetime.now(timezone.utc) - timedelta(days=self._retention_max_days)).strftime('%Y-%m-%d %H:%M:%S')
+            row = conn.execute('SELECT id FROM serial_logs WHERE timestamp >= ? ORDER BY timestamp, id LIMIT 1',
+                               (cutoff,)).fetchone()
+            watermarks.append(row[0] if row else max_id + 1)
+        return max(watermarks) if watermarks else None
+
+    def apply_serial_log_retention(self) -> int:
+        """
+        按保留策略删除旧串口日志
 
-        if count > self.MAX_SERIAL_LOGS:
-            # 删除最早的记录
-            delete_count = count - self.MAX_SERIAL_LOGS
-            cursor.execute('''
-                DELETE FROM serial_logs WHERE id IN (
-                    SELECT id FROM serial_logs ORDER BY id ASC LIMIT ?
-                )
-            ''', (delete_count,))
-            conn.commit()
+        按 id 范围分批删除（每批一个事务），耗时只与删除的条数有关，与表的大小无关；
+        批次之间释放写锁，日志写入线程不会被长时间阻塞。
+
+        Returns:
+            删除的条数
+        """
+        deleted = 0
+        with self._retention_lock, self._connection() as conn:
+            watermark = self._retention_watermark(conn)
+            if watermark is not None:
+                while True:
+                    oldest = conn.execute('SELECT MIN(id) FROM serial_logs').fetchone()[0]
+                    if oldest is None or oldest >= watermark:
+                        break
+                    upper = min(watermark, oldest + self.RETENTION_BATCH_SIZE)
+                    with conn:
+                        deleted += conn.execute('DELETE FROM serial_logs WHERE id < ?', (upper,)).rowcount
+            self._retention_stats = {
+                'lastRun': time.time(),
+                'lastDeleted': deleted,
+                'totalDeleted': self._retention_stats['totalDeleted'] + deleted,
+                'watermark': watermark,
+            }
+        return deleted
 
     def get_serial_logs(self, device: str = None, port: str = None,
                        start_time: str = None, end_time: str = None,
-                       limit: int = 100, offset: int = 0) -> List[Dict]:
+                       limit: int = 100, offset: int = 0, cursor: str = None) -> Dict:
         """
-        查询串口日志
+        查询串口日志（按时间倒序）
 
         Args:
             device: 设备筛选
@@ -192,56 +758,172 @@ class DatabaseService:
             start_time: 开始时间 (ISO格式)
             end_time: 结束时间 (ISO格式)
             limit: 返回数量限制
-            offset: 偏移量
+            offset: 偏移量（未指定 cursor 时使用）
+            cursor: 上一页返回的 nextCursor，从该位置继续
 
         Returns:
-            日志列表
+            {'logs': 日志列表, 'total': 总数, 'nextCursor': 下一页游标(没有更多时为None),
+             'devices': 有日志的设备列表, 'ports': 有日志的串口列表}
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        # 先写入队列中尚未落库的日志，保证刚执行的指令可以查到
+        self.flush_serial_logs()
 
-        query = 'SELECT * FROM serial_logs WHERE 1=1'
-        params = []
+        conditions, params = self._serial_log_conditions(device, port, start_time, end_time)
 
+        with self._connection() as conn:
+            rows = self._keyset_page(conn, 'serial_logs', 'timestamp', conditions, params, limit, offset, cursor)
+
+            total = self._serial_log_total(conn, device, port, start_time, end_time)
+
+            # 筛选下拉框的选项
+            options = conn.execute('''
+                SELECT dimension, value FROM row_counts
+                WHERE table_name = 'serial_logs' AND dimension IN ('device', 'port') AND count > 0 AND value != ''
+                ORDER BY value
+            ''').fetchall()
+
+        return {
+            'logs': [dict(row) for row in rows],
+            'total': total,
+            'nextCursor': self._next_cursor(rows, 'timestamp', limit),
+            'devices': [row['value'] for row in options if row['dimension'] == 'device'],
+            'ports': [row['value'] for row in options if row['dimension'] == 'port'],
+        }
+
+    @classmethod
+    def _serial_log_total(cls, conn: sqlite3.Connection, device: str = None, port: str = None,
+                          start_time: str = None, end_time: str = None) -> int:
+        """串口日志匹配条数：没有时间筛选时直接读取维护好的条数"""
+        if start_time or end_time:
+            conditions, params = cls._serial_log_conditions(device, port, start_time, end_time)
+            return conn.execute('SELECT COUNT(*) FROM serial_logs WHERE ' + ' AND '.join(conditions),
+                                params).fetchone()[0]
+        if device and port:
+            return cls._row_count(conn, 'serial_logs', 'device_port', f'{device}|{port}')
+        if device:
+            return cls._row_count(conn, 'serial_logs', 'device', device)
+        if port:
+            return cls._row_count(conn, 'serial_logs', 'port', port)
+        return cls._row_count(conn, 'serial_logs')
+
+    @staticmethod
+    def _serial_log_conditions(device: str = None, port: str = None,
+                               start_time: str = None, end_time: str = None) -> Tuple[List[str], List]:
+        """串口日志筛选条件"""
+        conditions = []
+        params = []
         if device:
-            query += ' AND device = ?'
+            conditions.append('device = ?')
             params.append(device)
         if port:
-            query += ' AND port = ?'
+            conditions.append('port = ?')
             params.append(port)
         if start_time:
-            query += ' AND timestamp >= ?'
+            conditions.append('timestamp >= ?')
             params.append(start_time)
         if end_time:
-            query += ' AND timestamp <= ?'
+            conditions.append('timestamp <= ?')
             params.append(end_time)
+        return conditions, params
+
+    def _iter_chunks(self, table: str, time_column: str, conditions: List[str], params: List,
+                     chunk_size: int = None) -> Iterator[List[Dict]]:
+        """按 (时间, id) 倒序分块读取全部匹配行，每块为一个字典列表"""
+        chunk_size = chunk_size or self.EXPORT_CHUNK_SIZE
+        cursor = None
+        while True:
+            with self._connection() as conn:
+                rows = self._keyset_page(conn, table, time_column, conditions, params, chunk_size, 0, cursor)
+            if rows:
+                yield [dict(row) for row in rows]
+            cursor = self._next_cursor(rows, time_column, chunk_size)
+            if cursor is None:
+                return
+
+    def iter_serial_logs(self, device: str = None, port: str = None,
+                         start_time: str = None, end_time: str = None,
+                         chunk_size: int = None) -> Iterator[List[Dict]]:
+        """
+        分块读取串口日志（按时间倒序，用于导出）
 
-        query += ' ORDER BY id DESC LIMIT ? OFFSET ?'
-        params.extend([limit, offset])
+        Yields:
+            List[Dict]: 每块最多 chunk_size 条日志
+        """
+        self.flush_serial_logs()
+        conditions, params = self._serial_log_conditions(device, port, start_time, end_time)
+        return self._iter_chunks('serial_logs', 'timestamp', conditions, params, chunk_size)
+
+    # 全文搜索各列的权重：指令名, 消息, 参数, 响应文本
+    SEARCH_WEIGHTS = (4.0, 2.0, 1.0, 1.0)
+
+    def search_serial_logs(self, query: str, device: str = None, port: str = None,
+                           start_time: str = None, end_time: str = None,
+                           limit: int = 50, offset: int = 0) -> Dict:
+        """
+        全文搜索串口日志（指令名、消息、参数、响应文本），按相关度排序
+
+        关键词以空格分隔，需全部匹配。trigram 分词下少于3个字符的关键词无法使用索引，
+        改为在索引结果（或全部日志）上按子串过滤。
+
+        Args:
+            query: 关键词
+            device: 设备筛选
+            port: 串口筛选
+            start_time: 开始时间 (ISO格式)
+            end_time: 结束时间 (ISO格式)
+            limit: 返回数量限制
+            offset: 偏移量
+
+        Returns:
+            {'logs': 日志列表(含相关度 score，越小越相关；只有短关键词时为None), 'total': 匹配总数}
+        """
+        self.flush_serial_logs()
 
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
+        terms = (query or '').split()
+        if not terms:
+            return {'logs': [], 'total': 0}
+        match_terms = [t for t in terms if len(t) >= 3 or not self._fts_trigram]
+        like_terms = [t for t in terms if t not in match_terms]
 
-        # 获取总数
-        count_query = 'SELECT COUNT(*) FROM serial_logs WHERE 1=1'
-        count_params = []
+        conditions = []
+        params = []
+        for term in like_terms:
+            pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            conditions.append('(' + ' OR '.join(f"l.{column} LIKE ? ESCAPE '\\'"
+                                                for column in ('command', 'message', 'params', 'response_text')) + ')')
+            params.extend([pattern] * 4)
         if device:
-            count_query += ' AND device = ?'
-            count_params.append(device)
+            conditions.append('l.device = ?')
+            params.append(device)
         if port:
-            count_query += ' AND port = ?'
-            count_params.append(port)
+            conditions.append('l.port = ?')
+            params.append(port)
         if start_time:
-            count_query += ' AND timestamp >= ?'
-            count_params.append(start_time)
+            conditions.append('l.timestamp >= ?')
+            params.append(start_time)
         if end_time:
-            count_query += ' AND timestamp <= ?'
-            count_params.append(end_time)
-
-        cursor.execute(count_query, count_params)
-        total = cursor.fetchone()[0]
+            conditions.append('l.timestamp <= ?')
+            params.append(end_time)
 
-        conn.close()
+        if match_terms:
+            # 每个关键词作为短语，避免 FTS 查询语法字符被解释
+            match = ' '.join('"' + t.replace('"', '""') + '"' for t in match_terms)
+            score = f'bm25(serial_logs_fts, {", ".join(str(w) for w in self.SEARCH_WEIGHTS)})'
+            source = 'FROM serial_logs_fts JOIN serial_logs l ON l.id = serial_logs_fts.rowid ' \
+                     'WHERE serial_logs_fts MATCH ?'
+            params.insert(0, match)
+            # 相关度取整后分档，同一档内按时间倒序：重复出现的消息（仅因参数长短得分略有差异）优先显示最近的
+            order = f'ORDER BY ROUND({score}), l.id DESC'
+        else:
+            score = 'NULL'
+            source = 'FROM serial_logs l WHERE 1=1'
+            order = 'ORDER BY l.id DESC'
+        where = source + ''.join(f' AND {c}' for c in conditions)
+
+        with self._connection() as conn:
+            rows = conn.execute(f'SELECT l.*, {score} AS score {where} {order} LIMIT ? OFFSET ?',
+                                params + [limit, offset]).fetchall()
+            total = conn.execute(f'SELECT COUNT(*) {where}', params).fetchone()[0]
 
         return {
             'logs': [dict(row) for row in rows],
@@ -250,46 +932,121 @@ class DatabaseService:
 
     def delete_serial_log(self, log_id: int) -> bool:
         """删除单条串口日志"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM serial_logs WHERE id = ?', (log_id,))
-        affected = cursor.rowcount
-        conn.commit()
-        conn.close()
+        self.flush_serial_logs()
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM serial_logs WHERE id = ?', (log_id,))
+            affected = cursor.rowcount
+            conn.commit()
         return affected > 0
 
     def clear_serial_logs(self) -> int:
         """清空所有串口日志"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM serial_logs')
-        affected = cursor.rowcount
-        conn.commit()
-        conn.close()
+        self.flush_serial_logs()
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM serial_logs')
+            affected = cursor.rowcount
+            conn.commit()
         return affected
 
     # ==================== 光轴测试记录方法 ====================
 
     def save_image(self, image_data: bytes, prefix: str = 'optical') -> str:
         """
-        保存图片到文件系统
+        保存图片到图片库
+
+        按内容的 SHA-256 保存为 data/images/ab/cd/<哈希>.<扩展名>（前两级目录取哈希前4位，
+        避免单个目录文件过多），扩展名按实际格式确定。相同内容只保存一份，直接返回已有路径。
 
         Args:
             image_data: 图片二进制数据
-            prefix: 文件名前缀
+            prefix: 旧版文件名前缀（按内容命名后不再使用）
 
         Returns:
             图片相对路径
         """
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
-        filename = f'{prefix}_{timestamp}.png'
-        filepath = os.path.join(self.images_dir, filename)
+        digest = hashlib.sha256(image_data).hexdigest()
+        image_format, ext = detect_image_format(image_data)
+        # 先完成数据库初始化再取图片锁：初始化时 collect_images 也要取图片锁
+        self._ensure_database()
+        with self._image_lock, self._connection() as conn:
+            row = conn.execute('SELECT path FROM images WHERE hash = ? LIMIT 1', (digest,)).fetchone()
+            if row and os.path.isfile(os.path.join(self.base_dir, row['path'])):
+                conn.execute('UPDATE images SET last_used = ? WHERE path = ?', (time.time(), row['path']))
+                conn.commit()
+                return row['path']
+
+            relative_dir = os.path.join(digest[:2], digest[2:4])
+            os.makedirs(os.path.join(self.images_dir, relative_dir), exist_ok=True)
+            filename = f'{digest}.{ext}'
+            filepath = os.path.join(self.images_dir, relative_dir, filename)
+            # 先写临时文件再改名，中途失败不会留下不完整的图片
+            tmp_path = filepath + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(image_data)
+            os.replace(tmp_path, filepath)
+
+            # 返回相对路径
+            path = f'data/images/{digest[:2]}/{digest[2:4]}/{filename}'
+            conn.execute('''
+                INSERT INTO images (path, hash, format, size, last_used) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (path) DO UPDATE SET last_used = excluded.last_used
+            ''', (path, digest, image_format, len(image_data), time.time()))
+            conn.commit()
+            return path
+
+    def collect_images(self, paths: List[str] = None) -> int:
+        """
+        删除没有测试记录引用的图片文件
 
-        with open(filepath, 'wb') as f:
-            f.write(image_data)
+        Args:
+            paths: 只检查这些图片，None 检查全部
+
+        Returns:
+            删除的图片数量
+        """
+        query = 'SELECT path FROM images WHERE refcount <= 0 AND last_used < ?'
+        params: List[Any] = [time.time() - self.IMAGE_GRACE_SECONDS]
+        if paths is not None:
+            paths = [p for p in paths if p]
+            if not paths:
+                return 0
+            query += f' AND path IN ({", ".join("?" * len(paths))})'
+            params.extend(paths)
+
+        # 先完成数据库初始化再取图片锁（初始化本身会调用本方法）
+        self._ensure_database()
+        with self._image_lock, self._connection() as conn:
+            unreferenced = [row['path'] for row in conn.execute(query, params).fetchall()]
+            if not unreferenced:
+                return 0
+            conn.executemany('DELETE FROM images WHERE path = ? AND refcount <= 0',
+                             [(path,) for path in unreferenced])
+            conn.commit()
+            thumb_sizes = [name for name in os.listdir(self.thumbs_dir) if name.isdigit()] \
+                if os.path.isdir(self.thumbs_dir) else []
+            for path in unreferenced:
+                full_paths = [os.path.join(self.base_dir, path)]
+                full_paths += [os.path.join(self.base_dir, self.thumbnail_path(path, size)) for size in thumb_sizes]
+                for full_path in full_paths:
+                    try:
+                        os.remove(full_path)
+                    except OSError:
+                        pass
+        return len(unreferenced)
+
+    @staticmethod
+    def thumbnail_path(image_path: str, size) -> str:
+        """
+        图片缩略图的相对路径
 
-        # 返回相对路径
-        return f'data/images/{filename}'
+        data/images/ab/cd/<哈希>.png 的 512 缩略图为 data/thumbs/512/images/ab/cd/<哈希>.png.jpg
+        """
+        relative = image_path.replace('\\', '/')
+        if relative.startswith('data/'):
+            relative = relative[len('data/'):]
+        return f'data/thumbs/{int(size)}/{relative}.jpg'
 
     def save_image_base64(self, base64_data: str, prefix: str = 'optical') -> str:
         """
@@ -319,50 +1076,49 @@ class DatabaseService:
         Returns:
             记录ID
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            INSERT INTO optical_axis_tests (
-                operator,
-                base_camera_id, base_camera_name, base_image_path,
-                base_width, base_height, base_centroid_x, base_centroid_y,
-                base_focal_length, base_pixel_size, base_offset_x, base_offset_y,
-                test_camera_id, test_camera_name, test_image_path,
-                test_width, test_height, test_centroid_x, test_centroid_y,
-                test_focal_length, test_pixel_size, test_offset_x, test_offset_y,
-                remark
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data.get('operator'),
-            data.get('base_camera_id'),
-            data.get('base_camera_name'),
-            data.get('base_image_path'),
-            data.get('base_width'),
-            data.get('base_height'),
-            data.get('base_centroid_x'),
-            data.get('base_centroid_y'),
-            data.get('base_focal_length'),
-            data.get('base_pixel_size'),
-            data.get('base_offset_x'),
-            data.get('base_offset_y'),
-            data.get('test_camera_id'),
-            data.get('test_camera_name'),
-            data.get('test_image_path'),
-            data.get('test_width'),
-            data.get('test_height'),
-            data.get('test_centroid_x'),
-            data.get('test_centroid_y'),
-            data.get('test_focal_length'),
-            data.get('test_pixel_size'),
-            data.get('test_offset_x'),
-            data.get('test_offset_y'),
-            data.get('remark')
-        ))
+        with self._connection() as conn:
+            cursor = conn.cursor()
 
-        record_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+            cursor.execute('''
+                INSERT INTO optical_axis_tests (
+                    operator,
+                    base_camera_id, base_camera_name, base_image_path,
+                    base_width, base_height, base_centroid_x, base_centroid_y,
+                    base_focal_length, base_pixel_size, base_offset_x, base_offset_y,
+                    test_camera_id, test_camera_name, test_image_path,
+                    test_width, test_height, test_centroid_x, test_centroid_y,
+                    test_focal_length, test_pixel_size, test_offset_x, test_offset_y,
+                    remark
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                data.get('operator'),
+                data.get('base_camera_id'),
+                data.get('base_camera_name'),
+                data.get('base_image_path'),
+                data.get('base_width'),
+                data.get('base_height'),
+                data.get('base_centroid_x'),
+                data.get('base_centroid_y'),
+                data.get('base_focal_length'),
+                data.get('base_pixel_size'),
+                data.get('base_offset_x'),
+                data.get('base_offset_y'),
+                data.get('test_camera_id'),
+                data.get('test_camera_name'),
+                data.get('test_image_path'),
+                data.get('test_width'),
+                data.get('test_height'),
+                data.get('test_centroid_x'),
+                data.get('test_centroid_y'),
+                data.get('test_focal_length'),
+                data.get('test_pixel_size'),
+                data.get('test_offset_x'),
+                data.get('test_offset_y'),
+                data.get('remark')
+            ))
+
+            record_id = cursor.lastrowid
+            conn.commit()
         return record_id
 
     def update_optical_test(self, test_id: int, data: Dict) -> bool:
@@ -379,116 +1135,186 @@ class DatabaseService:
         if not data:
             return False
 
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        with self._connection() as conn:
+            cursor = conn.cursor()
 
-        # 构建动态UPDATE语句
-        fields = []
-        values = []
-        for key, value in data.items():
-            fields.append(f'{key} = ?')
-            values.append(value)
+            # 被替换的图片
+            cursor.execute('SELECT base_image_path, test_image_path FROM optical_axis_tests WHERE id = ?', (test_id,))
+            old = cursor.fetchone()
 
-        values.append(test_id)
+            # 构建动态UPDATE语句
+            fields = []
+            values = []
+            for key, value in data.items():
+                fields.append(f'{key} = ?')
+                values.append(value)
 
-        query = f'UPDATE optical_axis_tests SET {", ".join(fields)} WHERE id = ?'
-        cursor.execute(query, values)
+            values.append(test_id)
 
-        affected = cursor.rowcount
-        conn.commit()
-        conn.close()
+            query = f'UPDATE optical_axis_tests SET {", ".join(fields)} WHERE id = ?'
+            cursor.execute(query, values)
+
+            affected = cursor.rowcount
+            conn.commit()
+
+        if old is not None:
+            self.collect_images([old[key] for key in ('base_image_path', 'test_image_path') if key in data])
         return affected > 0
 
     def get_optical_tests(self, start_time: str = None, end_time: str = None,
-                         limit: int = 50, offset: int = 0) -> Dict:
+                         limit: int = 50, offset: int = 0, cursor: str = None) -> Dict:
         """
-        查询光轴测试记录
+        查询光轴测试记录（按测试时间倒序）
 
         Args:
             start_time: 开始时间
             end_time: 结束时间
             limit: 返回数量限制
-            offset: 偏移量
+            offset: 偏移量（未指定 cursor 时使用）
+            cursor: 上一页返回的 nextCursor，从该位置继续
 
         Returns:
-            包含记录列表和总数的字典
+            包含记录列表、总数和下一页游标的字典
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        conditions, params = self._optical_test_conditions(start_time, end_time)
 
-        query = 'SELECT * FROM optical_axis_tests WHERE 1=1'
-        params = []
+        with self._connection() as conn:
+            rows = self._keyset_page(conn, 'optical_axis_tests', 'test_time', conditions, params,
+                                     limit, offset, cursor)
+            total = self._optical_test_total(conn, start_time, end_time)
 
-        if start_time:
-            query += ' AND test_time >= ?'
-            params.append(start_time)
-        if end_time:
-            query += ' AND test_time <= ?'
-            params.append(end_time)
+        return {
+            'records': [dict(row) for row in rows],
+            'total': total,
+            'nextCursor': self._next_cursor(rows, 'test_time', limit),
+        }
 
-        query += ' ORDER BY id DESC LIMIT ? OFFSET ?'
-        params.extend([limit, offset])
+    def iter_optical_tests(self, start_time: str = None, end_time: str = None,
+                           chunk_size: int = None) -> Iterator[List[Dict]]:
+        """
+        分块读取光轴测试记录（按测试时间倒序，用于导出）
 
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
+        Yields:
+            List[Dict]: 每块最多 chunk_size 条记录
+        """
+        conditions, params = self._optical_test_conditions(start_time, end_time)
+        return self._iter_chunks('optical_axis_tests', 'test_time', conditions, params, chunk_size)
 
-        # 获取总数
-        count_query = 'SELECT COUNT(*) FROM optical_axis_tests WHERE 1=1'
-        count_params = []
+    @staticmethod
+    def _optical_test_conditions(start_time: str = None, end_time: str = None) -> Tuple[List[str], List]:
+        """光轴测试记录筛选条件"""
+        conditions = []
+        params = []
         if start_time:
-            count_query += ' AND test_time >= ?'
-            count_params.append(start_time)
+            conditions.append('test_time >= ?')
+            params.append(start_time)
         if end_time:
-            count_query += ' AND test_time <= ?'
-            count_params.append(end_time)
-
-        cursor.execute(count_query, count_params)
-        total = cursor.fetchone()[0]
-
-        conn.close()
+            conditions.append('test_time <= ?')
+            params.append(end_time)
+        return conditions, params
 
-        return {
-            'records': [dict(row) for row in rows],
-            'total': total
-        }
+    @classmethod
+    def _optical_test_total(cls, conn: sqlite3.Connection, start_time: str = None, end_time: str = None) -> int:
+        """光轴测试记录匹配条数：没有时间筛选时直接读取维护好的条数"""
+        conditions, params = cls._optical_test_conditions(start_time, end_time)
+        if conditions:
+            return conn.execute('SELECT COUNT(*) FROM optical_axis_tests WHERE ' + ' AND '.join(conditions),
+                                params).fetchone()[0]
+        return cls._row_count(conn, 'optical_axis_tests')
 
     def get_optical_test(self, test_id: int) -> Optional[Dict]:
         """获取单条光轴测试记录"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM optical_axis_tests WHERE id = ?', (test_id,))
-        row = cursor.fetchone()
-        conn.close()
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM optical_axis_tests WHERE id = ?', (test_id,))
+            row = cursor.fetchone()
         return dict(row) if row else None
 
     def delete_optical_test(self, test_id: int) -> bool:
-        """删除光轴测试记录（同时删除关联图片）"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        """删除光轴测试记录（关联图片不再被其他记录引用时一并删除）"""
+        with self._connection() as conn:
+            cursor = conn.cursor()
 
-        # 先获取图片路径
-        cursor.execute('SELECT base_image_path, test_image_path FROM optical_axis_tests WHERE id = ?', (test_id,))
-        row = cursor.fetchone()
+            # 先获取图片路径
+            cursor.execute('SELECT base_image_path, test_image_path FROM optical_axis_tests WHERE id = ?', (test_id,))
+            row = cursor.fetchone()
 
-        if row:
-            # 删除图片文件
-            for path in [row['base_image_path'], row['test_image_path']]:
-                if path:
-                    full_path = os.path.join(self.base_dir, path)
-                    if os.path.exists(full_path):
-                        try:
-                            os.remove(full_path)
-                        except:
-                            pass
-
-            # 删除记录
-            cursor.execute('DELETE FROM optical_axis_tests WHERE id = ?', (test_id,))
-            conn.commit()
+            if row:
+                # 删除记录（触发器减少图片引用计数）
+                cursor.execute('DELETE FROM optical_axis_tests WHERE id = ?', (test_id,))
+                conn.commit()
+
+            affected = cursor.rowcount
 
-        affected = cursor.rowcount
-        conn.close()
+        if row:
+            self.collect_images([row['base_image_path'], row['test_image_path']])
         return affected > 0
 
 
+class ReadOnlyRecords:
+    """
+    只读记录读取器 - 供导出任务的工作进程读取串口日志和光轴测试记录
+
+    以只读模式 (mode=ro) 直接打开数据库文件，不经过 DatabaseService 单例：不建表迁移、不回收图片、
+    不启动日志写入和保留策略线程。只保存数据库路径，可随任务参数传给 spawn 启动的工作进程。
+    由 DatabaseService.read_only() 创建。
+    """
+
+    EXPORT_CHUNK_SIZE = DatabaseService.EXPORT_CHUNK_SIZE
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    @contextmanager
+    def _connection(self):
+        """打开一个只读连接，用完关闭"""
+        conn = sqlite3.connect(Path(self.db_path).resolve().as_uri() + '?mode=ro', uri=True,
+                               timeout=DatabaseService.CONNECTION_TIMEOUT)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _iter_chunks(self, table: str, time_column: str, conditions: List[str], params: List,
+                     chunk_size: int = None) -> Iterator[List[Dict]]:
+        """按 (时间, id) 倒序分块读取全部匹配行，同 DatabaseService._iter_chunks"""
+        chunk_size = chunk_size or self.EXPORT_CHUNK_SIZE
+        cursor = None
+        while True:
+            with self._connection() as conn:
+                rows = DatabaseService._keyset_page(conn, table, time_column, conditions, params,
+                                                    chunk_size, 0, cursor)
+            if rows:
+                yield [dict(row) for row in rows]
+            cursor = DatabaseService._next_cursor(rows, time_column, chunk_size)
+            if cursor is None:
+                return
+
+    def count_serial_logs(self, device: str = None, port: str = None,
+                          start_time: str = None, end_time: str = None) -> int:
+        """串口日志匹配条数"""
+        with self._connection() as conn:
+            return DatabaseService._serial_log_total(conn, device, port, start_time, end_time)
+
+    def iter_serial_logs(self, device: str = None, port: str = None,
+                         start_time: str = None, end_time: str = None,
+                         chunk_size: int = None) -> Iterator[List[Dict]]:
+        """分块读取串口日志（按时间倒序），同 DatabaseService.iter_serial_logs"""
+        conditions, params = DatabaseService._serial_log_conditions(device, port, start_time, end_time)
+        return self._iter_chunks('serial_logs', 'timestamp', conditions, params, chunk_size)
+
+    def count_optical_tests(self, start_time: str = None, end_time: str = None) -> int:
+        """光轴测试记录匹配条数"""
+        with self._connection() as conn:
+            return DatabaseService._optical_test_total(conn, start_time, end_time)
+
+    def iter_optical_tests(self, start_time: str = None, end_time: str = None,
+                           chunk_size: int = None) -> Iterator[List[Dict]]:
+        """分块读取光轴测试记录（按测试时间倒序），同 DatabaseService.iter_optical_tests"""
+        conditions, params = DatabaseService._optical_test_conditions(start_time, end_time)
+        return self._iter_chunks('optical_axis_tests', 'test_time', conditions, params, chunk_size)
+
+
 # 全局实例
 db_service = DatabaseService()
@@ -0,0 +1,381 @@
+"""
+导出任务 - Excel/CSV 导出和PDF报告在后台生成，不占用请求线程
+
+导出请求只创建任务并立即返回任务ID；任务由常驻进程池生成文件（openpyxl、reportlab 都是
+纯Python的CPU密集计算，放在工作进程中不与 Socket.IO 推流争用GIL），
+进度通过回调（app.py 中转为 Socket.IO 'export_job' 事件）推送，完成后从临时目录下载。
+
+- 每个任务在调度线程中等待工作进程完成，期间转发工作进程经 Manager 队列发回的进度
+- 生成的文件保存在本进程独占的临时目录 plat_exports_*/ 下（多个实例互不影响），完成 ARTIFACT_TTL 秒后
+  过期删除（每次创建/查询任务时清理），shutdown() 时删除整个目录
+- 任务记录超过 MAX_JOBS 条时只淘汰已结束的任务；未结束的任务达到 MAX_JOBS 条时拒绝新任务
+- PDF报告所需的记录和缩略图在主进程中准备好再交给工作进程，工作进程只依赖 reportlab
+- 表格导出的工作进程不使用 db_service 单例，通过主进程创建的 ReadOnlyRecords 以只读连接读取数据库
+- 进程池使用 spawn 方式启动，与 BatchAnalyzer 相同
+"""
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+JOB_TYPES = ('serial-logs', 'optical-tests', 'optical-test-pdf')
+TABLE_FORMATS = ('xlsx', 'csv')
+
+# PDF报告中的图片使用缩略图 (55mm宽约470dpi)，不嵌入原图
+PDF_THUMB_SIZE = 1024
+
+_MIMETYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+    'pdf': 'application/pdf',
+}
+
+
+def _report_progress(progress_queue, done: int, total: int):
+    try:
+        progress_queue.put_nowait((done, total))
+    except Exception:
+        pass
+
+
+def prepare_optical_test_report(ids: List[int]) -> Tuple[List[Dict], List[Tuple[Optional[str], Optional[str]]]]:
+    """
+    读取PDF报告的记录并准备缩略图（主进程中执行，工作进程不访问数据库）
+
+    Returns:
+        (记录列表, 对应的 (基准图片文件路径, 测试图片文件路径) 列表)，不存在的记录跳过
+
+    Raises:
+        ValueError: 记录均不存在
+    """
+    from core.databaseService import db_service
+    from core.thumbnailService import thumbnail_service
+
+    records, images = [], []
+    for test_id in ids:
+        record = db_service.get_optical_test(test_id)
+        if not record:
+            continue
+        paths = []
+        for key in ('base_image_path', 'test_image_path'):
+            path = None
+            if record.get(key):
+                relative = thumbnail_service.get(record[key], PDF_THUMB_SIZE) or record[key]
+                full_path = os.path.join(db_service.base_dir, relative)
+                path = full_path if os.path.isfile(full_path) else None
+            paths.append(path)
+        records.append(record)
+        images.append(tuple(paths))
+    if not records:
+        raise ValueError('记录不存在')
+    return records, images
+
+
+def run_table_export(kind: str, fmt: str, filters: Dict, reader, path: str, progress_queue) -> int:
+    """
+    导出串口日志/光轴测试记录到文件（在工作进程中执行）
+
+    Args:
+        reader: 主进程中 db_service.read_only() 创建的 ReadOnlyRecords
+
+    Returns:
+        int: 导出的行数
+    """
+    from core.recordExport import write_excel, write_csv
+
+    filters = filters or {}
+    if kind == 'serial-logs':
+        total = reader.count_serial_logs(**filters)
+    else:
+        total = reader.count_optical_tests(**filters)
+    _report_progress(progress_queue, 0, total)
+
+    writer = write_excel if fmt == 'xlsx' else write_csv
+    return writer(path, kind, filters, progress=lambda done: _report_progress(progress_queue, done, total),
+                  source=reader)
+
+
+def run_pdf_report(records: List[Dict], images: List[Tuple[Optional[str], Optional[str]]],
+                   path: str, progress_queue) -> int:
+    """
+    生成PDF报告（在工作进程中执行）
+
+    Returns:
+        int: 页数
+    """
+    from core.reportPdf import build_optical_test_report
+    return build_optical_test_report(path, records, images,
+                                     progress=lambda done, total: _report_progress(progress_queue, done, total))
+
+
+class ExportJobManager:
+    """
+    导出任务管理器 - 管理调度线程、常驻进程池和生成的临时文件
+    """
+
+    MAX_WORKERS = 2          # 同时运行的任务数（工作进程数）
+    ARTIFACT_TTL = 3600      # 生成的文件保留秒数
+    MAX_JOBS = 100           # 内存中保留的任务记录数（也是未结束任务数的上限）
+    PROGRESS_INTERVAL = 0.25  # 进度推送最小间隔(秒)
+
+    def __init__(self, artifact_dir: str = None):
+        # 未指定时首次使用才创建本进程独占的临时目录（见 _prepare_artifact_dir）
+        self.artifact_dir = artifact_dir
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, dict]" = OrderedDict()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._dispatcher: Optional[ThreadPoolExecutor] = None
+        self._manager = None
+        self._listener: Optional[Callable[[dict], None]] = None
+        self._prepared = False
+        self._owns_artifact_dir = False
+
+    # ======================== 进程池 ========================
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.MAX_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+            return self._executor
+
+    def _get_dispatcher(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._dispatcher is None:
+                self._dispatcher = ThreadPoolExecutor(max_workers=self.MAX_WORKERS,
+                                                      thread_name_prefix='export-job')
+            return self._dispatcher
+
+    def _new_progress_queue(self):
+        """工作进程发回进度用的队列（Manager代理可随任务参数传给工作进程）"""
+        with self._lock:
+            if self._manager is None:
+                self._manager = multiprocessing.get_context('spawn').Manager()
+            return self._manager.Queue()
+
+    def shutdown(self):
+        """关闭进程池和调度线程"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            if self._dispatcher is not None:
+                self._dispatcher.shutdown(wait=False, cancel_futures=True)
+                self._dispatcher = None
+            if self._manager is not None:
+                self._manager.shutdown()
+                self._manager = None
+            if self._prepared and self._owns_artifact_dir:
+                # 只删除自己创建的临时目录
+                shutil.rmtree(self.artifact_dir, ignore_errors=True)
+                self.artifact_dir = None
+                self._prepared = False
+
+    # ======================== 任务 ========================
+
+    def set_listener(self, listener: Optional[Callable[[dict], None]]):
+        """设置任务状态/进度变化回调，参数为任务信息（同 get_job）"""
+        self._listener = listener
+
+    def _notify(self, job: dict):
+        listener = self._listener
+        if listener is not None:
+            try:
+                listener(self._public(job))
+            except Exception as e:
+                print(f"[Export Jobs] 推送任务进度失败: {e}")
+
+    @staticmethod
+    def _public(job: dict) -> dict:
+        return {key: value for key, value in job.items() if not key.startswith('_')}
+
+    def submit(self, job_type: str, fmt: str = None, filters: Dict = None,
+               ids: List[int] = None, owner: str = None) -> dict:
+        """
+        创建导出任务
+
+        Args:
+            job_type: 'serial-logs' / 'optical-tests' (表格) 或 'optical-test-pdf' (PDF报告)
+            fmt: 表格格式 'xlsx' / 'csv'，PDF报告忽略
+            filters: 表格导出的筛选条件
+            ids: PDF报告包含的测试记录ID（多条合并为一个PDF，每条一页）
+            owner: 发起任务的客户端标识（Socket.IO sid），随进度事件返回
+
+        Returns:
+            dict: 任务信息
+
+        Raises:
+            ValueError: 参数无效，或未结束的任务已达 MAX_JOBS 条
+        """
+        if job_type not in JOB_TYPES:
+            raise ValueError(f'未知的导出类型: {job_type}')
+        if job_type == 'optical-test-pdf':
+            fmt = 'pdf'
+            ids = [int(i) for i in (ids or [])]
+            if not ids:
+                raise ValueError('请选择要生成报告的测试记录')
+        elif (fmt or 'xlsx') not in TABLE_FORMATS:
+            raise ValueError(f'不支持的导出格式: {fmt}')
+        else:
+            fmt = fmt or 'xlsx'
+
+        self._prepare_artifact_dir()
+        self.expire()
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            'jobId': job_id,
+            'type': job_type,
+            'format': fmt,
+            'status': 'queued',
+            'done': 0,
+            'total': len(ids) if ids else None,
+            'message': '',
+            'filename': self._filename(job_type, fmt, ids),
+            'size': None,
+            'owner': owner,
+            'createdAt': time.time(),
+            'finishedAt': None,
+            'expiresAt': None,
+            '_filters': dict(filters or {}),
+            '_ids': ids,
+            '_path': os.path.join(self.artifact_dir, f'{job_id}.{fmt}'),
+        }
+        with self._lock:
+            if sum(1 for j in self._jobs.values() if j['finishedAt'] is None) >= self.MAX_JOBS:
+                raise ValueError(f'未完成的导出任务过多（{self.MAX_JOBS}个），请稍后再试')
+            self._jobs[job_id] = job
+            # 只淘汰已结束的任务，进行中的任务完成后仍可查询和下载
+            finished = [key for key, j in self._jobs.items() if j['finishedAt'] is not None]
+            evicted = [self._jobs.pop(key) for key in finished[:max(0, len(self._jobs) - self.MAX_JOBS)]]
+        for old in evicted:
+            self._remove_artifact(old)
+        public = self._public(job)
+        self._notify(job)
+        self._get_dispatcher().submit(self._run, job)
+        return public
+
+    @staticmethod
+    def _filename(job_type: str, fmt: str, ids: Optional[List[int]]) -> str:
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        if job_type == 'optical-test-pdf':
+            if len(ids) == 1:
+                return f'optical_test_report_{ids[0]}_{stamp}.pdf'
+            return f'optical_test_reports_{len(ids)}_{stamp}.pdf'
+        prefix = 'serial_logs' if job_type == 'serial-logs' else 'optical_tests'
+        return f'{prefix}_{stamp}.{fmt}'
+
+    def _run(self, job: dict):
+        """调度线程：提交到进程池，转发进度直到完成"""
+        job['status'] = 'running'
+        self._notify(job)
+        try:
+            progress_queue = self._new_progress_queue()
+            if job['type'] == 'optical-test-pdf':
+                records, images = prepare_optical_test_report(job['_ids'])
+                job['total'] = len(records)
+                future = self._get_executor().submit(run_pdf_report, records, images, job['_path'], progress_queue)
+            else:
+                from core.databaseService import db_service
+                future = self._get_executor().submit(run_table_export, job['type'], job['format'], job['_filters'],
+                                                     db_service.read_only(), job['_path'], progress_queue)
+
+            last_notify = 0.0
+            while True:
+                finished = future.done()
+                try:
+                    while True:
+                        job['done'], job['total'] = progress_queue.get(timeout=0 if finished else 0.2)
+                except queue.Empty:
+                    pass
+                if finished:
+                    break
+                now = time.monotonic()
+                if now - last_notify >= self.PROGRESS_INTERVAL:
+                    last_notify = now
+                    self._notify(job)
+
+            result = future.result()
+            job['status'] = 'done'
+            job['message'] = f'共 {result} 页' if job['format'] == 'pdf' else f'共 {result} 行'
+            job['size'] = os.path.getsize(job['_path'])
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                # 工作进程异常退出，下个任务重新创建进程池
+                with self._lock:
+                    if self._executor is not None:
+                        self._executor.shutdown(wait=False, cancel_futures=True)
+                        self._executor = None
+            job['status'] = 'failed'
+            job['message'] = str(e)
+            self._remove_artifact(job)
+        job['finishedAt'] = time.time()
+        job['expiresAt'] = job['finishedAt'] + self.ARTIFACT_TTL
+        self._notify(job)
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        """获取任务信息，不存在或已过期返回None"""
+        self.expire()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._public(job) if job else None
+
+    def get_artifact(self, job_id: str) -> Optional[Tuple[str, str, str]]:
+        """
+        获取已完成任务的文件
+
+        Returns:
+            (文件路径, 下载文件名, MIME类型)，任务未完成、失败或已过期返回None
+        """
+        self.expire()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if not job or job['status'] != 'done' or not os.path.isfile(job['_path']):
+            return None
+        return job['_path'], job['filename'], _MIMETYPES[job['format']]
+
+    # ======================== 临时文件 ========================
+
+    def _prepare_artifact_dir(self):
+        """首次使用时创建临时目录（未指定目录时用 mkdtemp 创建本进程独占的目录）"""
+        with self._lock:
+            if self._prepared:
+                return
+            if self.artifact_dir is None:
+                self.artifact_dir = tempfile.mkdtemp(prefix='plat_exports_')
+                self._owns_artifact_dir = True
+            else:
+                os.makedirs(self.artifact_dir, exist_ok=True)
+            self._prepared = True
+
+    @staticmethod
+    def _remove_artifact(job: dict):
+        try:
+            os.remove(job['_path'])
+        except OSError:
+            pass
+
+    def expire(self) -> int:
+        """删除过期任务及其文件，返回删除的任务数"""
+        now = time.time()
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job['expiresAt'] is not None and job['expiresAt'] <= now]
+            jobs = [self._jobs.pop(job_id) for job_id in expired]
+        for job in jobs:
+            self._remove_artifact(job)
+        return len(jobs)
+
+
+# 全局导出任务管理器
+export_jobs = ExportJobManager()
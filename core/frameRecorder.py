@@ -0,0 +1,401 @@
+"""
+原始帧录制 - 将相机原始帧及帧信息写入预分配的内存映射文件
+
+文件结构（小端）:
+    [文件头 64字节] [索引区 capacity × 64字节] [帧数据区 capacity × 单帧字节数]
+
+- 每帧占用一个固定大小的槽位，写满后循环覆盖最早的帧（环形缓冲）
+- 索引记录写入序号、帧号、设备时间戳、主机时间戳和质心，离线分析时可按序号重建顺序
+- 首帧到达时按其尺寸和位深(Mono8/Mono16)一次性分配文件，之后每帧只做内存拷贝
+
+RecentFrames 是各相机服务常驻的内存环形缓存（按时间保留最近几秒），保存测试记录时按帧号取回原始帧。
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+FILE_MAGIC = b'PLATFRM1'
+FILE_VERSION = 1
+HEADER_SIZE = 64
+# magic, version, width, height, bytes_per_pixel, capacity, pixel_bits, frame_bytes, count
+# pixel_bits 为像素有效位数 (Mono10/12/16 为 10/12/16)，0 表示未知（旧文件）
+_HEADER_STRUCT = struct.Struct('<8sIIIIIIQQ')
+
+INDEX_DTYPE = np.dtype([
+    ('seq', '<u8'),           # 写入序号 (从0开始递增)
+    ('frame_num', '<u8'),     # 相机帧号
+    ('device_ts', '<u8'),     # 设备时间戳 (相机时钟，单位由设备决定)
+    ('host_ts_ns', '<u8'),    # 主机时间戳 (time.time_ns)
+    ('centroid_x', '<f8'),
+    ('centroid_y', '<f8'),
+    ('valid', '<u8'),         # 1表示槽位有数据
+    ('reserved', '<u8'),
+])
+assert INDEX_DTYPE.itemsize == 64
+
+_PIXEL_DTYPES = {1: np.dtype('<u1'), 2: np.dtype('<u2')}
+
+# count 字段在文件头中的偏移
+_COUNT_OFFSET = _HEADER_STRUCT.size - 8
+
+
+def _frames_offset(capacity: int) -> int:
+    """帧数据区起始偏移（按4KB对齐）"""
+    offset = HEADER_SIZE + capacity * INDEX_DTYPE.itemsize
+    return (offset + 4095) // 4096 * 4096
+
+
+class FrameRecorder:
+    """
+    原始帧录制器
+
+    线程安全：write() 在相机采集线程中调用，close() 可在任意线程调用。
+    """
+
+    def __init__(self, path: str, capacity: int = 300):
+        """
+        Args:
+            path: 录制文件路径
+            capacity: 帧槽位数量，写满后循环覆盖
+        """
+        if capacity <= 0:
+            raise ValueError("capacity 必须大于0")
+        self.path = path
+        self.capacity = int(capacity)
+        self.width = 0
+        self.height = 0
+        self.dtype: Optional[np.dtype] = None
+        self.pixel_bits = 0     # 像素有效位数，0 表示未知
+        self.count = 0          # 已写入帧数（含被覆盖的）
+        self.dropped = 0        # 因尺寸/位深变化被丢弃的帧数
+        self.started_at = time.time()
+
+        self._lock = threading.Lock()
+        self._closed = False
+        self._file = None
+        self._mm: Optional[mmap.mmap] = None
+        self._frames: Optional[np.ndarray] = None
+        self._count_view: Optional[np.ndarray] = None
+        # 索引各字段的列视图，写入时直接按槽位赋值，避免每帧创建对象
+        self._col_seq = None
+        self._col_frame_num = None
+        self._col_device_ts = None
+        self._col_host_ts = None
+        self._col_cx = None
+        self._col_cy = None
+        self._col_valid = None
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    @property
+    def is_allocated(self) -> bool:
+        return self._mm is not None
+
+    def _allocate(self, height: int, width: int, dtype: np.dtype, pixel_bits: int):
+        """按首帧尺寸创建并映射录制文件"""
+        bytes_per_pixel = dtype.itemsize
+        frame_bytes = width * height * bytes_per_pixel
+        frames_offset = _frames_offset(self.capacity)
+        total_size = frames_offset + frame_bytes * self.capacity
+
+        self._file = open(self.path, 'w+b')
+        self._file.truncate(total_size)
+        self._mm = mmap.mmap(self._file.fileno(), total_size)
+        self._mm[:_HEADER_STRUCT.size] = _HEADER_STRUCT.pack(
+            FILE_MAGIC, FILE_VERSION, width, height, bytes_per_pixel, self.capacity, pixel_bits, frame_bytes, 0)
+
+        index = np.ndarray((self.capacity,), dtype=INDEX_DTYPE, buffer=self._mm, offset=HEADER_SIZE)
+        self._col_seq = index['seq']
+        self._col_frame_num = index['frame_num']
+        self._col_device_ts = index['device_ts']
+        self._col_host_ts = index['host_ts_ns']
+        self._col_cx = index['centroid_x']
+        self._col_cy = index['centroid_y']
+        self._col_valid = index['valid']
+        self._frames = np.ndarray((self.capacity, height, width), dtype=dtype,
+                                  buffer=self._mm, offset=frames_offset)
+        self._count_view = np.ndarray((1,), dtype='<u8', buffer=self._mm, offset=_COUNT_OFFSET)
+
+        self.width = width
+        self.height = height
+        self.dtype = dtype
+        self.pixel_bits = pixel_bits
+
+    def write(self, frame: np.ndarray, frame_num: int, device_ts: int = 0,
+              centroid_x: float = -1.0, centroid_y: float = -1.0, pixel_bits: int = 0) -> bool:
+        """
+        写入一帧
+
+        Args:
+            frame: 单通道图像 (uint8 或 uint16)
+            frame_num: 相机帧号
+            device_ts: 设备时间戳
+            centroid_x: 质心X (无目标为-1)
+            centroid_y: 质心Y (无目标为-1)
+            pixel_bits: 像素有效位数 (如Mono12为12)，0 表示未知；8位图像固定为8
+
+        Returns:
+            bool: 写入成功返回True；录制已关闭或帧格式不匹配返回False
+        """
+        if frame.dtype.itemsize == 1:
+            pixel_bits = 8
+        with self._lock:
+            if self._closed:
+                return False
+            if self._mm is None:
+                if frame.ndim != 2 or frame.dtype.itemsize not in _PIXEL_DTYPES:
+                    self.dropped += 1
+                    return False
+                self._allocate(frame.shape[0], frame.shape[1], _PIXEL_DTYPES[frame.dtype.itemsize], int(pixel_bits))
+            elif frame.shape != (self.height, self.width) or frame.dtype.itemsize != self.dtype.itemsize \
+                    or pixel_bits != self.pixel_bits:
+                # 录制过程中修改了ROI或像素格式
+                self.dropped += 1
+                return False
+
+            slot = self.count % self.capacity
+            np.copyto(self._frames[slot], frame, casting='unsafe')
+            self._col_seq[slot] = self.count
+            self._col_frame_num[slot] = frame_num
+            self._col_device_ts[slot] = device_ts
+            self._col_host_ts[slot] = time.time_ns()
+            self._col_cx[slot] = centroid_x
+            self._col_cy[slot] = centroid_y
+            self._col_valid[slot] = 1
+            self.count += 1
+            self._count_view[0] = self.count
+            return True
+
+    def close(self) -> Dict:
+        """停止录制并关闭文件，返回录制统计"""
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                if self._mm is not None:
+                    # 释放所有指向映射内存的numpy视图后才能关闭mmap
+                    self._frames = self._count_view = None
+                    self._col_seq = self._col_frame_num = self._col_device_ts = None
+                    self._col_host_ts = self._col_cx = self._col_cy = self._col_valid = None
+                    self._mm.flush()
+                    self._mm.close()
+                    self._mm = None
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+            return self.get_status()
+
+    def get_status(self) -> Dict:
+        """获取录制状态"""
+        return {
+            'path': self.path,
+            'recording': not self._closed,
+            'capacity': self.capacity,
+            'count': self.count,
+            'stored': min(self.count, self.capacity),
+            'dropped': self.dropped,
+            'width': self.width,
+            'height': self.height,
+            'bitDepth': self.dtype.itemsize * 8 if self.dtype is not None else 0,
+            'pixelBits': self.pixel_bits,
+            'startedAt': self.started_at,
+        }
+
+
+class FrameReader:
+    """
+    录制文件读取器 - 按写入顺序索引访问录制的帧
+
+    帧数据直接映射自文件，返回的数组为只读视图，需要修改时请先 copy()。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"录制文件为空: {path}")
+
+        (magic, version, self.width, self.height, bytes_per_pixel,
+         self.capacity, pixel_bits, frame_bytes, self.count) = _HEADER_STRUCT.unpack_from(self._mm, 0)
+        if magic != FILE_MAGIC or version != FILE_VERSION or bytes_per_pixel not in _PIXEL_DTYPES:
+            self.close()
+            raise ValueError(f"不是有效的帧录制文件: {path}")
+
+        self.dtype = _PIXEL_DTYPES[bytes_per_pixel]
+        # 像素有效位数，旧文件未记录时为None
+        self.pixel_bits: Optional[int] = pixel_bits or (8 if bytes_per_pixel == 1 else None)
+        index = np.ndarray((self.capacity,), dtype=INDEX_DTYPE, buffer=self._mm, offset=HEADER_SIZE)
+        self._frames = np.ndarray((self.capacity, self.height, self.width), dtype=self.dtype,
+                                  buffer=self._mm, offset=_frames_offset(self.capacity))
+
+        # 按写入序号排序的有效槽位（环形覆盖后最早的帧不一定在槽位0）
+        valid_slots = np.nonzero(index['valid'])[0]
+        self._order = valid_slots[np.argsort(index['seq'][valid_slots], kind='stable')]
+        self.index = index[self._order]
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def __getitem__(self, i: int) -> Tuple[np.void, np.ndarray]:
+        """返回第i帧 (按写入顺序) 的 (索引记录, 图像)"""
+        return self.index[i], self._frames[self._order[i]]
+
+    def __iter__(self) -> Iterator[Tuple[np.void, np.ndarray]]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def get_info(self) -> Dict:
+        """获取录制文件信息"""
+        duration = 0.0
+        if len(self) > 1:
+            duration = (int(self.index['host_ts_ns'][-1]) - int(self.index['host_ts_ns'][0])) / 1e9
+        return {
+            'path': self.path,
+            'width': self.width,
+            'height': self.height,
+            'bitDepth': self.dtype.itemsize * 8,
+            'pixelBits': self.pixel_bits,
+            'capacity': self.capacity,
+            'count': self.count,
+            'frames': len(self),
+            'duration': duration,
+        }
+
+    def close(self):
+        self.index = None
+        self._frames = None
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                # 调用方仍持有帧视图，映射随视图一起由GC释放
+                pass
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class RecentFrames:
+    """
+    最近帧环形缓存 - 在内存中保留每台相机最近一段时间的原始图像，按帧号取回
+
+    保存测试记录时由服务端按 (相机, 帧号) 取出无损原始帧写入图片库，
+    浏览器只需提交帧号，不必再上传显示用的JPEG。
+    缓存按时间保留：环满且将被覆盖的帧仍在 seconds 秒之内时扩容（容量翻倍），
+    因此高帧率下也至少保留最近 seconds 秒的帧；总字节数不超过 max_bytes。
+    槽位按首帧尺寸预分配，之后每帧只做一次内存拷贝；尺寸或位深变化时重新分配。
+
+    线程安全：put() 在相机采集线程中调用，get() 可在任意线程调用。
+    """
+
+    MIN_CAPACITY = 8
+
+    def __init__(self, seconds: float = 2.0, max_bytes: int = 512 * 1024 * 1024):
+        self._lock = threading.Lock()
+        self.set_retention(seconds, max_bytes)
+        self.capacity = self.MIN_CAPACITY
+        self._frames = None
+        self._frame_nums = [None] * self.capacity
+        self._frame_times = [0.0] * self.capacity
+        self._count = 0
+
+    def set_retention(self, seconds: float, max_bytes: int):
+        """
+        设置保留时长和内存上限
+
+        Args:
+            seconds: 至少保留最近多少秒的帧
+            max_bytes: 缓存占用的最大字节数（至少保留 MIN_CAPACITY 帧）
+        """
+        if seconds <= 0 or max_bytes <= 0:
+            raise ValueError("seconds 和 max_bytes 必须大于0")
+        with self._lock:
+            self.seconds = float(seconds)
+            self.max_bytes = int(max_bytes)
+
+    def put(self, frame: np.ndarray, frame_num: int):
+        """缓存一帧（拷贝，调用方可立即释放或复用 frame 的缓冲区）"""
+        now = time.monotonic()
+        with self._lock:
+            if self._frames is None or self._frames.shape[1:] != frame.shape \
+                    or self._frames.dtype != frame.dtype:
+                self._allocate(self.MIN_CAPACITY, frame)
+            slot = self._count % self.capacity
+            if self._count >= self.capacity and now - self._frame_times[slot] < self.seconds:
+                max_capacity = max(self.MIN_CAPACITY, self.max_bytes // max(frame.nbytes, 1))
+                if self.capacity < max_capacity:
+                    self._grow(min(self.capacity * 2, max_capacity))
+                    slot = self._count % self.capacity
+            np.copyto(self._frames[slot], frame)
+            self._frame_nums[slot] = int(frame_num)
+            self._frame_times[slot] = now
+            self._count += 1
+
+    def _allocate(self, capacity: int, frame: np.ndarray):
+        """按帧尺寸重新分配槽位，丢弃已缓存的帧"""
+        self.capacity = capacity
+        self._frames = np.empty((capacity,) + frame.shape, dtype=frame.dtype)
+        self._frame_nums = [None] * capacity
+        self._frame_times = [0.0] * capacity
+        self._count = 0
+
+    def _grow(self, capacity: int):
+        """扩容，已缓存的帧按从旧到新的顺序搬到新槽位的开头"""
+        order = [(self._count + i) % self.capacity for i in range(self.capacity)]
+        frames = np.empty((capacity,) + self._frames.shape[1:], dtype=self._frames.dtype)
+        frames[:self.capacity] = self._frames[order]
+        self._frame_nums = [self._frame_nums[i] for i in order] + [None] * (capacity - self.capacity)
+        self._frame_times = [self._frame_times[i] for i in order] + [0.0] * (capacity - self.capacity)
+        self._frames = frames
+        self._count = self.capacity
+        self.capacity = capacity
+
+    def get(self, frame_num: Optional[int] = None) -> Optional[np.ndarray]:
+        """
+        取回指定帧号的帧副本
+
+        Args:
+            frame_num: 帧号，None 表示最新一帧
+
+        Returns:
+            np.ndarray: 帧副本；该帧已被覆盖或尚无帧时返回None
+        """
+        with self._lock:
+            if self._frames is None or not self._count:
+                return None
+            if frame_num is None:
+                return self._frames[(self._count - 1) % self.capacity].copy()
+            try:
+                slot = self._frame_nums.index(int(frame_num))
+            except ValueError:
+                return None
+            return self._frames[slot].copy()
+
+    def frame_nums(self) -> list:
+        """当前缓存的帧号（从旧到新）"""
+        with self._lock:
+            start = self._count if self._count > self.capacity else 0
+            return [self._frame_nums[(start + i) % self.capacity]
+                    for i in range(min(self._count, self.capacity))]
+
+    def clear(self):
+        with self._lock:
+            self.capacity = self.MIN_CAPACITY
+            self._frames = None
+            self._frame_nums = [None] * self.capacity
+            self._frame_times = [0.0] * self.capacity
+            self._count = 0
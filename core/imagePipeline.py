@@ -0,0 +1,114 @@
+"""
+图像处理流水线 - 质心提取各阶段的公共实现
+
+CameraService、SDICameraService 和 VirtualCameraService 的 centroidExtract
+都由这里的阶段函数组成：(解码) → 中值滤波 → 二值化 → 矩计算 → (色彩转换) → JPEG编码 → base64。
+
+各函数可选接收 timings 字典，传入时按阶段名累加耗时（秒），
+供基准测试统计各阶段开销；正常推流时不传，不产生额外开销。
+"""
+import base64
+import time
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# 阶段名称（基准测试报告按此顺序输出）
+STAGES = ('decode', 'median', 'threshold', 'moments', 'convert', 'encode', 'base64')
+
+
+def lap_timing(timings: Optional[Dict[str, float]], stage: str, start: float) -> float:
+    """记录一个阶段的耗时并返回新的起点"""
+    now = time.perf_counter()
+    timings[stage] = timings.get(stage, 0.0) + (now - start)
+    return now
+
+
+def extract_centroid(gray_image: np.ndarray, threshold: int, median_kernel_size: int = 0,
+                     weighted: bool = True,
+                     timings: Optional[Dict[str, float]] = None) -> Tuple[np.ndarray, np.ndarray, float, float]:
+    """
+    中值滤波 + 二值化 + 质心计算
+
+    Args:
+        gray_image: 灰度图像 (Mono8)
+        threshold: 二值化阈值 (0-255)
+        median_kernel_size: 中值滤波核大小，0表示不滤波
+        weighted: True 使用阈值以上像素的灰度强度加权质心，False 使用二值图质心
+        timings: 阶段耗时字典（可选）
+
+    Returns:
+        (filtered, binary, cx, cy): 滤波后图像、二值图、质心坐标（无目标时为 -1.0）
+    """
+    t = time.perf_counter() if timings is not None else 0.0
+
+    if median_kernel_size > 0:
+        gray_image = cv2.medianBlur(gray_image, median_kernel_size)
+    if timings is not None:
+        t = lap_timing(timings, 'median', t)
+
+    _, binary = cv2.threshold(gray_image, int(threshold), 255, cv2.THRESH_BINARY)
+    if timings is not None:
+        t = lap_timing(timings, 'threshold', t)
+
+    if weighted:
+        # 阈值以下像素设为0，保留原始灰度值用于加权计算
+        masked = np.where(binary > 0, gray_image, 0).astype(np.float64)
+        M = cv2.moments(masked)
+    else:
+        M = cv2.moments(binary)
+
+    if M["m00"] > 0:
+        cx = M["m10"] / M["m00"]
+        cy = M["m01"] / M["m00"]
+    else:
+        cx, cy = -1.0, -1.0
+    if timings is not None:
+        lap_timing(timings, 'moments', t)
+
+    return gray_image, binary, cx, cy
+
+
+def encode_data_url(image: np.ndarray, quality: Optional[int] = None,
+                    timings: Optional[Dict[str, float]] = None) -> Optional[str]:
+    """
+    将图像编码为 JPEG data URL
+
+    Args:
+        image: 待编码图像 (灰度或BGR)
+        quality: JPEG质量 (None 使用OpenCV默认值95)
+        timings: 阶段耗时字典（可选）
+
+    Returns:
+        str: 'data:image/jpeg;base64,...'，编码失败返回None
+    """
+    t = time.perf_counter() if timings is not None else 0.0
+
+    params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)] if quality is not None else []
+    ok, buf = cv2.imencode('.jpg', image, params)
+    if timings is not None:
+        t = lap_timing(timings, 'encode', t)
+    if not ok:
+        return None
+
+    image_base64 = base64.b64encode(buf.tobytes()).decode('ascii')
+    if timings is not None:
+        lap_timing(timings, 'base64', t)
+
+    return f'data:image/jpeg;base64,{image_base64}'
+
+
+def encode_png(image: np.ndarray, compression: int = 3) -> Optional[bytes]:
+    """
+    将图像无损编码为 PNG（保存测试图片用）
+
+    Args:
+        image: 灰度(uint8/uint16)或BGR图像；uint16 保存为16位PNG，保留 Mono10/12/16 原始数值
+        compression: zlib压缩级别 0-9，越大文件越小、编码越慢
+
+    Returns:
+        bytes: PNG数据，编码失败返回None
+    """
+    ok, buf = cv2.imencode('.png', image, [cv2.IMWRITE_PNG_COMPRESSION, int(compression)])
+    return buf.tobytes() if ok else None
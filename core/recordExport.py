@@ -0,0 +1,249 @@
+"""
+记录导出 - 串口日志、光轴测试记录导出为 Excel / CSV
+
+数据按块从数据库读取（iter_serial_logs / iter_optical_tests，键集分页），默认读取 db_service，
+导出任务的工作进程传入只读读取器 ReadOnlyRecords；逐块转换、逐行写出，内存占用与导出行数无关：
+- Excel 使用 openpyxl 只写模式 (write_only)，行数据直接写入临时文件，不在内存中保留单元格对象
+- CSV 由生成器逐块产出编码后的字节，可直接作为分块HTTP响应发送
+- HEX转字符按块批量处理：整块数据一次 bytes.fromhex + 查表替换，不再逐字节 int()/chr()
+"""
+import csv
+import functools
+import io
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional
+
+# Excel单个工作表的最大行数（含表头）
+MAX_EXCEL_ROWS = 1048576
+
+# 可打印字符(32-126)和扩展ASCII(128-255)原样保留，其他字节显示为点号
+_DISPLAY_TABLE = bytes(b if 32 <= b <= 126 or b >= 128 else ord('.') for b in range(256))
+
+# (表头, Excel列宽)
+SERIAL_LOG_COLUMNS = [
+    ('ID', 8), ('时间', 20), ('设备', 15), ('串口', 10), ('指令', 20), ('参数', 30),
+    ('发送数据(HEX)', 30), ('发送数据(字符)', 25), ('返回数据(HEX)', 30), ('返回数据(字符)', 25),
+    ('状态', 8), ('消息', 40),
+]
+
+OPTICAL_TEST_COLUMNS = [
+    ('ID', 8), ('测试时间', 20),
+    ('基准相机ID', 10), ('基准相机', 12), ('基准图像路径', 40), ('基准宽度', 10), ('基准高度', 10),
+    ('基准质心X', 12), ('基准质心Y', 12), ('基准焦距(mm)', 12), ('基准像元(μm)', 12),
+    ('基准偏移X(°)', 12), ('基准偏移Y(°)', 12),
+    ('测试相机ID', 10), ('测试相机', 12), ('测试图像路径', 40), ('测试宽度', 10), ('测试高度', 10),
+    ('测试质心X', 12), ('测试质心Y', 12), ('测试焦距(mm)', 12), ('测试像元(μm)', 12),
+    ('测试偏移X(°)', 12), ('测试偏移Y(°)', 12), ('备注', 30),
+]
+
+_OPTICAL_TEST_FIELDS = [
+    'base_camera_id', 'base_camera_name', 'base_image_path', 'base_width', 'base_height',
+    'base_centroid_x', 'base_centroid_y', 'base_focal_length', 'base_pixel_size',
+    'base_offset_x', 'base_offset_y',
+    'test_camera_id', 'test_camera_name', 'test_image_path', 'test_width', 'test_height',
+    'test_centroid_x', 'test_centroid_y', 'test_focal_length', 'test_pixel_size',
+    'test_offset_x', 'test_offset_y', 'remark',
+]
+
+
+def hex_to_string(hex_str: Optional[str]) -> str:
+    """将HEX字符串转换为可读字符串（单条）"""
+    if not hex_str or hex_str == '-':
+        return ''
+    try:
+        hex_clean = hex_str.replace(' ', '')
+        data = bytes.fromhex(hex_clean[:len(hex_clean) // 2 * 2])
+        return data.translate(_DISPLAY_TABLE).decode('latin-1')
+    except ValueError:
+        return hex_str  # 转换失败返回原字符串
+
+
+def hex_to_strings(hex_values: List[Optional[str]]) -> List[str]:
+    """
+    批量将HEX字符串转换为可读字符串，结果与逐条 hex_to_string 相同
+
+    整块拼接后一次解码和查表，再按各条长度切分；块中有无法解析的值时逐条转换。
+    """
+    cleaned = []
+    for value in hex_values:
+        if not value or value == '-':
+            cleaned.append('')
+        else:
+            value = value.replace(' ', '')
+            cleaned.append(value[:len(value) // 2 * 2])
+    joined = ''.join(cleaned)
+    try:
+        data = bytes.fromhex(joined)
+    except ValueError:
+        return [hex_to_string(value) for value in hex_values]
+    if len(data) * 2 != len(joined):
+        # fromhex 会忽略空白字符，长度对不上时无法按偏移切分
+        return [hex_to_string(value) for value in hex_values]
+    text = data.translate(_DISPLAY_TABLE).decode('latin-1')
+    result = []
+    pos = 0
+    for value in cleaned:
+        end = pos + len(value) // 2
+        result.append(text[pos:end])
+        pos = end
+    return result
+
+
+@functools.lru_cache(maxsize=4096)
+def utc_to_local(timestamp: Optional[str]) -> Optional[str]:
+    """数据库中的UTC时间转换为本地时间字符串（同一秒的时间戳只转换一次）"""
+    if not timestamp:
+        return timestamp
+    try:
+        utc_str = str(timestamp).replace(' ', 'T')
+        if not utc_str.endswith('Z') and '+' not in utc_str:
+            utc_str += '+00:00'
+        utc_dt = datetime.fromisoformat(utc_str.replace('Z', '+00:00'))
+        return utc_dt.astimezone().strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return timestamp
+
+
+def serial_log_rows(logs: List[Dict]) -> List[list]:
+    """一块串口日志转换为导出行"""
+    cmd_text = hex_to_strings([log['cmd_bytes'] for log in logs])
+    response_text = hex_to_strings([log['response_bytes'] for log in logs])
+    return [
+        [log['id'], utc_to_local(log['timestamp']), log['device'], log['port'], log['command'], log['params'],
+         log['cmd_bytes'], cmd_text[i], log['response_bytes'], response_text[i],
+         '成功' if log['success'] else '失败', log['message']]
+        for i, log in enumerate(logs)
+    ]
+
+
+def optical_test_rows(records: List[Dict]) -> List[list]:
+    """一块光轴测试记录转换为导出行"""
+    return [[rec['id'], utc_to_local(rec['test_time'])] + [rec[field] for field in _OPTICAL_TEST_FIELDS]
+            for rec in records]
+
+
+# 导出类型: (工作表名, 列, 数据源的分块读取方法名, 行转换函数, 文件名前缀)
+EXPORTS: Dict[str, tuple] = {
+    'serial-logs': ('串口日志', SERIAL_LOG_COLUMNS, 'iter_serial_logs', serial_log_rows, 'serial_logs'),
+    'optical-tests': ('光轴测试记录', OPTICAL_TEST_COLUMNS, 'iter_optical_tests', optical_test_rows,
+                      'optical_tests'),
+}
+
+
+def iter_row_chunks(kind: str, filters: Dict = None, chunk_size: int = None,
+                    source=None) -> Iterator[List[list]]:
+    """
+    按块产出导出行
+
+    Args:
+        kind: 导出类型 (EXPORTS 的键)
+        filters: 筛选条件，传给分块读取方法 (如 device、port、start_time、end_time)
+        chunk_size: 每块行数
+        source: 数据源（db_service 或 ReadOnlyRecords），None 表示 db_service
+    """
+    if source is None:
+        from core.databaseService import db_service as source
+    _, _, method, to_rows, _ = EXPORTS[kind]
+    for chunk in getattr(source, method)(chunk_size=chunk_size, **(filters or {})):
+        yield to_rows(chunk)
+
+
+def write_excel(output, kind: str, filters: Dict = None,
+                progress: Callable[[int], None] = None, source=None) -> int:
+    """
+    以只写模式写出Excel
+
+    Args:
+        output: 文件路径或可写的二进制文件对象
+        kind: 导出类型
+        filters: 筛选条件
+        progress: 每写完一块调用一次，参数为已写行数（可选）
+        source: 数据源，见 iter_row_chunks
+
+    Returns:
+        int: 写出的数据行数（超过Excel行数上限的部分被截断）
+    """
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, Alignment
+
+    title, columns, _, _, _ = EXPORTS[kind]
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+    # 只写模式下列宽必须在写入行之前设置
+    for col, (_, width) in enumerate(columns, 1):
+        ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = width
+
+    header = []
+    for name, _ in columns:
+        cell = WriteOnlyCell(ws, value=name)
+        cell.font = Font(bold=True)
+        cell.alignment = Alignment(horizontal='center')
+        header.append(cell)
+    ws.append(header)
+
+    written = 0
+    for rows in iter_row_chunks(kind, filters, source=source):
+        rows = rows[:MAX_EXCEL_ROWS - 1 - written]
+        for row in rows:
+            ws.append(row)
+        written += len(rows)
+        if progress is not None:
+            progress(written)
+        if written >= MAX_EXCEL_ROWS - 1:
+            break
+
+    wb.save(output)
+    return written
+
+
+def iter_csv(kind: str, filters: Dict = None) -> Iterator[bytes]:
+    """
+    逐块产出CSV数据 (UTF-8 BOM，Excel可直接打开)
+
+    Yields:
+        bytes: 表头及每块数据行编码后的字节
+    """
+    _, columns, _, _, _ = EXPORTS[kind]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    yield ('\ufeff' + buffer.getvalue()).encode('utf-8')
+    for rows in iter_row_chunks(kind, filters):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+
+
+def write_csv(path: str, kind: str, filters: Dict = None,
+              progress: Callable[[int], None] = None, source=None) -> int:
+    """
+    写出CSV文件 (UTF-8 BOM)
+
+    Args:
+        path: 文件路径
+        kind: 导出类型
+        filters: 筛选条件
+        progress: 每写完一块调用一次，参数为已写行数（可选）
+        source: 数据源，见 iter_row_chunks
+
+    Returns:
+        int: 写出的数据行数
+    """
+    _, columns, _, _, _ = EXPORTS[kind]
+    written = 0
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([name for name, _ in columns])
+        for rows in iter_row_chunks(kind, filters, source=source):
+            writer.writerows(rows)
+            written += len(rows)
+            if progress is not None:
+                progress(written)
+    return written
+
+
+def export_filename(kind: str, ext: str) -> str:
+    """导出文件名，如 serial_logs_20250101_120000.xlsx"""
+    return f'{EXPORTS[kind][4]}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{ext}'
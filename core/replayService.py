@@ -0,0 +1,382 @@
+"""
+回放相机服务 - 将录制的帧文件或图像目录送入与实时相机相同的处理和推流路径
+
+支持三种回放模式:
+- realtime: 按录制时的主机时间戳间隔回放（图像目录没有时间戳，按 fps 回放）
+- fixed:    按固定帧率回放
+- fastest:  不等待，尽可能快地处理（用于吞吐量基准测试）
+
+对外接口与 VirtualCameraService 保持一致 (running、getLatestFrame、参数设置方法)，
+可由 _get_camera_by_id 直接返回给推流和参数设置逻辑。
+"""
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterator, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from core.imagePipeline import STAGES, extract_centroid, encode_data_url
+from core.frameRecorder import FrameRecorder, FrameReader, RecentFrames
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+
+
+class ReplayCameraService:
+    """
+    回放相机服务类 - 回放 .rec 录制文件或图像目录
+    """
+
+    MODES = ('realtime', 'fixed', 'fastest')
+
+    def __init__(self, camera_id: int = 5):
+        """
+        初始化回放相机服务
+
+        Args:
+            camera_id: 回放相机ID (默认为5)
+        """
+        self.camera_id = camera_id
+        self.running = False
+        self.threshold = 128
+        self.median_kernel_size = 0  # 中值滤波核大小，0表示不滤波
+        self.return_binary_image = False
+        self.frame_queue = deque(maxlen=2)
+        self.cam = None  # 用于兼容性检查
+        self.recorder = None  # 原始帧录制器，None表示未录制
+        self.recent_frames = RecentFrames()  # 最近原始帧，保存测试记录时按帧号取回
+
+        # 回放设置
+        self.source = None
+        self.mode = 'realtime'
+        self.fps = 10.0
+        self.loop = False
+        self.source_bits = None  # 16位帧的有效位数：录制文件头中记录的值，未记录时按首帧估计
+
+        # 回放统计
+        self.frames_processed = 0
+        self.finished = False
+        self.last_error: Optional[str] = None  # 回放线程异常退出的原因，None表示正常结束或被停止
+        self._timings: Dict[str, float] = {}
+        self._started_at = 0.0
+        self._stopped_at = 0.0
+
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    # ======================== 回放控制 ========================
+
+    def open(self, source: str, mode: str = 'realtime', fps: float = 10.0, loop: bool = False) -> tuple:
+        """
+        设置回放源
+
+        Args:
+            source: .rec 录制文件路径或图像目录
+            mode: 'realtime' / 'fixed' / 'fastest'
+            fps: 固定帧率 (fixed模式，以及图像目录的realtime模式)
+            loop: 播放结束后是否从头循环
+
+        Returns:
+            tuple: (success: bool, message: str)
+        """
+        if not source or not os.path.exists(source):
+            return False, f"回放源不存在: {source}"
+        if os.path.isdir(source):
+            if not self._list_images(source):
+                return False, f"目录中没有图像文件: {source}"
+        else:
+            try:
+                with FrameReader(source) as reader:
+                    if len(reader) == 0:
+                        return False, f"录制文件中没有帧: {source}"
+            except Exception as e:
+                return False, f"无法读取录制文件: {e}"
+
+        if mode not in self.MODES:
+            return False, f"不支持的回放模式: {mode}"
+        fps = float(fps)
+        if mode == 'fixed' and fps <= 0:
+            return False, "帧率必须大于0"
+
+        self.source = source
+        self.source_bits = None  # 换回放源后重新确定位数
+        self.mode = mode
+        self.fps = fps if fps > 0 else 10.0
+        self.loop = bool(loop)
+        return True, "回放源已设置"
+
+    def start(self) -> tuple:
+        """开始回放（已在回放则先停止）"""
+        if self.source is None:
+            return False, "未设置回放源"
+        self.stop()
+
+        self.frames_processed = 0
+        self.finished = False
+        self.last_error = None
+        self._timings = {}
+        self._stop_event.clear()
+        self._started_at = time.perf_counter()
+        self._stopped_at = 0.0
+        self.running = True
+        try:
+            self._thread = threading.Thread(target=self._work_thread, daemon=True)
+            self._thread.start()
+        except RuntimeError as e:
+            self.running = False
+            return False, f"无法启动回放线程: {e}"
+        return True, f"开始回放: {os.path.basename(self.source.rstrip(os.sep))}"
+
+    def stop(self) -> tuple:
+        """停止回放"""
+        self.running = False
+        self._stop_event.set()
+        if self._thread is not None:
+            if self._thread.is_alive() and self._thread is not threading.current_thread():
+                self._thread.join(timeout=2.0)
+            self._thread = None
+        self.stopRecording()
+        return True, "回放已停止"
+
+    @staticmethod
+    def _list_images(directory: str) -> list:
+        return sorted(
+            os.path.join(directory, name) for name in os.listdir(directory)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+
+    def _iter_frames(self) -> Iterator[Tuple[np.ndarray, int, Optional[int]]]:
+        """按顺序产生 (图像, 帧号, 主机时间戳ns或None)"""
+        if os.path.isdir(self.source):
+            for i, path in enumerate(self._list_images(self.source)):
+                img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+                if img is None:
+                    print(f"[Replay] Warning: 无法读取图像 {path}")
+                    continue
+                if img.ndim == 3:
+                    img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+                yield img, i + 1, None
+        else:
+            with FrameReader(self.source) as reader:
+                if reader.pixel_bits:
+                    self.source_bits = reader.pixel_bits
+                for meta, frame in reader:
+                    yield frame, int(meta['frame_num']), int(meta['host_ts_ns'])
+
+    def _to_mono8(self, frame: np.ndarray) -> np.ndarray:
+        """
+        16位帧按有效位数右移为Mono8，与相机SDK的Mono8转换一致
+
+        有效位数优先取录制文件头中的记录；图像目录和旧录制文件按首帧峰值估计，
+        估计偏小时超出范围的像素饱和为255，不会回绕。
+        """
+        if frame.dtype == np.uint8:
+            return frame
+        if self.source_bits is None:
+            peak = int(frame.max())
+            self.source_bits = 16 if peak > 4095 else (12 if peak > 1023 else 10)
+        return np.minimum(frame >> (self.source_bits - 8), 255).astype(np.uint8)
+
+    def _wait_until(self, target: float) -> bool:
+        """等待到指定时刻，返回False表示期间收到停止请求"""
+        delay = target - time.perf_counter()
+        if delay > 0:
+            return not self._stop_event.wait(delay)
+        return not self._stop_event.is_set()
+
+    def _work_thread(self):
+        try:
+            while self.running:
+                pass_start = time.perf_counter()
+                first_ts = None
+                for i, (frame, frame_num, host_ts) in enumerate(self._iter_frames()):
+                    if not self.running:
+                        return
+
+                    # 回放节奏控制
+                    if self.mode == 'realtime' and host_ts is not None:
+                        if first_ts is None:
+                            first_ts = host_ts
+                        target = pass_start + (host_ts - first_ts) / 1e9
+                    elif self.mode in ('realtime', 'fixed'):
+                        target = pass_start + i / self.fps
+                    else:
+                        target = 0.0
+                    if target and not self._wait_until(target):
+                        return
+
+                    gray_image = self._to_mono8(frame)
+                    frame_data = self.centroidExtract(gray_image, frame_num, timings=self._timings)
+                    if frame_data:
+                        self.frame_queue.append(frame_data)
+                        self.recent_frames.put(frame, frame_num)
+                        recorder = self.recorder
+                        if recorder is not None:
+                            recorder.write(frame, frame_num, host_ts or 0,
+                                           frame_data['centroidX'], frame_data['centroidY'],
+                                           pixel_bits=self.source_bits or 0)
+                    self.frames_processed += 1
+
+                if not self.loop:
+                    break
+        except Exception as e:
+            # 记录原因，统计中可区分回放出错与用户停止，避免把中断的回放当作完整结果
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"[Replay] 回放出错: {self.last_error}")
+        finally:
+            self.finished = self.running and self.last_error is None
+            self.running = False
+            self._stopped_at = time.perf_counter()
+
+    # ======================== 图像处理 ========================
+
+    def centroidExtract(self, gray_image: np.ndarray, frame_num: int, timings: dict = None) -> dict:
+        """
+        提取图像质心并编码为JPEG (与CameraService保持一致)
+        """
+        gray_image, binary, cx, cy = extract_centroid(
+            gray_image, self.threshold, self.median_kernel_size, timings=timings)
+
+        target_image = binary if self.return_binary_image else gray_image
+        image_url = encode_data_url(target_image, timings=timings)
+        if image_url is None:
+            return None
+
+        nHeight, nWidth = gray_image.shape[:2]
+
+        frame_data = {
+            'image': image_url,
+            'width': int(nWidth),
+            'height': int(nHeight),
+            'centroidX': float(cx),
+            'centroidY': float(cy),
+            'frameNum': int(frame_num),
+            'cameraId': self.camera_id
+        }
+
+        return frame_data
+
+    def getLatestFrame(self) -> dict:
+        """获取最新帧"""
+        return self.frame_queue.pop() if self.frame_queue else None
+
+    def getRawFrame(self, frame_num: int = None) -> Optional[np.ndarray]:
+        """按帧号取回最近的原始帧（录制文件中的16位帧保持16位），已被覆盖时返回None"""
+        return self.recent_frames.get(frame_num)
+
+    # ======================== 参数设置 ========================
+
+    def setThreshold(self, threshold: int) -> bool:
+        """设置二值化阈值"""
+        threshold = int(threshold)
+        if threshold < 0:
+            threshold = 0
+        if threshold > 255:
+            threshold = 255
+        self.threshold = threshold
+        return True
+
+    def getThreshold(self) -> int:
+        """获取二值化阈值"""
+        return self.threshold
+
+    def setMedianKernelSize(self, size: int) -> bool:
+        """设置中值滤波核大小，0表示不滤波，必须为奇数"""
+        size = int(size)
+        if size < 0:
+            size = 0
+        if size > 0 and size % 2 == 0:
+            size += 1  # 确保是奇数
+        if size > 31:
+            size = 31  # 限制最大值
+        self.median_kernel_size = size
+        return True
+
+    def getMedianKernelSize(self) -> int:
+        """获取中值滤波核大小"""
+        return self.median_kernel_size
+
+    def setReturnBinaryMode(self, is_binary: bool) -> bool:
+        """设置是否返回二值化图像"""
+        self.return_binary_image = bool(is_binary)
+        return True
+
+    def getStats(self) -> dict:
+        """获取回放统计（处理帧数、实际帧率和各阶段平均耗时；error 为回放线程出错的原因）"""
+        if self._started_at:
+            end = self._stopped_at or time.perf_counter()
+            elapsed = end - self._started_at
+        else:
+            elapsed = 0.0
+        frames = self.frames_processed
+        timings = dict(self._timings)
+        return {
+            'source': self.source,
+            'mode': self.mode,
+            'running': self.running,
+            'finished': self.finished,
+            'error': self.last_error,
+            'frames': frames,
+            'elapsed': round(elapsed, 3),
+            'fps': round(frames / elapsed, 2) if elapsed > 0 else 0.0,
+            'stagesMs': {stage: round(timings[stage] / frames * 1000.0, 3)
+                         for stage in STAGES if stage in timings and frames},
+        }
+
+    def getAllParams(self) -> dict:
+        """获取所有参数的当前值"""
+        return {
+            'threshold': self.threshold,
+            'medianKernelSize': self.median_kernel_size,
+            'imageMode': 1 if self.return_binary_image else 0,
+            'source': self.source,
+            'mode': self.mode,
+            'fps': self.fps,
+            'loop': self.loop,
+        }
+
+    # ======================== 录制 ========================
+
+    def startRecording(self, path: str, capacity: int = 300) -> bool:
+        """开始录制回放帧到内存映射文件（已在录制则先停止）"""
+        self.stopRecording()
+        self.recorder = FrameRecorder(path, capacity)
+        return True
+
+    def stopRecording(self) -> dict:
+        """停止录制，返回录制统计（未录制返回None）"""
+        recorder, self.recorder = self.recorder, None
+        return recorder.close() if recorder is not None else None
+
+    def getRecordingStatus(self) -> dict:
+        """获取录制状态（未录制返回None）"""
+        recorder = self.recorder
+        return recorder.get_status() if recorder is not None else None
+
+
+if __name__ == "__main__":
+    # 吞吐量测试: python -m core.replayService <录制文件或图像目录> [阈值] [中值滤波核]
+    if len(sys.argv) < 2:
+        print("用法: python -m core.replayService <source> [threshold] [median_kernel_size]")
+        sys.exit(1)
+
+    replay = ReplayCameraService()
+    if len(sys.argv) > 2:
+        replay.setThreshold(int(sys.argv[2]))
+    if len(sys.argv) > 3:
+        replay.setMedianKernelSize(int(sys.argv[3]))
+
+    ok, msg = replay.open(sys.argv[1], mode='fastest')
+    if not ok:
+        print(msg)
+        sys.exit(1)
+    replay.start()
+    while replay.running:
+        time.sleep(0.1)
+    stats = replay.getStats()
+    print(stats)
+    if stats['error']:
+        sys.exit(1)
@@ -0,0 +1,273 @@
+"""
+光轴测试PDF报告 - 每条测试记录一页A4，多条记录合并为一个PDF
+
+只依赖 reportlab，不访问数据库和相机SDK，可在导出任务的工作进程中运行：
+记录内容和图片文件路径（缩略图）由调用方准备好后传入。
+"""
+import hashlib
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+_FONT_PATHS = [
+    'C:/Windows/Fonts/simhei.ttf',
+    'C:/Windows/Fonts/msyh.ttc',
+    'simhei.ttf',
+]
+
+
+def _patch_md5():
+    """解决 reportlab 与 Python/OpenSSL 兼容性问题 (md5 不接受 usedforsecurity 参数)"""
+    if getattr(hashlib.md5, '_plat_patched', False):
+        return
+    orig_md5 = hashlib.md5
+
+    def patched_md5(*args, **kwargs):
+        kwargs.pop('usedforsecurity', None)
+        return orig_md5(*args, **kwargs)
+    patched_md5._plat_patched = True
+    hashlib.md5 = patched_md5
+
+
+def _register_font() -> str:
+    """尝试注册中文字体，返回可用的字体名"""
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    if 'SimHei' in pdfmetrics.getRegisteredFontNames():
+        return 'SimHei'
+    for fp in _FONT_PATHS:
+        try:
+            pdfmetrics.registerFont(TTFont('SimHei', fp))
+            return 'SimHei'
+        except Exception:
+            continue
+    return 'Helvetica'
+
+
+def _local_time(test_time) -> str:
+    """SQLite CURRENT_TIMESTAMP 存储的是UTC时间，转换为本地时间"""
+    if not test_time:
+        return '-'
+    try:
+        utc_str = str(test_time).replace(' ', 'T')
+        if not utc_str.endswith('Z') and '+' not in utc_str:
+            utc_str += '+00:00'  # 标记为UTC
+        utc_dt = datetime.fromisoformat(utc_str.replace('Z', '+00:00'))
+        return utc_dt.astimezone().strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        # 解析失败，使用简单格式化
+        return str(test_time).replace('T', ' ')[:19]
+
+
+def _fmt(val, decimals=2):
+    if val is None:
+        return '-'
+    return f'{val:.{decimals}f}'
+
+
+def _record_elements(record: Dict, images: Tuple[Optional[str], Optional[str]], font_name: str) -> list:
+    """单条记录一页的内容"""
+    from reportlab.lib import colors
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.lib.units import mm
+    from reportlab.platypus import Table, TableStyle, Paragraph, Spacer, Image as RLImage
+
+    elements = []
+
+    # 样式定义 - 紧凑字体
+    title_style = ParagraphStyle(
+        'CustomTitle', fontName=font_name, fontSize=18,
+        textColor=colors.HexColor('#1890ff'), spaceAfter=8, alignment=1
+    )
+
+    # 标题
+    elements.append(Paragraph('光轴一致性测试报告', title_style))
+
+    # 基本信息 - 单行
+    info_data = [[
+        f"编号: #{record['id']}",
+        f"测试时间: {_local_time(record.get('test_time'))}",
+        f"操作人员: {record.get('operator') or '-'}"
+    ]]
+    info_table = Table(info_data, colWidths=[50*mm, 70*mm, 60*mm])
+    info_table.setStyle(TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), font_name),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#666666')),
+        ('ALIGN', (0, 0), (0, 0), 'LEFT'),
+        ('ALIGN', (1, 0), (1, 0), 'CENTER'),
+        ('ALIGN', (2, 0), (2, 0), 'RIGHT'),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+    ]))
+    elements.append(info_table)
+    elements.append(Spacer(1, 4*mm))
+
+    # 准备图片
+    img_width, img_height = 55*mm, 42*mm
+    base_img = test_img = None
+    try:
+        if images[0]:
+            base_img = RLImage(images[0], width=img_width, height=img_height)
+        if images[1]:
+            test_img = RLImage(images[1], width=img_width, height=img_height)
+    except Exception:
+        pass
+
+    # 双栏布局 - 基准光轴 | 测试光轴
+    col_width = 85*mm
+    row_height = 5.5*mm
+
+    # 表头
+    header_data = [['基准光轴', '测试光轴']]
+    header_table = Table(header_data, colWidths=[col_width, col_width])
+    header_table.setStyle(TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), font_name),
+        ('FONTSIZE', (0, 0), (-1, -1), 12),
+        ('TEXTCOLOR', (0, 0), (0, 0), colors.HexColor('#52c41a')),
+        ('TEXTCOLOR', (1, 0), (1, 0), colors.HexColor('#fa8c16')),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('BACKGROUND', (0, 0), (0, 0), colors.HexColor('#f6ffed')),
+        ('BACKGROUND', (1, 0), (1, 0), colors.HexColor('#fff7e6')),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+        ('TOPPADDING', (0, 0), (-1, -1), 6),
+        ('BOX', (0, 0), (-1, -1), 0.5, colors.HexColor('#d9d9d9')),
+    ]))
+    elements.append(header_table)
+
+    # 数据对比表格
+    data_rows = [
+        ['相机', record['base_camera_name'] or str(record['base_camera_id'] or '-'),
+         '相机', record['test_camera_name'] or str(record['test_camera_id'] or '-')],
+        ['尺寸', f"{record['base_width'] or '-'}x{record['base_height'] or '-'}",
+         '尺寸', f"{record['test_width'] or '-'}x{record['test_height'] or '-'}"],
+        ['质心', f"({_fmt(record['base_centroid_x'])}, {_fmt(record['base_centroid_y'])})",
+         '质心', f"({_fmt(record['test_centroid_x'])}, {_fmt(record['test_centroid_y'])})"],
+        ['焦距', f"{_fmt(record['base_focal_length'])} mm",
+         '焦距', f"{_fmt(record['test_focal_length'])} mm"],
+        ['像元', f"{_fmt(record['base_pixel_size'])} um",
+         '像元', f"{_fmt(record['test_pixel_size'])} um"],
+        ['偏移X', f"{_fmt(record['base_offset_x'], 4)}°",
+         '偏移X', f"{_fmt(record['test_offset_x'], 4)}°"],
+        ['偏移Y', f"{_fmt(record['base_offset_y'], 4)}°",
+         '偏移Y', f"{_fmt(record['test_offset_y'], 4)}°"],
+    ]
+
+    data_table = Table(data_rows, colWidths=[18*mm, 67*mm, 18*mm, 67*mm], rowHeights=[row_height]*7)
+    data_table.setStyle(TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), font_name),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#888888')),
+        ('TEXTCOLOR', (2, 0), (2, -1), colors.HexColor('#888888')),
+        ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor('#333333')),
+        ('TEXTCOLOR', (3, 0), (3, -1), colors.HexColor('#333333')),
+        ('BACKGROUND', (0, 0), (1, -1), colors.HexColor('#fafafa')),
+        ('BACKGROUND', (2, 0), (3, -1), colors.HexColor('#fffbf0')),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e8e8e8')),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 4),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 4),
+        ('TOPPADDING', (0, 0), (-1, -1), 2),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+    ]))
+    elements.append(data_table)
+
+    # 图片行
+    if base_img or test_img:
+        elements.append(Spacer(1, 3*mm))
+        img_row = [[base_img or '', test_img or '']]
+        img_table = Table(img_row, colWidths=[col_width, col_width])
+        img_table.setStyle(TableStyle([
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('BOX', (0, 0), (0, 0), 0.5, colors.HexColor('#d9d9d9') if base_img else colors.white),
+            ('BOX', (1, 0), (1, 0), 0.5, colors.HexColor('#d9d9d9') if test_img else colors.white),
+            ('BACKGROUND', (0, 0), (0, 0), colors.HexColor('#fafafa') if base_img else colors.white),
+            ('BACKGROUND', (1, 0), (1, 0), colors.HexColor('#fafafa') if test_img else colors.white),
+        ]))
+        elements.append(img_table)
+
+    # 备注
+    if record.get('remark'):
+        elements.append(Spacer(1, 4*mm))
+        remark_data = [['备注', record['remark']]]
+        remark_table = Table(remark_data, colWidths=[18*mm, 152*mm])
+        remark_table.setStyle(TableStyle([
+            ('FONTNAME', (0, 0), (-1, -1), font_name),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('TEXTCOLOR', (0, 0), (0, 0), colors.HexColor('#d48806')),
+            ('TEXTCOLOR', (1, 0), (1, 0), colors.HexColor('#666666')),
+            ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#fffbe6')),
+            ('BOX', (0, 0), (-1, -1), 0.5, colors.HexColor('#ffe58f')),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('LEFTPADDING', (0, 0), (-1, -1), 4),
+            ('TOPPADDING', (0, 0), (-1, -1), 4),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+        ]))
+        elements.append(remark_table)
+
+    # 页脚
+    elements.append(Spacer(1, 6*mm))
+    footer_data = [[
+        '光轴一致性测试系统',
+        f"报告生成: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+    ]]
+    footer_table = Table(footer_data, colWidths=[90*mm, 80*mm])
+    footer_table.setStyle(TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), font_name),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#999999')),
+        ('ALIGN', (0, 0), (0, 0), 'LEFT'),
+        ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
+    ]))
+    elements.append(footer_table)
+    return elements
+
+
+def build_optical_test_report(output, records: List[Dict],
+                              images: List[Tuple[Optional[str], Optional[str]]] = None,
+                              progress: Callable[[int, int], None] = None) -> int:
+    """
+    生成光轴测试PDF报告，每条记录一页
+
+    Args:
+        output: 文件路径或可写的二进制文件对象
+        records: 测试记录（get_optical_test 返回的字典）
+        images: 与 records 对应的 (基准图片文件路径, 测试图片文件路径)，None 表示不插入图片
+        progress: 每生成一页调用一次，参数为 (已完成页数, 总页数)（可选）
+
+    Returns:
+        int: 页数
+    """
+    _patch_md5()
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.platypus import SimpleDocTemplate, PageBreak
+
+    font_name = _register_font()
+    images = images or [(None, None)] * len(records)
+
+    # 创建PDF - 紧凑边距
+    doc = SimpleDocTemplate(
+        output,
+        pagesize=A4,
+        topMargin=12*mm,
+        bottomMargin=10*mm,
+        leftMargin=15*mm,
+        rightMargin=15*mm
+    )
+    elements = []
+    for i, (record, record_images) in enumerate(zip(records, images)):
+        if i:
+            elements.append(PageBreak())
+        elements.extend(_record_elements(record, record_images, font_name))
+
+    def on_page(canvas, doc):
+        # 开始绘制新的一页时，之前的页已完成
+        if progress is not None:
+            progress(doc.page - 1, len(records))
+
+    doc.build(elements, onFirstPage=on_page, onLaterPages=on_page)
+    if progress is not None:
+        progress(doc.page, len(records))
+    return doc.page
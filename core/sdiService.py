@@ -20,13 +20,15 @@ import sys
 import os
 import threading
 import time
-import base64
 from collections import deque
 from typing import Optional, Callable, Dict, Any
 
 import cv2
 import numpy as np
 
+from core.imagePipeline import extract_centroid, encode_data_url, lap_timing
+from core.frameRecorder import FrameRecorder, RecentFrames
+
 # Import from local SDI module
 try:
     from core.sdi import VideoCapture, VideoFrame
@@ -82,6 +84,12 @@ class SDICameraService:
         # Callback for frame data
         self._frame_callback: Optional[Callable] = None
 
+        # Raw frame recorder (None when not recording)
+        self.recorder: Optional[FrameRecorder] = None
+
+        # Recent RGB frames, looked up by frame number when saving test records
+        self.recent_frames = RecentFrames()
+
         # Initialization flag
         self._initialized = False
 
@@ -195,6 +203,8 @@ class SDICameraService:
 
             self.running = False
             self.frame_queue.clear()
+            self.recent_frames.clear()
+            self.stopRecording()
 
             return True, "SDI disconnected"
 
@@ -241,6 +251,13 @@ class SDICameraService:
             # Add to queue
             with self._lock:
                 self.frame_queue.append(frame_data)
+            self.recent_frames.put(rgb_image, self.frame_num)
+
+            # Record the grayscale frame if recording is active
+            recorder = self.recorder
+            if recorder is not None:
+                recorder.write(gray_image, self.frame_num, int(frame.timestamp * 1e6),
+                               frame_data['centroidX'], frame_data['centroidY'])
 
             # Call external callback if set
             if self._frame_callback:
@@ -249,7 +266,8 @@ class SDICameraService:
         except Exception as e:
             print(f"[SDI Service] Frame processing error: {e}")
 
-    def centroidExtract(self, gray_image: np.ndarray, rgb_image: np.ndarray, frame_num: int) -> dict:
+    def centroidExtract(self, gray_image: np.ndarray, rgb_image: np.ndarray, frame_num: int,
+                        timings: Optional[dict] = None) -> dict:
         """
         Calculate centroid from grayscale image and encode frame.
 
@@ -257,41 +275,34 @@ class SDICameraService:
             gray_image: Grayscale image for centroid calculation
             rgb_image: RGB image for display
             frame_num: Frame number
+            timings: Optional per-stage timing dict (used by the benchmark)
 
         Returns:
             Dict with frame data and centroid info
         """
         height, width = gray_image.shape
 
-        # Apply median filter if set
-        if self.median_kernel_size > 0:
-            gray_image = cv2.medianBlur(gray_image, self.median_kernel_size)
-
-        # Apply threshold for binary image
-        _, binary = cv2.threshold(gray_image, self.threshold, 255, cv2.THRESH_BINARY)
-
-        # Calculate centroid using moments
-        M = cv2.moments(binary)
-        if M["m00"] > 0:
-            cx = M["m10"] / M["m00"]
-            cy = M["m01"] / M["m00"]
-        else:
-            cx, cy = -1.0, -1.0
+        # Median filter, threshold and binary-image centroid
+        gray_image, binary, cx, cy = extract_centroid(
+            gray_image, self.threshold, self.median_kernel_size,
+            weighted=False, timings=timings)
 
         # Choose image to encode
+        t = time.perf_counter() if timings is not None else 0.0
         if self.return_binary_image:
             # Convert binary to BGR for encoding
             encode_image = cv2.cvtColor(binary, cv2.COLOR_GRAY2BGR)
         else:
             # Convert RGB to BGR for OpenCV encoding
             encode_image = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2BGR)
+        if timings is not None:
+            lap_timing(timings, 'convert', t)
 
         # Encode to JPEG
-        _, jpeg_data = cv2.imencode('.jpg', encode_image, [cv2.IMWRITE_JPEG_QUALITY, 85])
-        base64_image = base64.b64encode(jpeg_data).decode('utf-8')
+        image_url = encode_data_url(encode_image, quality=85, timings=timings)
 
         return {
-            'image': f'data:image/jpeg;base64,{base64_image}',
+            'image': image_url,
             'width': width,
             'height': height,
             'centroidX': round(cx, 2) if cx >= 0 else -1,
@@ -311,10 +322,36 @@ class SDICameraService:
                 return self.frame_queue[-1]
         return None
 
+    def getRawFrame(self, frame_num: Optional[int] = None) -> Optional[np.ndarray]:
+        """
+        Get a recent full-resolution frame by frame number.
+
+        Returns:
+            BGR image, or None if the frame is no longer buffered
+        """
+        rgb_image = self.recent_frames.get(frame_num)
+        return cv2.cvtColor(rgb_image, cv2.COLOR_RGB2BGR) if rgb_image is not None else None
+
     def set_frame_callback(self, callback: Optional[Callable]):
         """Set external frame callback."""
         self._frame_callback = callback
 
+    def startRecording(self, path: str, capacity: int = 300) -> bool:
+        """Start recording grayscale frames to a memory-mapped file."""
+        self.stopRecording()
+        self.recorder = FrameRecorder(path, capacity)
+        return True
+
+    def stopRecording(self) -> Optional[dict]:
+        """Stop recording and return recording stats (None if not recording)."""
+        recorder, self.recorder = self.recorder, None
+        return recorder.close() if recorder is not None else None
+
+    def getRecordingStatus(self) -> Optional[dict]:
+        """Get recording status (None if not recording)."""
+        recorder = self.recorder
+        return recorder.get_status() if recorder is not None else None
+
     # ========================================================================
     # SDI-Specific Parameter Methods
     # ========================================================================
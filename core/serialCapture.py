@@ -0,0 +1,296 @@
+"""
+串口收发抓包 - 将所有串口收发的原始字节写入预分配的环形内存映射文件
+
+文件结构（小端）:
+    [文件头 64字节] [名称表 256 × 32字节] [记录区 capacity × 128字节]
+
+- 每条记录占一个固定大小的槽位：写入序号、单调时钟时间戳(ns)、设备/串口名称编号、
+  方向(发送/接收)和最多 104 字节数据；更长的数据拆成多个连续槽位
+  （MORE 标志表示下一槽位继续，CONT 标志表示接续上一槽位）
+- 写满后循环覆盖最早的记录（环形缓冲），离线读取时按序号重建顺序
+- 收发线程只把 (时间戳, 方向, 设备, 串口, 数据) 放入队列，由后台线程写入文件，不增加收发延迟
+- 设备、串口名称首次出现时登记到名称表，记录中只保存编号
+"""
+import collections
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+FILE_MAGIC = b'PLATSER1'
+FILE_VERSION = 1
+HEADER_SIZE = 64
+# magic, version, slot_size, capacity, name_count, start_wall_ns, start_mono_ns, count
+_HEADER_STRUCT = struct.Struct('<8sIIIIQQQ')
+# count 字段在文件头中的偏移
+_COUNT_OFFSET = _HEADER_STRUCT.size - 8
+# name_count 字段在文件头中的偏移
+_NAME_COUNT_OFFSET = 8 + 4 * 3
+
+NAME_TABLE_ENTRIES = 256
+NAME_SIZE = 32
+UNKNOWN_NAME = 0xFFFF
+
+DIRECTION_TX = 0    # 发送到设备
+DIRECTION_RX = 1    # 从设备接收
+
+FLAG_MORE = 0x01    # 数据在下一个槽位继续
+FLAG_CONT = 0x02    # 接续上一个槽位的数据
+
+SLOT_PAYLOAD = 104
+SLOT_DTYPE = np.dtype([
+    ('seq', '<u8'),           # 写入序号 (从0开始递增)
+    ('mono_ns', '<u8'),       # time.monotonic_ns()
+    ('device', '<u2'),        # 设备名称编号
+    ('port', '<u2'),          # 串口名称编号
+    ('direction', 'u1'),      # DIRECTION_TX / DIRECTION_RX
+    ('flags', 'u1'),
+    ('length', 'u1'),         # 本槽位数据字节数
+    ('valid', 'u1'),          # 1表示槽位有数据
+    ('data', 'u1', (SLOT_PAYLOAD,)),
+])
+assert SLOT_DTYPE.itemsize == 128
+
+# 待写入队列上限，写入线程跟不上时丢弃并计数
+MAX_PENDING = 100000
+
+
+def _slots_offset() -> int:
+    """记录区起始偏移（按4KB对齐）"""
+    offset = HEADER_SIZE + NAME_TABLE_ENTRIES * NAME_SIZE
+    return (offset + 4095) // 4096 * 4096
+
+
+class SerialCapture:
+    """
+    串口抓包写入器
+
+    record() 可在任意线程调用，只做入队；文件写入由后台线程完成。
+    """
+
+    def __init__(self, path: str, capacity: int = 65536):
+        """
+        Args:
+            path: 抓包文件路径
+            capacity: 记录槽位数量（每个128字节），写满后循环覆盖
+        """
+        if capacity <= 0:
+            raise ValueError("capacity 必须大于0")
+        self.path = path
+        self.capacity = int(capacity)
+        self.count = 0          # 已写入槽位数（含被覆盖的）
+        self.records = 0        # 已写入记录数
+        self.bytes = 0          # 已写入数据字节数
+        self.dropped = 0        # 队列溢出丢弃的记录数
+        self.started_at = time.time()
+
+        self._names: Dict[str, int] = {}
+        self._pending = collections.deque()
+        self._wake = threading.Event()
+        self._closed = False
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        total_size = _slots_offset() + SLOT_DTYPE.itemsize * self.capacity
+        self._file = open(path, 'w+b')
+        self._file.truncate(total_size)
+        self._mm = mmap.mmap(self._file.fileno(), total_size)
+        self._mm[:_HEADER_STRUCT.size] = _HEADER_STRUCT.pack(
+            FILE_MAGIC, FILE_VERSION, SLOT_DTYPE.itemsize, self.capacity, 0,
+            time.time_ns(), time.monotonic_ns(), 0)
+        slots = np.ndarray((self.capacity,), dtype=SLOT_DTYPE, buffer=self._mm, offset=_slots_offset())
+        # 各字段的列视图，写入时直接按槽位赋值
+        self._col_seq = slots['seq']
+        self._col_mono = slots['mono_ns']
+        self._col_device = slots['device']
+        self._col_port = slots['port']
+        self._col_direction = slots['direction']
+        self._col_flags = slots['flags']
+        self._col_length = slots['length']
+        self._col_valid = slots['valid']
+        self._col_data = slots['data']
+
+        self._thread = threading.Thread(target=self._run, name='serial-capture', daemon=True)
+        self._thread.start()
+
+    def record(self, direction: int, device: str, port: str, data: bytes, mono_ns: Optional[int] = None):
+        """
+        记录一段收发数据（只入队，立即返回）
+
+        Args:
+            direction: DIRECTION_TX / DIRECTION_RX
+            device: 设备标识
+            port: 串口号
+            data: 原始字节
+            mono_ns: time.monotonic_ns() 时间戳，None 表示当前时间
+        """
+        if self._closed or not data:
+            return
+        if len(self._pending) >= MAX_PENDING:
+            self.dropped += 1
+            return
+        self._pending.append((time.monotonic_ns() if mono_ns is None else mono_ns,
+                              direction, device or '', port or '', bytes(data)))
+        self._wake.set()
+
+    def _name_id(self, name: str) -> int:
+        name_id = self._names.get(name)
+        if name_id is None:
+            if len(self._names) >= NAME_TABLE_ENTRIES:
+                return UNKNOWN_NAME
+            name_id = len(self._names)
+            self._names[name] = name_id
+            offset = HEADER_SIZE + name_id * NAME_SIZE
+            self._mm[offset:offset + NAME_SIZE] = name.encode('utf-8')[:NAME_SIZE].ljust(NAME_SIZE, b'\0')
+            struct.pack_into('<I', self._mm, _NAME_COUNT_OFFSET, len(self._names))
+        return name_id
+
+    def _run(self):
+        while True:
+            self._wake.wait(0.2)
+            self._wake.clear()
+            self._drain()
+            if self._closed:
+                self._drain()
+                return
+
+    def _drain(self):
+        while self._pending:
+            mono_ns, direction, device, port, data = self._pending.popleft()
+            device_id = self._name_id(device)
+            port_id = self._name_id(port)
+            for start in range(0, len(data), SLOT_PAYLOAD):
+                chunk = data[start:start + SLOT_PAYLOAD]
+                flags = FLAG_CONT if start else 0
+                if start + SLOT_PAYLOAD < len(data):
+                    flags |= FLAG_MORE
+                slot = self.count % self.capacity
+                self._col_valid[slot] = 0
+                self._col_seq[slot] = self.count
+                self._col_mono[slot] = mono_ns
+                self._col_device[slot] = device_id
+                self._col_port[slot] = port_id
+                self._col_direction[slot] = direction
+                self._col_flags[slot] = flags
+                self._col_length[slot] = len(chunk)
+                self._col_data[slot, :len(chunk)] = np.frombuffer(chunk, dtype=np.uint8)
+                self._col_valid[slot] = 1
+                self.count += 1
+            self.records += 1
+            self.bytes += len(data)
+        struct.pack_into('<Q', self._mm, _COUNT_OFFSET, self.count)
+
+    def close(self) -> Dict:
+        """停止抓包并关闭文件（写完队列中的记录），返回抓包统计"""
+        if not self._closed:
+            self._closed = True
+            self._wake.set()
+            self._thread.join(5.0)
+            # 释放所有指向映射内存的numpy视图后才能关闭mmap
+            self._col_seq = self._col_mono = self._col_device = self._col_port = None
+            self._col_direction = self._col_flags = self._col_length = self._col_valid = self._col_data = None
+            self._mm.flush()
+            self._mm.close()
+            self._file.close()
+        return self.get_status()
+
+    def get_status(self) -> Dict:
+        """获取抓包状态"""
+        return {
+            'path': self.path,
+            'capturing': not self._closed,
+            'capacity': self.capacity,
+            'slots': self.count,
+            'records': self.records,
+            'bytes': self.bytes,
+            'pending': len(self._pending),
+            'dropped': self.dropped,
+            'startedAt': self.started_at,
+        }
+
+
+class SerialCaptureReader:
+    """
+    抓包文件读取器 - 按写入顺序返回记录（跨槽位的数据已拼接）
+
+    环形覆盖后最早的一条记录可能只剩后半段，读取时丢弃。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            buf = f.read()
+        if len(buf) < _slots_offset():
+            raise ValueError(f"不是有效的串口抓包文件: {path}")
+        (magic, version, slot_size, self.capacity, name_count,
+         self.start_wall_ns, self.start_mono_ns, self.count) = _HEADER_STRUCT.unpack_from(buf, 0)
+        if magic != FILE_MAGIC or version != FILE_VERSION or slot_size != SLOT_DTYPE.itemsize:
+            raise ValueError(f"不是有效的串口抓包文件: {path}")
+
+        self.names: List[str] = []
+        for i in range(min(name_count, NAME_TABLE_ENTRIES)):
+            offset = HEADER_SIZE + i * NAME_SIZE
+            self.names.append(buf[offset:offset + NAME_SIZE].rstrip(b'\0').decode('utf-8', errors='replace'))
+
+        slots = np.frombuffer(buf, dtype=SLOT_DTYPE, count=self.capacity, offset=_slots_offset())
+        valid = np.nonzero(slots['valid'])[0]
+        self._slots = slots[valid[np.argsort(slots['seq'][valid], kind='stable')]]
+
+    def _name(self, name_id: int) -> str:
+        return self.names[name_id] if name_id < len(self.names) else ''
+
+    def __iter__(self) -> Iterator[Dict]:
+        """
+        Yields:
+            dict: {'seq', 'mono_ns', 'wall_ns', 'direction', 'device', 'port', 'data'}
+        """
+        chunks = []
+        first = None
+        prev_seq = -1
+        for slot in self._slots:
+            seq = int(slot['seq'])
+            flags = int(slot['flags'])
+            if chunks and seq != prev_seq + 1:
+                # 中间的槽位已被覆盖，丢弃不完整的记录
+                chunks, first = [], None
+            prev_seq = seq
+            if flags & FLAG_CONT:
+                if not chunks:
+                    continue  # 记录开头已被覆盖
+            else:
+                chunks, first = [], slot
+            chunks.append(slot['data'][:slot['length']].tobytes())
+            if flags & FLAG_MORE:
+                continue
+            mono_ns = int(first['mono_ns'])
+            yield {
+                'seq': int(first['seq']),
+                'mono_ns': mono_ns,
+                'wall_ns': self.start_wall_ns + (mono_ns - self.start_mono_ns),
+                'direction': int(first['direction']),
+                'device': self._name(int(first['device'])),
+                'port': self._name(int(first['port'])),
+                'data': b''.join(chunks),
+            }
+            chunks, first = [], None
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def get_info(self) -> Dict:
+        """获取抓包文件信息"""
+        records = list(self)
+        duration = (records[-1]['mono_ns'] - records[0]['mono_ns']) / 1e9 if len(records) > 1 else 0.0
+        return {
+            'path': self.path,
+            'capacity': self.capacity,
+            'count': self.count,
+            'records': len(records),
+            'devices': sorted({r['device'] for r in records}),
+            'ports': sorted({r['port'] for r in records}),
+            'duration': duration,
+            'startedAt': self.start_wall_ns / 1e9,
+        }
@@ -0,0 +1,51 @@
+"""
+串口响应帧判定
+
+读取线程把收到的字节追加到缓冲区，等待响应的调用方用 Framer 判断缓冲区开头
+是否已经构成一个完整的响应帧。帧一完整立即返回，不再等待空闲超时。
+
+每个 Framer 实现 frame_length(buffer, command)：
+    返回完整帧的字节数；帧尚未完整时返回 None。
+"""
+from typing import Optional
+
+
+class TerminatorFramer:
+    """以结束符结尾的帧，如黑体温度返回 *XXXXXXHYYYYYY# 、电机返回以 \\r 结尾"""
+
+    def __init__(self, terminator: bytes):
+        if not terminator:
+            raise ValueError("结束符不能为空")
+        self.terminator = terminator
+
+    def frame_length(self, buffer: bytearray, command: bytes) -> Optional[int]:
+        index = buffer.find(self.terminator)
+        return index + len(self.terminator) if index >= 0 else None
+
+    def __repr__(self):
+        return f"TerminatorFramer({self.terminator!r})"
+
+
+class FixedLengthFramer:
+    """固定长度的帧，如延时模块返回 aa bb cc dd 0x (5字节)"""
+
+    def __init__(self, length: int):
+        if length <= 0:
+            raise ValueError("帧长度必须大于0")
+        self.length = length
+
+    def frame_length(self, buffer: bytearray, command: bytes) -> Optional[int]:
+        return self.length if len(buffer) >= self.length else None
+
+    def __repr__(self):
+        return f"FixedLengthFramer({self.length})"
+
+
+class EchoLengthFramer:
+    """回显帧，长度与发送的指令相同，如光源功率设置"""
+
+    def frame_length(self, buffer: bytearray, command: bytes) -> Optional[int]:
+        return len(command) if len(buffer) >= len(command) else None
+
+    def __repr__(self):
+        return "EchoLengthFramer()"
@@ -0,0 +1,214 @@
+"""
+串口收发性能统计 - 按设备、指令统计延迟分布和吞吐量
+
+SerialService 每次收发事务记录：
+    写入耗时      ser.write 本身的耗时
+    首字节延迟    写入完成到收到第一个字节
+    帧完成延迟    写入完成到响应帧完整（或超时）
+    超时、串口错误次数，发送/接收字节数
+CommandService 在返回值验证失败时记录验证失败次数。
+
+延迟使用固定分桶直方图，记录只是桶计数加一；每个 (设备, 指令) 一把锁，
+同一设备的指令本就串行执行，锁几乎没有争用。
+"""
+import bisect
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# 直方图桶上界（毫秒）：0.05ms 起每桶增大 2^(1/4)，约 19% 的相对分辨率，
+# 最后一个桶收集超过约 11s 的样本
+BUCKET_BOUNDS_MS = tuple(round(0.05 * 2 ** (i / 4), 4) for i in range(72))
+
+
+class LatencyHistogram:
+    """固定分桶的延迟直方图"""
+
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value_ms: float):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS_MS, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+        if self.min is None or value_ms < self.min:
+            self.min = value_ms
+        if self.max is None or value_ms > self.max:
+            self.max = value_ms
+
+    def percentile(self, q: float) -> Optional[float]:
+        """按桶估计分位数（在所在桶内线性插值，限制在实际最小/最大值之间）"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= target:
+                lower = BUCKET_BOUNDS_MS[i - 1] if i > 0 else 0.0
+                upper = BUCKET_BOUNDS_MS[i] if i < len(BUCKET_BOUNDS_MS) else self.max
+                value = lower + (upper - lower) * (target - seen) / n
+                return round(min(max(value, self.min), self.max), 3)
+            seen += n
+        return round(self.max, 3)
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 3) if self.count else None,
+            'min': round(self.min, 3) if self.min is not None else None,
+            'max': round(self.max, 3) if self.max is not None else None,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'buckets': list(self.counts),
+        }
+
+
+class _CommandMetrics:
+    """单个 (设备, 指令) 的统计"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.transactions = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.verify_failures = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.last_time = 0.0
+        self.write = LatencyHistogram()
+        self.first_byte = LatencyHistogram()
+        self.frame = LatencyHistogram()
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                'transactions': self.transactions,
+                'errors': self.errors,
+                'timeouts': self.timeouts,
+                'verifyFailures': self.verify_failures,
+                'bytesOut': self.bytes_out,
+                'bytesIn': self.bytes_in,
+                'lastTime': self.last_time,
+                'writeMs': self.write.to_dict(),
+                'firstByteMs': self.first_byte.to_dict(),
+                'frameMs': self.frame.to_dict(),
+            }
+
+
+class SerialMetrics:
+    """按 (设备, 指令) 汇总的串口收发统计"""
+
+    def __init__(self):
+        self._metrics: Dict[Tuple[str, str], _CommandMetrics] = {}
+        self._lock = threading.Lock()
+        self._since = time.time()
+
+    def _get(self, device: str, cmd: str) -> _CommandMetrics:
+        key = (device, cmd)
+        metrics = self._metrics.get(key)
+        if metrics is None:
+            with self._lock:
+                metrics = self._metrics.setdefault(key, _CommandMetrics())
+        return metrics
+
+    def record_transaction(self, device: str, cmd: str, *, write_ms: Optional[float] = None,
+                           first_byte_ms: Optional[float] = None, frame_ms: Optional[float] = None,
+                           bytes_out: int = 0, bytes_in: int = 0,
+                           timeout: bool = False, error: bool = False):
+        """
+        记录一次收发事务
+
+        Args:
+            device: 设备标识
+            cmd: 指令名称（直接发送原始字节时为 'raw'）
+            write_ms: 写入耗时
+            first_byte_ms: 写入完成到收到第一个字节，未收到数据为 None
+            frame_ms: 写入完成到响应帧完整或超时，未等待响应为 None
+            bytes_out: 发送字节数
+            bytes_in: 接收字节数
+            timeout: 等待响应超时（未收到完整帧）
+            error: 串口通信错误
+        """
+        metrics = self._get(device, cmd)
+        with metrics.lock:
+            metrics.transactions += 1
+            metrics.bytes_out += bytes_out
+            metrics.bytes_in += bytes_in
+            metrics.last_time = time.time()
+            if error:
+                metrics.errors += 1
+            if timeout:
+                metrics.timeouts += 1
+            if write_ms is not None:
+                metrics.write.add(write_ms)
+            if first_byte_ms is not None:
+                metrics.first_byte.add(first_byte_ms)
+            if frame_ms is not None:
+                metrics.frame.add(frame_ms)
+
+    def record_verify_failure(self, device: str, cmd: str):
+        """记录一次返回值验证失败"""
+        metrics = self._get(device, cmd)
+        with metrics.lock:
+            metrics.verify_failures += 1
+
+    def snapshot(self, device: Optional[str] = None) -> dict:
+        """
+        获取统计快照
+
+        Returns:
+            dict: {'since': 开始统计时间, 'bucketBoundsMs': [...], 'devices': {device: {cmd: {...}}}}
+        """
+        with self._lock:
+            items = list(self._metrics.items())
+        devices: Dict[str, Dict[str, dict]] = {}
+        for (dev, cmd), metrics in sorted(items):
+            if device and dev != device:
+                continue
+            devices.setdefault(dev, {})[cmd] = metrics.to_dict()
+        return {
+            'since': self._since,
+            'bucketBoundsMs': list(BUCKET_BOUNDS_MS),
+            'devices': devices,
+        }
+
+    def summary(self) -> List[dict]:
+        """每个 (设备, 指令) 一行的精简统计，用于实时面板推送"""
+        rows = []
+        now = time.time()
+        for dev, commands in self.snapshot()['devices'].items():
+            for cmd, m in commands.items():
+                rows.append({
+                    'device': dev,
+                    'cmd': cmd,
+                    'transactions': m['transactions'],
+                    'errors': m['errors'],
+                    'timeouts': m['timeouts'],
+                    'verifyFailures': m['verifyFailures'],
+                    'bytesOut': m['bytesOut'],
+                    'bytesIn': m['bytesIn'],
+                    'writeP50': m['writeMs']['p50'],
+                    'firstByteP50': m['firstByteMs']['p50'],
+                    'frameP50': m['frameMs']['p50'],
+                    'frameP95': m['frameMs']['p95'],
+                    'frameMax': m['frameMs']['max'],
+                    'idleSeconds': round(now - m['lastTime'], 1),
+                })
+        return rows
+
+    def reset(self):
+        """清空统计"""
+        with self._lock:
+            self._metrics = {}
+            self._since = time.time()
+
+
+# 全局统计实例
+serial_metrics = SerialMetrics()
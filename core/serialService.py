@@ -3,30 +3,246 @@
 提供串口连接、断开、数据收发等核心功能
 """
 import serial
+import serial.tools.list_ports
 import threading
 import time
-from typing import Dict, List
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .serialMetrics import serial_metrics
+from .serialCapture import SerialCapture, DIRECTION_RX, DIRECTION_TX
+
+
+class _PortReader:
+    """
+    串口读取线程 - 持续读取串口数据到缓冲区，数据到达时唤醒等待响应的调用方
+
+    替代原来的 in_waiting 轮询 + sleep，响应帧完整即可返回。
+    """
+
+    def __init__(self, ser: serial.Serial, name: str = '', on_data: Optional[Callable[[bytes, int], None]] = None):
+        self._ser = ser
+        self._on_data = on_data     # on_data(data, monotonic_ns)，用于抓包
+        self._buffer = bytearray()
+        self._cond = threading.Condition()
+        self._last_rx = 0.0
+        self._first_rx = 0.0
+        self._stopping = False
+        self.error: Optional[Exception] = None
+        self._thread = threading.Thread(target=self._run, name=f"serial-reader-{name}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        ser = self._ser
+        while not self._stopping:
+            try:
+                # 阻塞读取，至少1字节或串口超时返回
+                data = ser.read(ser.in_waiting or 1)
+            except Exception as e:
+                if not self._stopping:
+                    with self._cond:
+                        self.error = e
+                        self._cond.notify_all()
+                return
+            if data:
+                if self._on_data is not None:
+                    self._on_data(data, time.monotonic_ns())
+                with self._cond:
+                    self._last_rx = time.perf_counter()
+                    if not self._buffer:
+                        self._first_rx = self._last_rx
+                    self._buffer += data
+                    self._cond.notify_all()
+
+    def stop(self):
+        """停止读取线程（需在关闭串口后调用 join 等待退出）"""
+        self._stopping = True
+
+    def join(self, timeout: float = 1.0):
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def clear(self):
+        """丢弃缓冲区中尚未读取的数据"""
+        with self._cond:
+            self._buffer.clear()
+            self._first_rx = 0.0
+
+    def read_frame(self, command: bytes, timeout: float, idle_timeout: float, framer=None) -> Tuple[bytes, float, bool]:
+        """
+        等待一个响应帧
+
+        Args:
+            command: 刚发送的指令（回显类帧需要其长度）
+            timeout: 总超时时间（秒）
+            idle_timeout: 未指定帧格式时，收到数据后超过此时间无新数据认为接收完成
+            framer: 帧判定器（见 core.serialFramer），None 表示按空闲超时判定
+
+        Returns:
+            tuple: (frame, first_rx, complete)
+                   frame 为完整帧，超时时为已收到的部分数据（可能为空）；
+                   first_rx 为收到第一个字节的 perf_counter 时间，未收到为 0；
+                   complete 表示帧完整（未指定帧格式时表示收到了数据）
+        """
+        deadline = time.perf_counter() + timeout
+        with self._cond:
+            while True:
+                now = time.perf_counter()
+                wait = deadline - now
+                if self._buffer:
+                    if framer is not None:
+                        length = framer.frame_length(self._buffer, command)
+                        if length:
+                            frame = bytes(self._buffer[:length])
+                            del self._buffer[:length]
+                            return frame, self._first_rx, True
+                    else:
+                        idle_left = self._last_rx + idle_timeout - now
+                        if idle_left <= 0:
+                            break
+                        wait = min(wait, idle_left)
+                if self.error is not None:
+                    raise serial.SerialException(str(self.error))
+                if wait <= 0:
+                    break
+                self._cond.wait(wait)
+            frame = bytes(self._buffer)
+            self._buffer.clear()
+            return frame, self._first_rx, framer is None and bool(frame)
+
+
+class _SharedPort:
+    """
+    一个物理串口及其读取线程，可由多个设备共用（如光源、三轴电机、延时模块都接在COM1）
+
+    收发事务由 lock 互斥，事务开始时切换为当前设备的线路参数（波特率、数据位等），
+    事务期间收到的数据都属于当前调用方。
+    """
+
+    def __init__(self, name: str, ser: serial.Serial, settings: Dict,
+                 on_rx: Optional[Callable[['_SharedPort', bytes, int], None]] = None):
+        self.name = name
+        self.ser = ser
+        self._on_rx = on_rx
+        self.reader = _PortReader(ser, name, self._on_data if on_rx else None)
+        self.active_device = ''     # 当前(最近)收发事务的设备，接收的数据归属于它
+        self.lock = threading.Lock()
+        self.devices = set()
+        self.settings = dict(settings)
+        self.timeout = ser.timeout
+        # 串口在线时置位；检测到错误后清除，重连成功后重新置位
+        self.online = threading.Event()
+        self.online.set()
+        self.last_error = ''
+        self.last_ok = time.monotonic()      # 最近一次成功收发的时间
+        self.reconnect_attempts = 0
+        self.next_attempt = 0.0
+        self.backoff = 0.0
+
+    def _on_data(self, data: bytes, mono_ns: int):
+        self._on_rx(self, data, mono_ns)
+
+    def apply_settings(self, settings: Dict):
+        """切换线路参数（调用方持有 lock）"""
+        if settings != self.settings:
+            self.ser.apply_settings(settings)
+            self.settings = dict(settings)
+
+    def mark_failed(self, error: str):
+        """标记串口故障，由监控线程重连"""
+        if self.online.is_set():
+            self.last_error = error
+            self.online.clear()
+
+    def check(self) -> bool:
+        """检查串口是否仍可用（读取线程未出错且串口仍打开）"""
+        if self.online.is_set():
+            if self.reader.error is not None:
+                self.mark_failed(str(self.reader.error))
+            elif not self.ser.is_open:
+                self.mark_failed('串口已关闭')
+        return self.online.is_set()
+
+    def reopen(self):
+        """关闭旧串口并以最后使用的线路参数重新打开（调用方持有 lock）"""
+        self.reader.stop()
+        try:
+            self.ser.close()
+        except Exception:
+            pass
+        self.reader.join()
+        ser = serial.Serial(port=self.name, timeout=self.timeout, **self.settings)
+        self.ser = ser
+        self.reader = _PortReader(ser, self.name, self._on_data if self._on_rx else None)
+        self.last_error = ''
+        self.last_ok = time.monotonic()
+        self.reconnect_attempts = 0
+        self.backoff = 0.0
+        self.online.set()
+
+    def close(self):
+        self.reader.stop()
+        self.ser.close()
+        self.reader.join()
 
 
 class SerialService:
     """串口通信服务类"""
 
+    PARITY_MAP = {
+        'None': serial.PARITY_NONE,
+        'Even': serial.PARITY_EVEN,
+        'Odd': serial.PARITY_ODD,
+        'Mark': serial.PARITY_MARK,
+        'Space': serial.PARITY_SPACE
+    }
+
+    # 串口监控：检测串口故障后按指数退避自动重连，串口空闲时发送心跳
+    SUPERVISOR_INTERVAL = 0.5           # 检查周期（秒）
+    RECONNECT_BACKOFF_INITIAL = 0.5     # 重连失败后首次等待（秒），之后每次加倍
+    RECONNECT_BACKOFF_MAX = 30.0        # 重连等待上限（秒）
+    RECONNECT_WAIT = 3.0                # 重连期间发出的指令最多等待（秒），超时才返回失败
+    HEARTBEAT_INTERVAL = 5.0            # 串口空闲超过此时间发送心跳（秒）
+    HEARTBEAT_MAX_FAILURES = 3          # 连续心跳失败次数，达到后标记该设备无响应（不重连串口）
+    HEARTBEAT_BACKOFF_MAX = 300.0       # 无响应设备的心跳间隔上限（秒），之前每次失败间隔加倍
+
+    # 串口自动识别：每条探测指令等待响应的时间（秒）
+    PROBE_TIMEOUT = 0.15
+
     def __init__(self):
         """初始化串口服务"""
         # 存储所有连接的串口对象，格式: {device_key: serial_port}
         self._serial_connections: Dict[str, serial.Serial] = {}
         # 存储设备对应的串口号，格式: {device_key: port_name}
         self._device_ports: Dict[str, str] = {}
+        # 存储设备的线路参数，格式: {device_key: {baudrate, bytesize, parity, stopbits}}
+        self._device_settings: Dict[str, Dict] = {}
+        # 已打开的物理串口，每个串口只打开一次，格式: {port_name: _SharedPort}
+        self._ports: Dict[str, _SharedPort] = {}
         # 存储接收到的数据，格式: {device_key: [数据列表]}
         self._received_data: Dict[str, List[str]] = {}
         # 线程锁，保证线程安全
         self._lock = threading.Lock()
+        # 串口监控线程及设备心跳
+        self._supervisor: Optional[threading.Thread] = None
+        self._supervisor_wake = threading.Event()
+        self._heartbeat_provider: Optional[Callable[[str], Optional[Future]]] = None
+        self._heartbeats: Dict[str, Future] = {}
+        self._heartbeat_failures: Dict[str, int] = {}
+        # 各设备下次允许发送心跳的时间（time.monotonic），心跳失败后按退避推迟
+        self._heartbeat_next: Dict[str, float] = {}
+        # 串口抓包（见 core.serialCapture），None 表示未抓包
+        self._capture: Optional[SerialCapture] = None
     
     def connect(self, device_key: str, port: str, baudrate: int, 
                 data_bits: int = 8, stop_bits: float = 1, 
                 parity: str = 'None', timeout: int = 1000) -> tuple:
         """
         连接串口
+
+        同一串口号已被其他设备打开时直接共用，不重复打开；
+        线路参数与已打开的不同时，每次收发前切换为本设备的参数。
+        该串口正在重连时沿用原来的共享串口并立即重试一次，失败则本设备连接失败，其他设备不受影响。
         
         Args:
             device_key: 设备唯一标识
@@ -40,57 +256,75 @@ class SerialService:
         Returns:
             tuple: (success: bool, message: str)
         """
+        # 如果已经连接，先断开
+        if device_key in self._serial_connections:
+            self.disconnect(device_key)
+
+        settings = self.line_settings(baudrate, data_bits, stop_bits, parity)
+
         with self._lock:
-            # 如果已经连接，先断开
-            if device_key in self._serial_connections:
-                try:
-                    self._serial_connections[device_key].close()
-                except serial.SerialException as e:
-                    print(f"Warning: Failed to close existing connection for {device_key}: {e}")
-                except Exception as e:
-                    print(f"Warning: Unexpected error closing connection for {device_key}: {e}")
-                del self._serial_connections[device_key]
-            
-            # 如果已存在接收数据缓存，清空
-            if device_key in self._received_data:
-                self._received_data[device_key].clear()
-        
+            shared = self._ports.get(port)
+            if shared is not None:
+                others = ', '.join(sorted(shared.devices))
+                shared.devices.add(device_key)
+                self._attach(device_key, shared, settings)
+        if shared is not None:
+            if not shared.check():
+                # 串口故障、监控线程正在重连：沿用同一个共享串口（保留共用的其他设备），立即重试一次
+                self._reconnect(shared)
+                if not shared.online.is_set():
+                    error = shared.last_error
+                    self.disconnect(device_key)
+                    return False, f"串口 {port} 连接中断，正在重连: {error}"
+            if settings == shared.settings:
+                return True, f"串口 {port} 连接成功（与 {others} 共用）"
+            return True, f"串口 {port} 连接成功（与 {others} 共用，收发时切换线路参数）"
+
         try:
-            # 转换parity参数为serial库需要的格式
-            parity_map = {
-                'None': serial.PARITY_NONE,
-                'Even': serial.PARITY_EVEN,
-                'Odd': serial.PARITY_ODD,
-                'Mark': serial.PARITY_MARK,
-                'Space': serial.PARITY_SPACE
-            }
-            parity_value = parity_map.get(parity, serial.PARITY_NONE)
-            
             # 打开串口连接
             ser = serial.Serial(
                 port=port,
-                baudrate=baudrate,
-                bytesize=data_bits,
-                parity=parity_value,
-                stopbits=stop_bits,
-                timeout=timeout / 1000.0  # 转换为秒
+                timeout=timeout / 1000.0,  # 转换为秒
+                **settings
             )
-            
-            with self._lock:
-                self._serial_connections[device_key] = ser
-                self._device_ports[device_key] = port
-                self._received_data[device_key] = []
-            
-            return True, f"串口 {port} 连接成功"
-            
         except serial.SerialException as e:
             return False, f"{str(e)}"
         except Exception as e:
             return False, f"{str(e)}"
+
+        with self._lock:
+            shared = self._ports.get(port)
+            if shared is not None:
+                # 其他线程已同时打开了该串口
+                ser.close()
+            else:
+                shared = self._ports[port] = _SharedPort(port, ser, settings, self._capture_rx)
+            shared.devices.add(device_key)
+            self._attach(device_key, shared, settings)
+            self._ensure_supervisor()
+
+        return True, f"串口 {port} 连接成功"
+
+    @classmethod
+    def line_settings(cls, baudrate: int, data_bits: int = 8, stop_bits: float = 1, parity: str = 'None') -> Dict:
+        """将页面配置的线路参数转换为 pyserial 参数"""
+        return {
+            'baudrate': baudrate,
+            'bytesize': data_bits,
+            'parity': cls.PARITY_MAP.get(parity, serial.PARITY_NONE),
+            'stopbits': stop_bits,
+        }
+
+    def _attach(self, device_key: str, shared: _SharedPort, settings: Dict):
+        """登记设备使用的共享串口（调用方持有 self._lock）"""
+        self._serial_connections[device_key] = shared.ser
+        self._device_ports[device_key] = shared.name
+        self._device_settings[device_key] = settings
+        self._received_data[device_key] = []
     
     def disconnect(self, device_key: str) -> tuple:
         """
-        断开指定设备的串口连接
+        断开指定设备的串口连接（串口不再被任何设备使用时才关闭）
         
         Args:
             device_key: 设备唯一标识
@@ -101,40 +335,50 @@ class SerialService:
         with self._lock:
             if device_key not in self._serial_connections:
                 return False, f"设备 {device_key} 未连接"
-            
-            try:
-                ser = self._serial_connections[device_key]
-                ser.close()
-                del self._serial_connections[device_key]
 
-                # 清空串口号缓存
-                if device_key in self._device_ports:
-                    del self._device_ports[device_key]
+            port = self._device_ports.pop(device_key, '')
+            del self._serial_connections[device_key]
+            self._device_settings.pop(device_key, None)
+            # 清空接收数据缓存
+            self._received_data.pop(device_key, None)
+            self._heartbeat_failures.pop(device_key, None)
+            self._heartbeat_next.pop(device_key, None)
 
-                # 清空接收数据缓存
-                if device_key in self._received_data:
-                    del self._received_data[device_key]
-                
+            shared = self._ports.get(port)
+            if shared is None:
                 return True, "断开连接成功"
-                
-            except Exception as e:
-                return False, f"断开连接失败: {str(e)}"
+            shared.devices.discard(device_key)
+            if shared.devices:
+                return True, "断开连接成功（串口仍被其他设备使用）"
+            del self._ports[port]
+
+        try:
+            # 等待进行中的收发事务结束后再关闭
+            with shared.lock:
+                shared.close()
+            return True, "断开连接成功"
+        except Exception as e:
+            return False, f"断开连接失败: {str(e)}"
     
     def send_command(self, device_key: str, command: bytes,
                      wait_response: bool = True,
                      response_timeout: float = 2.0,
-                     idle_timeout: float = 0.1) -> tuple:
+                     idle_timeout: float = 0.1,
+                     framer=None,
+                     metric_key: str = 'raw') -> tuple:
         """
         向指定设备发送指令并接收返回值（二进制数据）
 
-        流程: 先读取清除垃圾数据 → 发送指令 → 读取响应
+        流程: 丢弃缓冲区中的垃圾数据 → 发送指令 → 等待响应帧
 
         Args:
             device_key: 设备唯一标识
             command: 要发送的指令（字节串）
             wait_response: 是否等待响应
             response_timeout: 响应超时时间（秒）
-            idle_timeout: 空闲超时时间（秒），收到数据后若超过此时间无新数据则认为接收完成
+            idle_timeout: 空闲超时时间（秒），未指定 framer 时，收到数据后若超过此时间无新数据则认为接收完成
+            framer: 响应帧判定器（见 core.serialFramer），帧完整即返回
+            metric_key: 收发统计中的指令名称（见 core.serialMetrics）
 
         Returns:
             tuple: (success: bool, message: str, response: bytes)
@@ -142,72 +386,239 @@ class SerialService:
         """
         # 先获取串口对象（短时间持有锁）
         with self._lock:
-            if device_key not in self._serial_connections:
+            shared = self._ports.get(self._device_ports.get(device_key, ''))
+            settings = self._device_settings.get(device_key)
+            if device_key not in self._serial_connections or shared is None or settings is None:
                 return False, "设备未连接", b''
-            ser = self._serial_connections[device_key]
 
-        # 以下操作不持有锁，允许其他设备并行操作
+        if not shared.check():
+            # 串口已故障或正在重连，短暂等待重连而不是立即失败
+            self._supervisor_wake.set()
+            if not shared.online.wait(self.RECONNECT_WAIT):
+                return False, f"串口 {shared.name} 连接中断，正在重连: {shared.last_error}", b''
+
+        # 以下操作只持有该串口的锁，其他串口的设备可并行操作
+        with shared.lock:
+            return self._transact(shared, settings, command, wait_response, response_timeout, idle_timeout,
+                                  framer, device_key, metric_key)
+
+    def _transact(self, shared: _SharedPort, settings: Dict, command: bytes, wait_response: bool,
+                  response_timeout: float, idle_timeout: float, framer,
+                  device_key: str = '', metric_key: str = 'raw') -> tuple:
+        """一次完整的收发事务（调用方持有串口锁），并记录收发统计"""
+        ser, reader = shared.ser, shared.reader
+        write_ms = None
         try:
-            # 1. 先读取并丢弃缓冲区中的垃圾数据
+            if reader.error is not None:
+                raise serial.SerialException(str(reader.error))
+
+            # 0. 共用串口时切换为本设备的线路参数
+            shared.apply_settings(settings)
+
+            # 1. 丢弃之前残留的数据（读取线程已将其读入缓冲区）
             ser.reset_input_buffer()
-            # 短暂等待后再次清理，确保清除残留
-            time.sleep(0.02)
-            if ser.in_waiting > 0:
-                _ = ser.read(ser.in_waiting)  # 丢弃垃圾数据
+            reader.clear()
 
             # 2. 发送字节串指令
+            shared.active_device = device_key
+            capture = self._capture
+            if capture is not None:
+                capture.record(DIRECTION_TX, device_key, shared.name, command)
+            t_start = time.perf_counter()
             ser.write(command)
+            t_written = time.perf_counter()
+            write_ms = (t_written - t_start) * 1000.0
 
             # 3. 如果不需要等待响应，直接返回
             if not wait_response:
+                serial_metrics.record_transaction(device_key, metric_key, write_ms=write_ms,
+                                                  bytes_out=len(command))
+                shared.last_ok = time.monotonic()
                 return True, "指令发送成功", b''
 
-            # 4. 等待接收响应数据
-            response = self._read_response(ser, response_timeout, idle_timeout)
-
+            # 4. 等待接收响应数据（帧完整即返回）
+            response, first_rx, complete = reader.read_frame(command, response_timeout, idle_timeout, framer)
+            t_done = time.perf_counter()
+
+            serial_metrics.record_transaction(
+                device_key, metric_key,
+                write_ms=write_ms,
+                first_byte_ms=max(first_rx - t_written, 0.0) * 1000.0 if first_rx else None,
+                frame_ms=(t_done - t_written) * 1000.0,
+                bytes_out=len(command),
+                bytes_in=len(response),
+                timeout=not complete,
+            )
+            if response:
+                shared.last_ok = time.monotonic()
             return True, "指令发送成功", response
 
         except serial.SerialException as e:
+            # 串口故障（如USB转串口掉线），由监控线程重连；已发出的指令不自动重发
+            shared.mark_failed(str(e))
+            self._supervisor_wake.set()
+            serial_metrics.record_transaction(device_key, metric_key, write_ms=write_ms, error=True)
             return False, f"串口通信错误: {str(e)}", b''
         except Exception as e:
+            serial_metrics.record_transaction(device_key, metric_key, write_ms=write_ms, error=True)
             return False, f"发送指令失败: {str(e)}", b''
     
-    def _read_response(self, ser: serial.Serial, timeout: float,
-                       idle_timeout: float = 0.1) -> bytes:
+    # ===================== 串口抓包 =====================
+    def start_capture(self, path: str, capacity: int = 65536) -> Dict:
+        """开始抓包：所有串口收发的原始字节写入环形文件（已在抓包时先停止旧文件）"""
+        capture = SerialCapture(path, capacity)
+        old, self._capture = self._capture, capture
+        if old is not None:
+            old.close()
+        return capture.get_status()
+
+    def stop_capture(self) -> Optional[Dict]:
+        """停止抓包，返回抓包统计；未在抓包时返回 None"""
+        capture, self._capture = self._capture, None
+        return capture.close() if capture is not None else None
+
+    def get_capture_status(self) -> Optional[Dict]:
+        capture = self._capture
+        return capture.get_status() if capture is not None else None
+
+    def _capture_rx(self, shared: _SharedPort, data: bytes, mono_ns: int):
+        """读取线程收到数据时调用"""
+        capture = self._capture
+        if capture is not None:
+            capture.record(DIRECTION_RX, shared.active_device, shared.name, data, mono_ns)
+
+    # ===================== 串口监控 =====================
+    def set_heartbeat_provider(self, provider: Optional[Callable[[str], Optional[Future]]]):
         """
-        从串口读取响应数据（二进制）
+        设置设备心跳
 
-        Args:
-            ser: 串口对象
-            timeout: 总超时时间（秒）
-            idle_timeout: 空闲超时时间（秒），收到数据后若超过此时间无新数据则认为接收完成
+        串口空闲超过 HEARTBEAT_INTERVAL 时，监控线程调用 provider(device_key)，
+        返回的 Future 结果为真表示设备有响应；返回 None 表示该设备没有心跳指令，只检查串口状态。
+        """
+        self._heartbeat_provider = provider
+
+    def _ensure_supervisor(self):
+        """启动串口监控线程（调用方持有 self._lock）"""
+        if self._supervisor is None or not self._supervisor.is_alive():
+            self._supervisor = threading.Thread(target=self._supervise, name='serial-supervisor', daemon=True)
+            self._supervisor.start()
+
+    def _supervise(self):
+        """监控线程：检测串口故障并重连，空闲时发送心跳；没有打开的串口时退出"""
+        while True:
+            # 指令发现串口故障时立即唤醒
+            self._supervisor_wake.wait(self.SUPERVISOR_INTERVAL)
+            self._supervisor_wake.clear()
+            with self._lock:
+                ports = list(self._ports.values())
+                if not ports:
+                    self._supervisor = None
+                    return
+            now = time.monotonic()
+            for shared in ports:
+                try:
+                    if shared.check():
+                        self._check_heartbeats(shared, now)
+                    elif now >= shared.next_attempt:
+                        self._reconnect(shared)
+                except Exception as e:
+                    print(f"[SerialService] 串口 {shared.name} 监控异常: {e}")
 
-        Returns:
-            bytes: 接收到的数据字节串
+    def _reconnect(self, shared: _SharedPort):
+        """以最后使用的线路参数重新打开串口，失败时按指数退避安排下次重试"""
+        with shared.lock:
+            with self._lock:
+                if self._ports.get(shared.name) is not shared:
+                    return  # 已被手动断开
+            if shared.online.is_set():
+                return
+            shared.reconnect_attempts += 1
+            try:
+                shared.reopen()
+            except Exception as e:
+                shared.last_error = str(e)
+                shared.backoff = min(max(shared.backoff * 2, self.RECONNECT_BACKOFF_INITIAL),
+                                     self.RECONNECT_BACKOFF_MAX)
+                shared.next_attempt = time.monotonic() + shared.backoff
+                print(f"[SerialService] 串口 {shared.name} 重连失败(第{shared.reconnect_attempts}次)，"
+                      f"{shared.backoff:.1f}s 后重试: {e}")
+                return
+        with self._lock:
+            for device_key in shared.devices:
+                self._serial_connections[device_key] = shared.ser
+                self._heartbeat_failures.pop(device_key, None)
+                self._heartbeat_next.pop(device_key, None)
+        print(f"[SerialService] 串口 {shared.name} 已重连")
+
+    def _check_heartbeats(self, shared: _SharedPort, now: float):
         """
-        start_time = time.time()
-        last_data_time = start_time
-        response_parts = []
-
-        while time.time() - start_time < timeout:
-            if ser.in_waiting > 0:
-                # 读取可用数据
-                data = ser.read(ser.in_waiting)
-                response_parts.append(data)
-                last_data_time = time.time()  # 更新最后收到数据的时间
-                time.sleep(0.01)
-            else:
-                # 如果已收到数据，且空闲时间超过阈值，提前返回
-                if response_parts and (time.time() - last_data_time > idle_timeout):
-                    break
-                time.sleep(0.01)
+        收取上一轮心跳结果；串口空闲时为其上的设备发送心跳
+
+        心跳只反映单个设备是否应答：共用串口上某台设备断电不影响其他设备，
+        连续无响应只标记该设备（见 get_port_health），串口只在读取出错或被关闭时重连（见 check）。
+        每次心跳失败都会占用串口一个响应超时，因此失败后至少间隔 HEARTBEAT_INTERVAL 再发；
+        达到 HEARTBEAT_MAX_FAILURES 后间隔每次加倍（最长 HEARTBEAT_BACKOFF_MAX），减少对同串口其他设备的影响。
+        """
+        for device_key in list(shared.devices):
+            pending = self._heartbeats.get(device_key)
+            if pending is not None:
+                if not pending.done():
+                    continue
+                del self._heartbeats[device_key]
+                try:
+                    ok = bool(pending.result())
+                except Exception:
+                    ok = False
+                if ok:
+                    if self._heartbeat_failures.get(device_key, 0) >= self.HEARTBEAT_MAX_FAILURES:
+                        print(f"[SerialService] {device_key} 心跳恢复")
+                    self._heartbeat_failures[device_key] = 0
+                    self._heartbeat_next.pop(device_key, None)
+                    continue
+                failures = self._heartbeat_failures.get(device_key, 0) + 1
+                self._heartbeat_failures[device_key] = failures
+                self._heartbeat_next[device_key] = now + self._heartbeat_delay(failures)
+                if failures == self.HEARTBEAT_MAX_FAILURES:
+                    print(f"[SerialService] {device_key} 连续{failures}次心跳无响应（串口 {shared.name}）")
+                continue
+            if self._heartbeat_provider is None or now - shared.last_ok < self.HEARTBEAT_INTERVAL \
+                    or now < self._heartbeat_next.get(device_key, 0.0):
+                continue
+            future = self._heartbeat_provider(device_key)
+            if future is not None:
+                self._heartbeats[device_key] = future
+
+    def _heartbeat_delay(self, failures: int) -> float:
+        """连续失败 failures 次后距下次心跳的间隔（秒）"""
+        if failures < self.HEARTBEAT_MAX_FAILURES:
+            return self.HEARTBEAT_INTERVAL
+        return min(self.HEARTBEAT_INTERVAL * 2 ** (failures - self.HEARTBEAT_MAX_FAILURES + 1),
+                   self.HEARTBEAT_BACKOFF_MAX)
+
+    def get_port_health(self) -> dict:
+        """
+        获取各串口的监控状态
 
-        if response_parts:
-            # 合并所有接收到的数据并返回字节串
-            return b''.join(response_parts)
+        Returns:
+            dict: {port: {'online', 'devices', 'unresponsive', 'lastError', 'reconnectAttempts', 'retryIn'}}
+                  unresponsive 为连续 HEARTBEAT_MAX_FAILURES 次心跳无响应的设备
+        """
+        with self._lock:
+            ports = list(self._ports.values())
+        now = time.monotonic()
+        return {
+            shared.name: {
+                'online': shared.online.is_set(),
+                'devices': sorted(shared.devices),
+                'unresponsive': sorted(d for d in shared.devices
+                                       if self._heartbeat_failures.get(d, 0) >= self.HEARTBEAT_MAX_FAILURES),
+                'lastError': shared.last_error,
+                'reconnectAttempts': shared.reconnect_attempts,
+                'retryIn': 0.0 if shared.online.is_set() else round(max(shared.next_attempt - now, 0.0), 1),
+            }
+            for shared in ports
+        }
 
-        return b''
-    
     def is_connected(self, device_key: str) -> bool:
         """
         检查设备是否已连接
@@ -250,7 +661,7 @@ class SerialService:
     
     def connect_all(self, devices_config: List[Dict]) -> dict:
         """
-        批量连接所有设备
+        批量连接所有设备（不同串口并行打开，单个串口打开失败或超时不阻塞其他串口）
         
         Args:
             devices_config: 设备配置列表，每个元素包含:
@@ -267,31 +678,129 @@ class SerialService:
         Returns:
             dict: {device_key: {'success': bool, 'message': str}}
         """
-        result = {}
-        
+        # 按串口分组：不同串口并行打开，同一串口上的设备依次连接（后续设备共用已打开的串口）
+        groups: Dict[str, List[Dict]] = {}
         for device_config in devices_config:
-            device_key = device_config.get('key')
-            port = device_config.get('port')
-            baudrate = device_config.get('baudrate', 9600)
-            data_bits = device_config.get('dataBits', 8)
-            stop_bits = device_config.get('stopBits', 1)
-            parity = device_config.get('parity', 'None')
-            timeout = device_config.get('timeout', 1000)
-            
-            success, message = self.connect(
-                device_key=device_key,
-                port=port,
-                baudrate=baudrate,
-                data_bits=data_bits,
-                stop_bits=stop_bits,
-                parity=parity,
-                timeout=timeout
-            )
-            
-            result[device_key] = {'success': success, 'message': message}
-        
-        return result
-    
+            groups.setdefault(device_config.get('port'), []).append(device_config)
+
+        def connect_group(configs: List[Dict]) -> Dict[str, dict]:
+            group_result = {}
+            for device_config in configs:
+                success, message = self.connect(
+                    device_key=device_config.get('key'),
+                    port=device_config.get('port'),
+                    baudrate=device_config.get('baudrate', 9600),
+                    data_bits=device_config.get('dataBits', 8),
+                    stop_bits=device_config.get('stopBits', 1),
+                    parity=device_config.get('parity', 'None'),
+                    timeout=device_config.get('timeout', 1000)
+                )
+                group_result[device_config.get('key')] = {'success': success, 'message': message}
+            return group_result
+
+        result = {}
+        if not groups:
+            return result
+        with ThreadPoolExecutor(max_workers=len(groups), thread_name_prefix='serial-connect') as pool:
+            for group_result in pool.map(connect_group, groups.values()):
+                result.update(group_result)
+
+        # 保持与请求相同的设备顺序
+        return {c.get('key'): result[c.get('key')] for c in devices_config if c.get('key') in result}
+
+    # ===================== 串口自动识别 =====================
+    @staticmethod
+    def system_ports() -> List[str]:
+        """系统中所有串口号"""
+        return [info.device for info in serial.tools.list_ports.comports()]
+
+    def discover(self, probes: List[Dict], ports: List[str],
+                 timeout: Optional[float] = None) -> dict:
+        """
+        并行探测串口上的设备
+
+        每个串口一个线程：打开串口，依次按各设备的线路参数发送探测指令，响应通过验证即认为
+        该设备接在此串口上（同一串口可识别出多个共用的设备）。已由本服务打开的串口不再探测，
+        其上已连接的设备直接计入结果。探测指令会实际发给串口上的设备，只探测调用方明确给出的串口。
+
+        Args:
+            probes: 探测指令列表，每个元素包含:
+                {
+                    'device': str,          # 设备标识
+                    'settings': dict,       # 线路参数（见 line_settings）
+                    'command': bytes,       # 探测指令
+                    'framer': Framer,       # 响应帧判定器，可为 None
+                    'validate': callable,   # validate(response, complete) -> bool
+                }
+            ports: 待探测的串口号（系统中所有串口见 system_ports）
+            timeout: 每条探测指令的响应超时（秒），默认 PROBE_TIMEOUT
+
+        Returns:
+            dict: {'ports': [探测的串口], 'matches': {device: [port, ...]},
+                   'errors': {port: 错误信息}, 'elapsed_ms': float}
+        """
+        start = time.perf_counter()
+        timeout = self.PROBE_TIMEOUT if timeout is None else timeout
+        matches: Dict[str, List[str]] = {probe['device']: [] for probe in probes}
+        with self._lock:
+            busy = set(self._ports)
+            for device_key, port in self._device_ports.items():
+                if device_key in matches:
+                    matches[device_key].append(port)
+        candidates = [port for port in ports if port not in busy]
+
+        errors = {}
+        if candidates and probes:
+            with ThreadPoolExecutor(max_workers=len(candidates), thread_name_prefix='serial-probe') as pool:
+                futures = {pool.submit(self._probe_port, port, probes, timeout): port for port in candidates}
+                for future in as_completed(futures):
+                    port = futures[future]
+                    found, error = future.result()
+                    for device_key in found:
+                        matches[device_key].append(port)
+                    if error:
+                        errors[port] = error
+
+        return {
+            'ports': list(ports),
+            'matches': matches,
+            'errors': errors,
+            'elapsed_ms': round((time.perf_counter() - start) * 1000.0, 1),
+        }
+
+    @staticmethod
+    def _probe_port(port: str, probes: List[Dict], timeout: float) -> Tuple[List[str], str]:
+        """在一个串口上依次发送各设备的探测指令，返回 (识别出的设备, 错误信息)"""
+        # 按波特率排序，减少线路参数切换
+        ordered = sorted(probes, key=lambda p: p['settings']['baudrate'])
+        try:
+            ser = serial.Serial(port=port, timeout=timeout, **ordered[0]['settings'])
+        except Exception as e:
+            return [], str(e)
+
+        reader = _PortReader(ser, f"probe-{port}")
+        found = []
+        current = ordered[0]['settings']
+        try:
+            for probe in ordered:
+                if probe['settings'] != current:
+                    ser.apply_settings(probe['settings'])
+                    current = probe['settings']
+                ser.reset_input_buffer()
+                reader.clear()
+                ser.write(probe['command'])
+                response, _, complete = reader.read_frame(probe['command'], timeout, min(timeout, 0.05),
+                                                          probe.get('framer'))
+                if response and probe['validate'](response, complete):
+                    found.append(probe['device'])
+            return found, ''
+        except Exception as e:
+            return found, str(e)
+        finally:
+            reader.stop()
+            ser.close()
+            reader.join()
+
     def disconnect_all(self) -> dict:
         """
         断开所有连接的串口
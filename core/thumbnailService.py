@@ -0,0 +1,180 @@
+"""
+测试图片缩略图 - 保存测试记录后在后台按几种标准尺寸生成JPEG缩略图
+
+缩略图保存在 data/thumbs/<尺寸>/ 下，路径由原图路径映射而来
+（data/images/ab/cd/<哈希>.png → data/thumbs/512/images/ab/cd/<哈希>.png.jpg），
+可直接由原图路径算出，不需要额外的索引表。
+
+- 一次解码原图，按尺寸从大到小逐级缩小（金字塔），较小尺寸不必再从原图缩放
+- 16位图像（Mono10/12/16）按实际最大值线性拉伸到8位后显示，不改变原图
+- 请求的缩略图尚未生成（旧记录或后台队列未处理到）时在请求线程中同步生成
+- 原图被回收时由 DatabaseService.collect_images 一并删除各尺寸缩略图
+"""
+import collections
+import os
+import posixpath
+import threading
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+from core.databaseService import db_service
+
+# 缩略图长边像素：记录列表 / 详情弹窗 / PDF报告
+THUMB_SIZES = (128, 512, 1024)
+JPEG_QUALITY = 85
+# 可生成缩略图的原图：只接受图片库 data/images/ 下这些扩展名的文件
+SOURCE_DIR = 'data/images/'
+SOURCE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+
+
+def is_source_image(image_path: str) -> bool:
+    """image_path（相对路径）是否为图片库中的原图"""
+    normalized = posixpath.normpath(image_path.replace('\\', '/'))
+    return normalized == image_path and normalized.startswith(SOURCE_DIR) \
+        and normalized.lower().endswith(SOURCE_EXTENSIONS)
+
+
+def to_display(image: np.ndarray) -> np.ndarray:
+    """16位图像按最大值线性拉伸为8位，8位图像原样返回"""
+    if image.dtype == np.uint8:
+        return image
+    peak = float(image.max()) if image.size else 0.0
+    if peak <= 0:
+        return np.zeros(image.shape, dtype=np.uint8)
+    return cv2.convertScaleAbs(image, alpha=255.0 / peak)
+
+
+def render_thumbnails(image: np.ndarray, sizes=THUMB_SIZES) -> dict:
+    """
+    生成各尺寸缩略图（长边不超过尺寸，不放大）
+
+    Args:
+        image: 原图 (灰度或BGR，8位或16位)
+        sizes: 缩略图长边尺寸
+
+    Returns:
+        dict: {尺寸: JPEG数据}
+    """
+    current = to_display(image)
+    result = {}
+    for size in sorted(sizes, reverse=True):
+        height, width = current.shape[:2]
+        scale = size / max(height, width)
+        if scale < 1.0:
+            current = cv2.resize(current, (max(1, round(width * scale)), max(1, round(height * scale))),
+                                 interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode('.jpg', current, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        if ok:
+            result[size] = buf.tobytes()
+    return result
+
+
+class ThumbnailService:
+    """
+    缩略图服务
+
+    submit() 可在任意线程调用，只做入队；缩略图由后台线程生成。
+    """
+
+    def __init__(self):
+        self._pending = collections.deque()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()           # 串行生成，避免同一张图重复生成
+        self._thread_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.generated = 0      # 已生成的原图数量
+        self.failed = 0         # 生成失败的原图数量
+
+    @staticmethod
+    def snap_size(size: int) -> int:
+        """取不小于请求尺寸的最小标准尺寸"""
+        for standard in THUMB_SIZES:
+            if size <= standard:
+                return standard
+        return THUMB_SIZES[-1]
+
+    def submit(self, *image_paths: Optional[str]):
+        """提交需要生成缩略图的原图路径（相对路径，空值忽略）"""
+        paths = [p for p in image_paths if p]
+        if not paths:
+            return
+        self._pending.extend(paths)
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='thumbnails', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(5.0)
+            self._wake.clear()
+            while self._pending:
+                self.generate(self._pending.popleft())
+
+    def _missing_sizes(self, image_path: str) -> List[int]:
+        return [size for size in THUMB_SIZES
+                if not os.path.isfile(os.path.join(db_service.base_dir, db_service.thumbnail_path(image_path, size)))]
+
+    def generate(self, image_path: str, sizes=None) -> bool:
+        """
+        生成一张原图缺失的缩略图（已存在的尺寸跳过）
+
+        Args:
+            image_path: 原图相对路径
+            sizes: 需要的尺寸，None 表示全部标准尺寸
+
+        Returns:
+            bool: 缩略图均已存在或生成成功返回True
+        """
+        with self._lock:
+            # 逐级缩小时中间尺寸也会算出，因此一次补齐全部缺失尺寸
+            missing = self._missing_sizes(image_path)
+            if not missing or (sizes is not None and not set(missing) & set(sizes)):
+                return True
+
+            source = os.path.join(db_service.base_dir, image_path)
+            image = cv2.imread(source, cv2.IMREAD_UNCHANGED) if os.path.isfile(source) else None
+            if image is None:
+                self.failed += 1
+                return False
+            if image.ndim == 3 and image.shape[2] == 4:
+                image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+
+            for size, data in render_thumbnails(image, missing).items():
+                target = os.path.join(db_service.base_dir, db_service.thumbnail_path(image_path, size))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                tmp_path = target + '.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, target)
+            self.generated += 1
+            return True
+
+    def get(self, image_path: str, size: int) -> Optional[str]:
+        """
+        获取缩略图相对路径，尚未生成时同步生成
+
+        Returns:
+            str: 缩略图相对路径；不是图片库中的原图、原图不存在或无法解码时返回None
+        """
+        if not is_source_image(image_path):
+            return None
+        size = self.snap_size(size)
+        if not self.generate(image_path, (size,)):
+            return None
+        return db_service.thumbnail_path(image_path, size)
+
+    def get_status(self) -> dict:
+        return {
+            'sizes': list(THUMB_SIZES),
+            'pending': len(self._pending),
+            'generated': self.generated,
+            'failed': self.failed,
+        }
+
+
+# 全局缩略图服务实例
+thumbnail_service = ThumbnailService()
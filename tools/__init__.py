@@ -0,0 +1 @@
+# 开发工具包（基准测试等）
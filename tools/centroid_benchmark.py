@@ -0,0 +1,269 @@
+"""
+质心提取流水线基准测试
+
+在不同分辨率、中值滤波核、显示模式和光斑尺寸组合下，分别运行
+CameraService.centroidExtract、SDICameraService.centroidExtract 和
+VirtualCameraService.uploadImage，统计各阶段耗时与帧率。
+
+结果保存为JSON，可与已保存的基准结果对比，超过容差即视为性能回退（退出码1）。
+
+用法 (在项目根目录执行):
+    python -m tools.centroid_benchmark
+    python -m tools.centroid_benchmark --kernels 0,5,31 --resolutions 640x480,5472x3648
+    python -m tools.centroid_benchmark --save-baseline data/benchmarks/centroid_baseline.json
+    python -m tools.centroid_benchmark --baseline data/benchmarks/centroid_baseline.json --tolerance 0.15
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from core.imagePipeline import STAGES
+from core.cameraService import CameraService, VirtualCameraService
+from core.sdiService import SDICameraService
+
+DEFAULT_RESOLUTIONS = '640x480,1280x1024,1920x1080,2448x2048,5472x3648'
+DEFAULT_KERNELS = '0,3,5,9,15,31'
+DEFAULT_SPOTS = '5,20,80'
+ALL_KERNELS = ','.join(['0'] + [str(k) for k in range(3, 32, 2)])
+SERVICES = ('camera', 'sdi', 'virtual')
+MODES = ('original', 'binary')
+
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                  'data', 'benchmarks')
+
+
+def make_spot_image(width: int, height: int, spot_sigma: float, seed: int = 0) -> np.ndarray:
+    """生成带噪声背景的高斯光斑灰度图 (Mono8)"""
+    rng = np.random.default_rng(seed)
+    image = rng.normal(12.0, 4.0, (height, width)).astype(np.float32)
+    # 光斑中心偏离图像中心，避免对称性掩盖质心误差
+    cx, cy = width * 0.55, height * 0.45
+    x = np.arange(width, dtype=np.float32) - cx
+    y = np.arange(height, dtype=np.float32) - cy
+    spot = np.exp(-(y[:, None] ** 2) / (2 * spot_sigma ** 2)) * np.exp(-(x[None, :] ** 2) / (2 * spot_sigma ** 2))
+    image += 230.0 * spot
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def _parse_list(text: str, cast=int) -> list:
+    return [cast(item) for item in text.split(',') if item.strip()]
+
+
+def _parse_resolutions(text: str) -> List[tuple]:
+    resolutions = []
+    for item in text.split(','):
+        w, h = item.lower().split('x')
+        resolutions.append((int(w), int(h)))
+    return resolutions
+
+
+def _make_service(name: str, kernel: int, binary: bool, threshold: int):
+    """按名称创建相机服务并设置处理参数（不连接任何硬件）"""
+    if name == 'camera':
+        cam = CameraService(0)
+        cam.setReturnBinaryMode(binary)
+    elif name == 'sdi':
+        cam = SDICameraService(camera_id=3)
+        cam.setImageMode(1 if binary else 0)
+    else:
+        cam = VirtualCameraService(camera_id=4)
+        cam.return_binary_image = binary
+    cam.threshold = threshold
+    cam.median_kernel_size = kernel
+    return cam
+
+
+def _run_once(name: str, cam, gray: np.ndarray, rgb: np.ndarray, png: bytes,
+              timings: Dict[str, float]) -> bool:
+    if name == 'camera':
+        return cam.centroidExtract(gray, 1, timings=timings) is not None
+    if name == 'sdi':
+        return cam.centroidExtract(gray, rgb, 1, timings=timings) is not None
+    return cam.uploadImage(png, 'benchmark.png', timings=timings).get('success', False)
+
+
+def run_case(name: str, gray: np.ndarray, rgb: np.ndarray, png: bytes, kernel: int,
+             binary: bool, threshold: int, repeat: int, warmup: int) -> Optional[dict]:
+    """运行单个组合，返回各阶段中位数耗时(ms)、总耗时和帧率"""
+    cam = _make_service(name, kernel, binary, threshold)
+
+    for _ in range(warmup):
+        _run_once(name, cam, gray, rgb, png, {})
+
+    stage_samples: Dict[str, List[float]] = {}
+    totals: List[float] = []
+    for _ in range(repeat):
+        timings: Dict[str, float] = {}
+        start = time.perf_counter()
+        ok = _run_once(name, cam, gray, rgb, png, timings)
+        totals.append(time.perf_counter() - start)
+        if not ok:
+            return None
+        for stage, value in timings.items():
+            stage_samples.setdefault(stage, []).append(value)
+
+    total = statistics.median(totals)
+    stages = {stage: round(statistics.median(stage_samples[stage]) * 1000.0, 4)
+              for stage in STAGES if stage in stage_samples}
+    return {
+        'stages_ms': stages,
+        'total_ms': round(total * 1000.0, 4),
+        'fps': round(1.0 / total, 2) if total > 0 else 0.0,
+    }
+
+
+def run_benchmark(resolutions, kernels, spots, services, modes, threshold: int = 128,
+                  repeat: int = 5, warmup: int = 1, verbose: bool = True) -> dict:
+    """运行完整矩阵，返回可直接保存为JSON的结果字典"""
+    results = []
+    for width, height in resolutions:
+        for spot in spots:
+            gray = make_spot_image(width, height, spot)
+            rgb = cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB)
+            ok, png_buf = cv2.imencode('.png', gray)
+            png = png_buf.tobytes() if ok else b''
+            for kernel in kernels:
+                for mode in modes:
+                    for name in services:
+                        case = run_case(name, gray, rgb, png, kernel, mode == 'binary',
+                                        threshold, repeat, warmup)
+                        if case is None:
+                            print(f"[Benchmark] {name} {width}x{height} k={kernel} {mode} spot={spot}: 处理失败")
+                            continue
+                        case.update({
+                            'service': name,
+                            'width': width,
+                            'height': height,
+                            'kernel': kernel,
+                            'mode': mode,
+                            'spot': spot,
+                        })
+                        results.append(case)
+                        if verbose:
+                            print(_format_case(case))
+
+    return {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'threshold': threshold,
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def _case_key(case: dict) -> tuple:
+    return (case['service'], case['width'], case['height'], case['kernel'], case['mode'], case['spot'])
+
+
+def _format_case(case: dict) -> str:
+    stages = ' '.join(f"{k}={v:.2f}" for k, v in case['stages_ms'].items())
+    return (f"{case['service']:<8}{case['width']:>5}x{case['height']:<5} k={case['kernel']:<3}"
+            f"{case['mode']:<9} spot={case['spot']:<4} total={case['total_ms']:>9.2f}ms "
+            f"fps={case['fps']:>8.2f} | {stages}")
+
+
+def compare_with_baseline(current: dict, baseline: dict, tolerance: float) -> List[dict]:
+    """
+    与基准结果逐项对比
+
+    Returns:
+        list: 总耗时超过 (1 + tolerance) 倍基准值的组合
+    """
+    baseline_cases = {_case_key(c): c for c in baseline.get('results', [])}
+    regressions = []
+    for case in current.get('results', []):
+        base = baseline_cases.get(_case_key(case))
+        if not base or base['total_ms'] <= 0:
+            continue
+        ratio = case['total_ms'] / base['total_ms']
+        if ratio > 1.0 + tolerance:
+            slow_stages = {
+                stage: round(value / base['stages_ms'][stage], 2)
+                for stage, value in case['stages_ms'].items()
+                if base['stages_ms'].get(stage, 0) > 0 and value / base['stages_ms'][stage] > 1.0 + tolerance
+            }
+            regressions.append({
+                'case': dict(zip(('service', 'width', 'height', 'kernel', 'mode', 'spot'), _case_key(case))),
+                'baseline_ms': base['total_ms'],
+                'current_ms': case['total_ms'],
+                'ratio': round(ratio, 3),
+                'slow_stages': slow_stages,
+            })
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='质心提取流水线基准测试')
+    parser.add_argument('--resolutions', default=DEFAULT_RESOLUTIONS, help='分辨率列表，如 640x480,1920x1080')
+    parser.add_argument('--kernels', default=DEFAULT_KERNELS, help='中值滤波核列表 (0表示不滤波)')
+    parser.add_argument('--all-kernels', action='store_true', help='测试 0 及 3-31 全部奇数核')
+    parser.add_argument('--spots', default=DEFAULT_SPOTS, help='光斑高斯半径(像素)列表')
+    parser.add_argument('--services', default=','.join(SERVICES), help='camera,sdi,virtual')
+    parser.add_argument('--modes', default=','.join(MODES), help='original,binary')
+    parser.add_argument('--threshold', type=int, default=128)
+    parser.add_argument('--repeat', type=int, default=5, help='每个组合的计时次数（取中位数）')
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--output', help='结果JSON路径 (默认 data/benchmarks/centroid_<时间>.json)')
+    parser.add_argument('--baseline', help='与指定基准结果对比')
+    parser.add_argument('--save-baseline', help='将本次结果另存为基准')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='允许的相对变慢比例 (默认0.15)')
+    args = parser.parse_args(argv)
+
+    kernels = _parse_list(ALL_KERNELS if args.all_kernels else args.kernels)
+    result = run_benchmark(
+        resolutions=_parse_resolutions(args.resolutions),
+        kernels=kernels,
+        spots=_parse_list(args.spots, float),
+        services=[s for s in _parse_list(args.services, str) if s in SERVICES],
+        modes=[m for m in _parse_list(args.modes, str) if m in MODES],
+        threshold=args.threshold,
+        repeat=max(1, args.repeat),
+        warmup=max(0, args.warmup),
+    )
+
+    output = args.output or os.path.join(
+        DEFAULT_OUTPUT_DIR, f"centroid_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {output}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"基准已保存: {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(result, baseline, args.tolerance)
+        if regressions:
+            print(f"检测到 {len(regressions)} 项性能回退 (容差 {args.tolerance:.0%}):")
+            for r in regressions:
+                c = r['case']
+                print(f"  {c['service']} {c['width']}x{c['height']} k={c['kernel']} {c['mode']} spot={c['spot']}: "
+                      f"{r['baseline_ms']:.2f}ms -> {r['current_ms']:.2f}ms (x{r['ratio']}) {r['slow_stages']}")
+            return 1
+        print("与基准对比: 无性能回退")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""
+数据库并发读写基准测试
+
+在临时数据库中预置测试记录和串口日志，然后同时运行若干写线程（save_optical_test，
+每条一个事务）和读线程（测试记录页、串口日志页的分页查询及单条查询），统计写入速度
+和查询延迟。分别以两种配置运行以便对比:
+
+    legacy  每次调用打开新连接，默认回滚日志模式（连接池引入前的行为）
+    pooled  连接池 + WAL + DatabaseService.PRAGMAS
+
+用法 (在项目根目录执行):
+    python -m tools.db_benchmark
+    python -m tools.db_benchmark --writers 2 --readers 8 --seconds 10
+    python -m tools.db_benchmark --modes pooled --seed-tests 20000 --json result.json
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+from core.databaseService import DatabaseService, db_service
+
+MODES = ('legacy', 'pooled')
+
+
+def _sample_test(i: int) -> Dict:
+    return {
+        'operator': f'op{i % 5}',
+        'base_camera_id': 1, 'base_camera_name': 'cam1', 'base_image_path': f'data/images/base_{i}.png',
+        'base_width': 2448, 'base_height': 2048, 'base_centroid_x': 1224.5 + i % 7, 'base_centroid_y': 1024.25,
+        'base_focal_length': 50.0, 'base_pixel_size': 3.45, 'base_offset_x': 0.1, 'base_offset_y': -0.2,
+        'test_camera_id': 2, 'test_camera_name': 'cam2', 'test_image_path': f'data/images/test_{i}.png',
+        'test_width': 2448, 'test_height': 2048, 'test_centroid_x': 1220.0, 'test_centroid_y': 1030.0 - i % 3,
+        'test_focal_length': 50.0, 'test_pixel_size': 3.45, 'test_offset_x': 0.3, 'test_offset_y': 0.4,
+        'remark': 'benchmark',
+    }
+
+
+def _seed(seed_tests: int, seed_logs: int):
+    with db_service._connection() as conn:
+        rows = [tuple(_sample_test(i).values()) for i in range(seed_tests)]
+        columns = ', '.join(_sample_test(0).keys())
+        marks = ', '.join('?' * len(_sample_test(0)))
+        conn.executemany(f'INSERT INTO optical_axis_tests ({columns}) VALUES ({marks})', rows)
+        devices = ('light_source', 'three_axis_motor', 'delay_module')
+        conn.executemany('''
+            INSERT INTO serial_logs (device, port, command, params, cmd_bytes, response_bytes, success, message)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(devices[i % 3], 'COM1', 'cmd', None, '5aac0a00b6', 'aabbccdd02', 1, 'ok')
+              for i in range(seed_logs)])
+        conn.commit()
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return round(values[min(len(values) - 1, int(len(values) * q))], 3) if values else None
+
+
+def run_mode(mode: str, writers: int, readers: int, seconds: float,
+             seed_tests: int, seed_logs: int) -> Dict:
+    """以指定配置运行一轮并发读写，返回统计"""
+    saved = (db_service.db_path, DatabaseService.POOL_SIZE, DatabaseService.PRAGMAS)
+    tmp_dir = tempfile.mkdtemp(prefix='db_bench_')
+    try:
+        if mode == 'legacy':
+            DatabaseService.POOL_SIZE = 0
+            DatabaseService.PRAGMAS = {}
+        db_service.db_path = os.path.join(tmp_dir, 'bench.db')
+        db_service._init_database()
+        _seed(seed_tests, seed_logs)
+
+        stop = threading.Event()
+        inserts = [0] * writers
+        read_latencies: List[List[float]] = [[] for _ in range(readers)]
+        errors: List[str] = []
+
+        def writer(index: int):
+            i = 0
+            while not stop.is_set():
+                try:
+                    db_service.save_optical_test(_sample_test(i))
+                    inserts[index] += 1
+                except Exception as e:
+                    errors.append(f'write: {e}')
+                i += 1
+
+        def reader(index: int):
+            latencies = read_latencies[index]
+            i = 0
+            while not stop.is_set():
+                t = time.perf_counter()
+                try:
+                    if i % 3 == 0:
+                        db_service.get_optical_tests(limit=50, offset=(i * 50) % max(seed_tests, 1))
+                    elif i % 3 == 1:
+                        db_service.get_serial_logs(device='delay_module', limit=100)
+                    else:
+                        db_service.get_optical_test(1 + i % max(seed_tests, 1))
+                    latencies.append((time.perf_counter() - t) * 1000.0)
+                except Exception as e:
+                    errors.append(f'read: {e}')
+                i += 1
+
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+        threads += [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        time.sleep(seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(v for values in read_latencies for v in values)
+        return {
+            'mode': mode,
+            'writers': writers,
+            'readers': readers,
+            'seconds': round(elapsed, 2),
+            'inserts_per_second': round(sum(inserts) / elapsed, 1),
+            'reads_per_second': round(len(latencies) / elapsed, 1),
+            'read_p50_ms': round(statistics.median(latencies), 3) if latencies else None,
+            'read_p95_ms': _percentile(latencies, 0.95),
+            'read_p99_ms': _percentile(latencies, 0.99),
+            'read_max_ms': round(latencies[-1], 3) if latencies else None,
+            'errors': len(errors),
+            'first_error': errors[0] if errors else None,
+        }
+    finally:
+        db_service.close()
+        db_service.db_path, DatabaseService.POOL_SIZE, DatabaseService.PRAGMAS = saved
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='数据库并发读写基准测试')
+    parser.add_argument('--modes', default=','.join(MODES), help=f'逗号分隔，可选 {",".join(MODES)}')
+    parser.add_argument('--writers', type=int, default=2, help='写线程数')
+    parser.add_argument('--readers', type=int, default=4, help='读线程数')
+    parser.add_argument('--seconds', type=float, default=5.0, help='每种配置的运行时长')
+    parser.add_argument('--seed-tests', type=int, default=5000, help='预置测试记录条数')
+    parser.add_argument('--seed-logs', type=int, default=1000, help='预置串口日志条数')
+    parser.add_argument('--json', help='结果另存为JSON文件')
+    args = parser.parse_args(argv)
+
+    modes = [m.strip() for m in args.modes.split(',') if m.strip()]
+    for mode in modes:
+        if mode not in MODES:
+            parser.error(f'未知配置: {mode}')
+
+    results = []
+    for mode in modes:
+        result = run_mode(mode, args.writers, args.readers, args.seconds, args.seed_tests, args.seed_logs)
+        results.append(result)
+        print(f"{mode:<8} 写入 {result['inserts_per_second']:>8.1f}/s  查询 {result['reads_per_second']:>8.1f}/s  "
+              f"p50 {result['read_p50_ms']}ms  p95 {result['read_p95_ms']}ms  p99 {result['read_p99_ms']}ms  "
+              f"max {result['read_max_ms']}ms  错误 {result['errors']}")
+        if result['first_error']:
+            print(f"         首个错误: {result['first_error']}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+串口抓包回放 (回放需要Linux伪终端)
+
+读取 SerialService 抓包文件(*.scap)，通过伪终端(pty)把设备当时返回的字节重新发出，
+用于在没有硬件的情况下复现时序问题。程序打印pty设备路径，将 serialConfig.json 中
+对应设备的串口改为该路径（或直接用 SerialService 连接）即可。
+
+两种回放方式:
+    时间线回放(默认)  按记录的时间间隔发送接收方向(RX)的数据，忽略对端发来的内容
+    应答回放 --respond 模拟设备：等对端发出与抓包中相同长度的指令(TX)后，
+                       按抓包中指令到响应的延迟发出随后的响应，并比较指令内容是否一致
+
+--speed 为加速倍数（2 表示两倍速），0 表示不等待。
+
+用法 (在项目根目录执行):
+    python -m tools.serial_replay data/recordings/serial_20250101_120000.scap --list
+    python -m tools.serial_replay capture.scap --device delay_module --speed 10
+    python -m tools.serial_replay capture.scap --device three_axis_motor --respond
+"""
+import argparse
+import os
+import select
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from core.serialCapture import SerialCaptureReader, DIRECTION_RX, DIRECTION_TX
+
+_DIRECTION_NAMES = {DIRECTION_TX: 'TX', DIRECTION_RX: 'RX'}
+
+
+def load_records(path: str, device: Optional[str] = None, port: Optional[str] = None) -> List[Dict]:
+    """读取抓包记录，可按设备、串口筛选"""
+    return [r for r in SerialCaptureReader(path)
+            if (device is None or r['device'] == device) and (port is None or r['port'] == port)]
+
+
+def format_record(record: Dict, t0_ns: int) -> str:
+    """一条记录的文本形式：相对时间、方向、设备、串口、十六进制和可打印字符"""
+    data = record['data']
+    text = ''.join(chr(b) if 32 <= b < 127 else '.' for b in data)
+    return (f"{(record['mono_ns'] - t0_ns) / 1e6:>12.3f}ms  {_DIRECTION_NAMES.get(record['direction'], '?')}  "
+            f"{record['device']:<18}{record['port']:<14}{data.hex(' '):<48} |{text}|")
+
+
+def _wait(seconds: float):
+    if seconds > 0:
+        time.sleep(seconds)
+
+
+def replay_timeline(records: List[Dict], fd: int, speed: float = 1.0) -> dict:
+    """按记录的时间线把 RX 数据写入 fd，返回统计"""
+    rx = [r for r in records if r['direction'] == DIRECTION_RX]
+    start = time.monotonic()
+    sent = 0
+    if rx:
+        t0 = rx[0]['mono_ns']
+        for record in rx:
+            if speed > 0:
+                _wait(start + (record['mono_ns'] - t0) / 1e9 / speed - time.monotonic())
+            os.write(fd, record['data'])
+            sent += len(record['data'])
+            # 丢弃对端发来的数据，避免pty缓冲区写满
+            while select.select([fd], [], [], 0)[0]:
+                if not os.read(fd, 4096):
+                    break
+    return {'records': len(rx), 'bytes': sent, 'elapsed': round(time.monotonic() - start, 3)}
+
+
+def replay_respond(records: List[Dict], fd: int, speed: float = 1.0, timeout: float = 10.0) -> dict:
+    """
+    应答回放：每条 TX 记录等待对端发出相同长度的数据，再按原延迟发出其后的 RX 记录
+
+    Returns:
+        dict: {'commands', 'mismatches', 'timeouts', 'responses', 'elapsed'}
+    """
+    stats = {'commands': 0, 'mismatches': 0, 'timeouts': 0, 'responses': 0}
+    start = time.monotonic()
+    buffer = bytearray()
+    tx_time_ns = None       # 抓包中最近一条指令的时间
+    tx_received = 0.0       # 对端实际发出该指令的时间
+    for record in records:
+        if record['direction'] == DIRECTION_TX:
+            expected = record['data']
+            deadline = time.monotonic() + timeout
+            while len(buffer) < len(expected):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                    break
+                buffer += os.read(fd, 4096)
+            if len(buffer) < len(expected):
+                stats['timeouts'] += 1
+                print(f"等待指令超时: 期望 {expected.hex(' ')}，已收到 {bytes(buffer).hex(' ')}")
+                buffer.clear()
+                tx_time_ns = None
+                continue
+            actual = bytes(buffer[:len(expected)])
+            del buffer[:len(expected)]
+            stats['commands'] += 1
+            if actual != expected:
+                stats['mismatches'] += 1
+                print(f"指令不一致: 期望 {expected.hex(' ')}，实际 {actual.hex(' ')}")
+            tx_time_ns = record['mono_ns']
+            tx_received = time.monotonic()
+        else:
+            if tx_time_ns is not None and speed > 0:
+                _wait(tx_received + (record['mono_ns'] - tx_time_ns) / 1e9 / speed - time.monotonic())
+            os.write(fd, record['data'])
+            stats['responses'] += 1
+    stats['elapsed'] = round(time.monotonic() - start, 3)
+    return stats
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='串口抓包回放')
+    parser.add_argument('capture', help='抓包文件(*.scap)')
+    parser.add_argument('--device', help='只回放该设备的记录')
+    parser.add_argument('--port', help='只回放该串口的记录')
+    parser.add_argument('--list', action='store_true', help='列出记录后退出')
+    parser.add_argument('--speed', type=float, default=1.0, help='回放倍速，0表示不等待')
+    parser.add_argument('--respond', action='store_true', help='应答回放：收到指令后再发出响应')
+    parser.add_argument('--timeout', type=float, default=10.0, help='应答回放等待每条指令的超时(秒)')
+    args = parser.parse_args(argv)
+
+    reader = SerialCaptureReader(args.capture)
+    records = load_records(args.capture, args.device, args.port)
+    info = reader.get_info()
+    print(f"{args.capture}: {len(records)}/{info['records']} 条记录，时长 {info['duration']:.3f}s，"
+          f"开始于 {datetime.fromtimestamp(info['startedAt']).isoformat(sep=' ', timespec='seconds')}")
+
+    if args.list:
+        t0 = records[0]['mono_ns'] if records else 0
+        for record in records:
+            print(format_record(record, t0))
+        return 0
+
+    if not sys.platform.startswith('linux'):
+        print("回放依赖Linux伪终端(pty)")
+        return 1
+    if not records:
+        print("没有可回放的记录")
+        return 1
+
+    import tty
+    master_fd, slave_fd = os.openpty()
+    tty.setraw(slave_fd)
+    print(f"回放端口: {os.ttyname(slave_fd)}")
+    try:
+        if args.respond:
+            stats = replay_respond(records, master_fd, args.speed, args.timeout)
+        else:
+            input("连接回放端口后按回车开始...")
+            stats = replay_timeline(records, master_fd, args.speed)
+        print(f"回放完成: {stats}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        os.close(master_fd)
+        os.close(slave_fd)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,393 @@
+"""
+串口设备模拟器 (仅Linux)
+
+用伪终端(pty)模拟光源、三轴电机和延时模块，按 commandConfig.json 中的指令格式
+和 CommandService 的解码规则应答，无需连接硬件即可测试 SerialService / CommandService
+的完整收发流程和性能。
+
+- 光源: 功率设置 *NNNN@ / *NNNN! 原样回显；黑体温度 *XXXXXX# 返回 *XXXXXXHYYYYYY#，
+  当前温度按一阶惯性环节向设定值收敛（温度单位0.001°C）
+- 三轴电机: /1...R\\r 运动指令立即返回忙状态，按各轴速度计算运动耗时；
+  /1Q\\r 查询状态 (` 空闲 / @ 忙)，/1?0\\r 查询当前轴位置
+- 延时模块: 5字节指令 5a XX XX XX 校验和，返回 aa bb cc dd 0x；校验和错误不应答
+
+用法 (在项目根目录执行):
+    python -m tools.serial_simulator                    # 每个设备一个pty，打印设备路径
+    python -m tools.serial_simulator --shared           # 三个设备共用一个pty（与COM1接线一致）
+    python -m tools.serial_simulator --write-config /tmp/serialConfig.json
+    python -m tools.serial_simulator --bench 500        # 端到端延迟和吞吐量测试
+"""
+import argparse
+import heapq
+import json
+import math
+import os
+import re
+import select
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tty
+from typing import Dict, List, Optional, Tuple
+
+SIM_DEVICES = ('light_source', 'three_axis_motor', 'delay_module')
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config')
+
+
+class LightSourceSim:
+    """光源控制器模拟"""
+
+    TERMINATORS = b'@!#'
+
+    def __init__(self, response_delay: float = 0.005, ambient: int = 25000, tau: float = 30.0):
+        self.response_delay = response_delay
+        self.tau = tau                      # 黑体温度时间常数（秒）
+        self._temp_start = float(ambient)   # 设定时刻的温度
+        self._temp_target = float(ambient)
+        self._temp_set_at = time.monotonic()
+
+    def temperature(self, now: float) -> float:
+        """当前黑体温度（0.001°C），一阶惯性收敛"""
+        if self.tau <= 0:
+            return self._temp_target
+        k = math.exp(-(now - self._temp_set_at) / self.tau)
+        return self._temp_target + (self._temp_start - self._temp_target) * k
+
+    def frame_length(self, buffer: bytearray) -> Optional[int]:
+        for i, b in enumerate(buffer):
+            if b in self.TERMINATORS:
+                return i + 1
+        return None
+
+    def handle(self, frame: bytes, now: float) -> Optional[bytes]:
+        if frame.endswith(b'#'):
+            try:
+                target = int(frame[1:-1])
+            except ValueError:
+                return None
+            self._temp_start = self.temperature(now)
+            self._temp_target = float(target)
+            self._temp_set_at = now
+            current = int(round(self._temp_start))
+            sign = 'H' if current >= 0 else 'L'
+            return f"*{target:06d}{sign}{abs(current):06d}#".encode('ascii')
+        return frame
+
+
+class MotorSim:
+    """三轴电机控制器模拟（EZ协议风格应答）"""
+
+    _TOKEN = re.compile(rb'(aM|\?|[A-Za-z])(-?\d*)')
+
+    def __init__(self, response_delay: float = 0.002, speed: float = 20000.0):
+        self.response_delay = response_delay
+        self.speed = speed                           # 步/秒
+        self.positions = {1: 0, 2: 0, 3: 0}
+        self.busy_until = 0.0
+
+    def frame_length(self, buffer: bytearray) -> Optional[int]:
+        index = buffer.find(b'\r')
+        return index + 1 if index >= 0 else None
+
+    @staticmethod
+    def _reply(status: str, data: str = '') -> bytes:
+        return f"/0{status}{data}\x03\r\n".encode('ascii')
+
+    def handle(self, frame: bytes, now: float) -> Optional[bytes]:
+        # '/' 为指令起始符，之前的杂散字节（如其他设备的探测指令）丢弃
+        start = frame.rfind(b'/1')
+        if start < 0:
+            return None
+        body = frame[start:].strip()
+        busy = now < self.busy_until
+        body = body[2:]
+        if body == b'Q':
+            return self._reply('@' if busy else '`')
+
+        axis = 1
+        duration = 0.0
+        for name, value in self._TOKEN.findall(body):
+            n = int(value) if value not in (b'', b'-') else 0
+            if name == b'aM':
+                axis = n if n in self.positions else 1
+            elif name == b'?':
+                return self._reply('@' if busy else '`', str(self.positions[axis]))
+            elif name in (b'A', b'B', b'Z'):
+                # 绝对定位 / 回零
+                target = 0 if name == b'Z' else n
+                duration += abs(target - self.positions[axis]) / self.speed
+                self.positions[axis] = target
+            elif name in (b'C', b'P'):
+                duration += abs(n) / self.speed
+                self.positions[axis] += n
+            elif name in (b'E', b'D'):
+                duration += abs(n) / self.speed
+                self.positions[axis] -= n
+            # W(等待) 和 R(执行) 不改变状态：模拟中各段运动依次执行
+
+        if duration > 0:
+            self.busy_until = max(now, self.busy_until) + duration
+        return self._reply('@' if now < self.busy_until else '`')
+
+
+class DelayModuleSim:
+    """延时模块模拟"""
+
+    REPLY_CODES = {(0xAD, 0x01): 0x01, (0xAD, 0x00): 0x00, 0xAC: 0x02, 0xAB: 0x03}
+
+    def __init__(self, response_delay: float = 0.001):
+        self.response_delay = response_delay
+        self.is_open = False
+        self.delay_ns = 0
+
+    def frame_length(self, buffer: bytearray) -> Optional[int]:
+        return 5 if len(buffer) >= 5 else None
+
+    def handle(self, frame: bytes, now: float) -> Optional[bytes]:
+        if frame[0] != 0x5A or sum(frame[1:4]) % 256 != frame[4]:
+            return None
+        op = frame[1]
+        if op == 0xAD:
+            self.is_open = frame[2] == 0x01
+            code = self.REPLY_CODES.get((op, frame[2]))
+        elif op == 0xAB:
+            self.delay_ns = ((frame[2] << 8) | frame[3]) * 20
+            code = self.REPLY_CODES[op]
+        elif op == 0xAC:
+            self.delay_ns += 4
+            code = self.REPLY_CODES[op]
+        else:
+            code = None
+        return bytes([0xAA, 0xBB, 0xCC, 0xDD, code]) if code is not None else None
+
+
+class PtySimulator:
+    """
+    一个伪终端端口上的模拟器，可挂载一个或多个设备
+
+    多个设备共用时按帧首字节分发：0x5a → 延时模块，'/' → 三轴电机，'*' → 光源。
+    """
+
+    _LEADING_BYTES = {'delay_module': 0x5A, 'three_axis_motor': ord('/'), 'light_source': ord('*')}
+
+    def __init__(self, devices: Dict[str, object]):
+        self.devices = devices
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        self.port = os.ttyname(self.slave_fd)
+        self.frames_in = 0
+        self.frames_out = 0
+        self._buffer = bytearray()
+        self._pending: List[Tuple[float, int, bytes]] = []
+        self._seq = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"sim-{self.port}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+    def _device_for(self, first: int):
+        if len(self.devices) == 1:
+            return next(iter(self.devices.values()))
+        for key, leading in self._LEADING_BYTES.items():
+            if first == leading and key in self.devices:
+                return self.devices[key]
+        return None
+
+    def _parse(self, now: float):
+        while self._buffer:
+            device = self._device_for(self._buffer[0])
+            if device is None:
+                del self._buffer[0]  # 无法识别的字节
+                continue
+            length = device.frame_length(self._buffer)
+            if length is None:
+                return
+            frame = bytes(self._buffer[:length])
+            del self._buffer[:length]
+            self.frames_in += 1
+            reply = device.handle(frame, now)
+            if reply:
+                self._seq += 1
+                heapq.heappush(self._pending, (now + device.response_delay, self._seq, reply))
+
+    def _run(self):
+        while not self._stop.is_set():
+            now = time.monotonic()
+            while self._pending and self._pending[0][0] <= now:
+                _, _, reply = heapq.heappop(self._pending)
+                os.write(self.master_fd, reply)
+                self.frames_out += 1
+            wait = min(0.1, self._pending[0][0] - now) if self._pending else 0.1
+            readable, _, _ = select.select([self.master_fd], [], [], max(0.0, wait))
+            if readable:
+                try:
+                    data = os.read(self.master_fd, 4096)
+                except OSError:
+                    return
+                self._buffer += data
+                self._parse(time.monotonic())
+
+
+def create_simulators(shared: bool = False, light_delay: float = 0.005, motor_delay: float = 0.002,
+                      delay_module_delay: float = 0.001, motor_speed: float = 20000.0,
+                      blackbody_tau: float = 30.0) -> Tuple[List[PtySimulator], Dict[str, str]]:
+    """
+    创建并启动模拟器
+
+    Returns:
+        (模拟器列表, {device_key: pty路径})
+    """
+    devices = {
+        'light_source': LightSourceSim(light_delay, tau=blackbody_tau),
+        'three_axis_motor': MotorSim(motor_delay, speed=motor_speed),
+        'delay_module': DelayModuleSim(delay_module_delay),
+    }
+    if shared:
+        sim = PtySimulator(devices).start()
+        return [sim], {key: sim.port for key in devices}
+    sims = {key: PtySimulator({key: device}).start() for key, device in devices.items()}
+    return list(sims.values()), {key: sim.port for key, sim in sims.items()}
+
+
+def _load_serial_config() -> dict:
+    with open(os.path.join(CONFIG_DIR, 'serialConfig.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_serial_config(path: str, ports: Dict[str, str]):
+    """将 serialConfig.json 中模拟设备的串口号替换为pty路径后另存"""
+    cfg = _load_serial_config()
+    for device in cfg.get('devices', []):
+        if device.get('key') in ports:
+            device['port'] = ports[device['key']]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(cfg, f, ensure_ascii=False, indent=2)
+
+
+# 基准测试使用的指令 (device, cmd, params)
+BENCH_COMMANDS = [
+    ('light_source', 'set_indicator_laser_power', {'power': 100}),
+    ('light_source', 'set_blackbody_temperature', {'temperature': 35000}),
+    ('three_axis_motor', 'set_horizontal_axis_pos', {'pos': 1000}),
+    ('delay_module', 'delay_time_add_4ns', {}),
+]
+
+
+def run_bench(ports: Dict[str, str], count: int) -> List[dict]:
+    """通过 CommandService 逐条发送指令，统计往返延迟（日志写入临时数据库）"""
+    from core.databaseService import db_service
+    from core.serialService import SerialService
+    from core.commandService import CommandService
+
+    # 数据库在首次访问时才初始化，在此之前换成临时数据库，项目中的 data/test_records.db 不会被打开
+    tmp_dir = tempfile.mkdtemp(prefix='serial_bench_')
+    saved_db_path = db_service.db_path
+    db_service.db_path = os.path.join(tmp_dir, 'bench.db')
+
+    configs = _load_serial_config().get('configs', {})
+    serial = SerialService()
+    for key, port in ports.items():
+        cfg = configs.get(key, {})
+        ok, msg = serial.connect(key, port, cfg.get('baudrate', 9600), cfg.get('dataBits', 8),
+                                 cfg.get('stopBits', 1), cfg.get('parity', 'None'))
+        if not ok:
+            raise RuntimeError(f"{key}: {msg}")
+    commands = CommandService(serial=serial)
+
+    results = []
+    try:
+        for device, cmd, params in BENCH_COMMANDS:
+            latencies = []
+            failures = 0
+            start = time.perf_counter()
+            for _ in range(count):
+                t = time.perf_counter()
+                success, message, _, _ = commands.send(device, cmd, params, wait_response=True)
+                latencies.append((time.perf_counter() - t) * 1000.0)
+                if not success:
+                    failures += 1
+            elapsed = time.perf_counter() - start
+            latencies.sort()
+            results.append({
+                'device': device,
+                'cmd': cmd,
+                'count': count,
+                'failures': failures,
+                'p50_ms': round(statistics.median(latencies), 3),
+                'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1], 3),
+                'max_ms': round(latencies[-1], 3),
+                'per_second': round(count / elapsed, 1),
+            })
+    finally:
+        serial.disconnect_all()
+        db_service.flush_serial_logs()
+        db_service.close()
+        db_service.db_path = saved_db_path
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return results
+
+
+def main(argv=None) -> int:
+    if not sys.platform.startswith('linux'):
+        print("串口模拟器依赖Linux伪终端(pty)")
+        return 1
+
+    parser = argparse.ArgumentParser(description='串口设备模拟器')
+    parser.add_argument('--shared', action='store_true', help='光源/三轴电机/延时模块共用一个pty')
+    parser.add_argument('--light-delay-ms', type=float, default=5.0, help='光源应答延迟')
+    parser.add_argument('--motor-delay-ms', type=float, default=2.0, help='三轴电机应答延迟')
+    parser.add_argument('--delay-module-delay-ms', type=float, default=1.0, help='延时模块应答延迟')
+    parser.add_argument('--motor-speed', type=float, default=20000.0, help='电机速度(步/秒)')
+    parser.add_argument('--blackbody-tau', type=float, default=30.0, help='黑体温度时间常数(秒)')
+    parser.add_argument('--write-config', help='另存指向pty的 serialConfig.json')
+    parser.add_argument('--bench', type=int, metavar='N', help='每条指令发送N次并统计延迟后退出')
+    args = parser.parse_args(argv)
+
+    sims, ports = create_simulators(
+        shared=args.shared,
+        light_delay=args.light_delay_ms / 1000.0,
+        motor_delay=args.motor_delay_ms / 1000.0,
+        delay_module_delay=args.delay_module_delay_ms / 1000.0,
+        motor_speed=args.motor_speed,
+        blackbody_tau=args.blackbody_tau,
+    )
+    for key, port in ports.items():
+        print(f"{key:<18} {port}")
+
+    try:
+        if args.write_config:
+            write_serial_config(args.write_config, ports)
+            print(f"配置已保存: {args.write_config}")
+
+        if args.bench:
+            for r in run_bench(ports, args.bench):
+                print(f"{r['device']:<18}{r['cmd']:<28} n={r['count']:<6} fail={r['failures']:<4} "
+                      f"p50={r['p50_ms']:>7.3f}ms p95={r['p95_ms']:>7.3f}ms max={r['max_ms']:>7.3f}ms "
+                      f"{r['per_second']:>8.1f}/s")
+            return 0
+
+        print("模拟器运行中，Ctrl+C 退出")
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for sim in sims:
+            sim.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())